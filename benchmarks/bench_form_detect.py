@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк потокового распознавания формы входа (form_detector).
+
+Имитатор HTTP-прокси в отдельном процессе отдаёт большую страницу
+(--page-kb) фрагментами с паузой (--delay), как медленный прокси. Форма
+входа - в начале страницы. Сравнивается прежняя схема (response.text()
+целиком, затем поиск каждого признака) и VatsProber с FormDetector:
+время одной проверки и прочитанные байты тела.
+
+Запуск: python benchmarks/bench_form_detect.py --probes 200 --page-kb 512
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from form_detector import DIAGNOSTIC_MARKERS, LOGIN_INDICATORS  # noqa: E402
+from metrics import RunMetrics  # noqa: E402
+from output import QUIET, output  # noqa: E402
+from vats_prober import VatsProber  # noqa: E402
+
+HEAD = "<html><head><meta charset='windows-1251'></head><body><h1>Личный кабинет</h1>" \
+       "<form><input name='login'><input type='password'></form>"
+CHUNK = 16 * 1024
+
+
+def _standin_process(page_kb, delay, conn):
+    async def handler(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/html; charset=windows-1251"})
+        await response.prepare(request)
+        body = HEAD.encode("cp1251") + b"<p>" + b"x" * (page_kb * 1024) + b"</p></body></html>"
+        try:
+            for i in range(0, len(body), CHUNK):
+                await response.write(body[i:i + CHUNK])
+                await asyncio.sleep(delay)
+        except ConnectionError:
+            # Клиент закрыл соединение, получив ответ
+            return response
+        await response.write_eof()
+        return response
+
+    async def serve():
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        conn.send(f"127.0.0.1:{site._server.sockets[0].getsockname()[1]}")
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        await runner.cleanup()
+
+    asyncio.run(serve())
+
+
+async def probe_full_body(session, proxy):
+    """Прежняя проверка: всё тело целиком, затем поиск каждого признака."""
+    started = time.perf_counter()
+    async with session.get("http://vats.invalid/", proxy=f"http://{proxy}") as response:
+        raw = await response.read()
+        html_content = raw.decode(response.get_encoding(), errors="replace").lower()
+    found = not any(marker in html_content for marker in DIAGNOSTIC_MARKERS) and \
+        any(indicator.lower() in html_content for indicator in LOGIN_INDICATORS)
+    return found, time.perf_counter() - started, len(raw)
+
+
+async def run(args):
+    output.configure(QUIET)
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_standin_process, args=(args.page_kb, args.delay, child_conn),
+                                     daemon=True)
+    server.start()
+    proxy = parent_conn.recv()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60)) as session:
+            async def full(_):
+                async with semaphore:
+                    return await probe_full_body(session, proxy)
+            results = await asyncio.gather(*(full(i) for i in range(args.probes)))
+        report("full body", results)
+
+        metrics = RunMetrics()
+        async with VatsProber(url="http://vats.invalid/", limit=args.concurrency, timeout=60,
+                              metrics=metrics) as prober:
+            async def streaming(_):
+                async with semaphore:
+                    started = time.perf_counter()
+                    found = await prober.probe(proxy)
+                    return bool(found), time.perf_counter() - started, 0
+            results = await asyncio.gather(*(streaming(i) for i in range(args.probes)))
+        received = metrics.probe_body["bytes"]
+        report("FormDetector", [(ok, elapsed, received / len(results)) for ok, elapsed, _ in results])
+    finally:
+        parent_conn.send("stop")
+        server.join(timeout=5)
+
+
+def report(name, results):
+    latencies = sorted(elapsed for _, elapsed, _ in results)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    ok = sum(1 for found, _, _ in results if found)
+    received = statistics.mean(size for _, _, size in results)
+    print(f"{name:>13}: p50 {statistics.median(latencies) * 1000:7.1f} мс, p95 {p95 * 1000:7.1f} мс, "
+          f"тело {received / 1024:7.1f} КБ на проверку, форма найдена {ok}/{len(results)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк потокового распознавания формы входа")
+    parser.add_argument("--probes", type=int, default=200, help="Количество проверок")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных проверок")
+    parser.add_argument("--page-kb", type=int, default=512, help="Размер страницы, КБ")
+    parser.add_argument("--delay", type=float, default=0.01, help="Пауза между фрагментами по 16 КБ, с")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк геолокации на локальном имитаторе ipinfo.io / ip-api.com.
+
+Сравнивает исходную схему (один запрос на IP, все сразу через asyncio.gather)
+с GeoScheduler (ограничение параллельности, пакеты ip-api.com/batch, повторы).
+Имитатор отвечает 429, если одновременно обрабатывается больше запросов,
+чем допускает его лимит, как это делают настоящие сервисы.
+
+Запуск: python benchmarks/bench_geo.py --ips 5000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from geo_scheduler import GeoScheduler  # noqa: E402
+
+
+def fake_country(ip):
+    return "RU" if int(ip.rsplit(".", 1)[1]) % 3 == 0 else "DE"
+
+
+class MockGeoServer:
+    def __init__(self, latency=0.02, max_in_flight=50):
+        self.latency = latency
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+
+    async def _enter(self):
+        self.requests += 1
+        self.in_flight += 1
+        if self.in_flight > self.max_in_flight:
+            self.throttled += 1
+            return False
+        await asyncio.sleep(self.latency)
+        return True
+
+    async def ipinfo(self, request):
+        try:
+            if not await self._enter():
+                return web.Response(status=429)
+            ip = request.match_info["ip"]
+            return web.json_response({"ip": ip, "country": fake_country(ip)})
+        finally:
+            self.in_flight -= 1
+
+    async def ipapi_single(self, request):
+        try:
+            if not await self._enter():
+                return web.Response(status=429)
+            ip = request.match_info["ip"]
+            return web.json_response({"status": "success", "countryCode": fake_country(ip), "query": ip})
+        finally:
+            self.in_flight -= 1
+
+    async def ipapi_batch(self, request):
+        try:
+            if not await self._enter():
+                return web.Response(status=429)
+            ips = await request.json()
+            return web.json_response([
+                {"status": "success", "countryCode": fake_country(ip), "query": ip} for ip in ips[:100]
+            ])
+        finally:
+            self.in_flight -= 1
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/{ip}/json", self.ipinfo)
+        app.router.add_get("/json/{ip}", self.ipapi_single)
+        app.router.add_post("/batch", self.ipapi_batch)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{self.port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+async def naive(base_url, ips):
+    """Исходная схема check_proxy_country: запрос на IP, запасной сервис, без ограничений."""
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        async def one(ip):
+            for url, key in ((f"{base_url}/{ip}/json", "country"), (f"{base_url}/json/{ip}", "countryCode")):
+                try:
+                    async with session.get(url, timeout=5) as response:
+                        if response.status == 200:
+                            return (await response.json()).get(key)
+                except Exception:
+                    pass
+            return None
+        return await asyncio.gather(*(one(ip) for ip in ips))
+
+
+async def scheduled(base_url, ips, concurrency):
+    async with aiohttp.ClientSession() as session:
+        scheduler = GeoScheduler(session, concurrency=concurrency, ipapi_rate=None, ipinfo_rate=None,
+                                 backoff=0.05, ipapi_url=base_url, ipinfo_url=base_url)
+        result = await scheduler.resolve_many(ips)
+        await scheduler.close()
+        return list(result.values()), scheduler.stats
+
+
+async def run(args):
+    ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(args.ips)]
+
+    for name in ("naive", "scheduler"):
+        server = MockGeoServer(latency=args.latency, max_in_flight=args.server_limit)
+        base_url = await server.start()
+        started = time.perf_counter()
+        stats = None
+        if name == "naive":
+            countries = await naive(base_url, ips)
+        else:
+            countries, stats = await scheduled(base_url, ips, args.concurrency)
+        elapsed = time.perf_counter() - started
+        await server.stop()
+
+        resolved = sum(1 for c in countries if c)
+        print(f"{name:>10}: {elapsed:7.2f} с, определено {resolved}/{len(ips)}, "
+              f"{resolved / elapsed:9.0f} IP/с, запросов к серверу {server.requests}, 429: {server.throttled}")
+        if stats:
+            print(f"{'':>10}  статистика планировщика: {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк геолокации на локальном имитаторе")
+    parser.add_argument("--ips", type=int, default=5000, help="Количество IP-адресов")
+    parser.add_argument("--latency", type=float, default=0.02, help="Задержка ответа имитатора, с")
+    parser.add_argument("--server-limit", type=int, default=50, help="Лимит одновременных запросов имитатора")
+    parser.add_argument("--concurrency", type=int, default=20, help="Параллельность планировщика")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
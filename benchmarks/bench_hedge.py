@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк ProxyPool.fetch с подстраховкой и без неё.
+
+Имитатор в отдельном процессе изображает --ports HTTP-прокси с «тяжёлым
+хвостом»: обычно ответ приходит за ~--fast секунд, но с вероятностью
+--slow-rate прокси «задумывается» на --slow секунд. Сравниваются p50, p90
+и p99 времени вызова с одной попыткой (max_attempts=1) и с подстраховкой.
+
+С --protocol connect или socks5 имитатор изображает туннельные прокси:
+рукопожатие, затем соединение с тем же сайтом-имитатором. Тело ответа
+размером --body байт сверяется с полученным: неполное тело считается
+ошибкой вызова.
+
+Запуск: python benchmarks/bench_hedge.py --calls 500 --slow-rate 0.05
+        python benchmarks/bench_hedge.py --protocol socks5 --body 300000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from proxy_pool import ProxyPool  # noqa: E402
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(64 * 1024)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _tunnel(reader, writer, protocol, origin_port):
+    """Имитатор туннельного прокси: рукопожатие и соединение с сайтом-имитатором."""
+    try:
+        if protocol == "socks5":
+            await reader.readexactly(3)
+            writer.write(b"\x05\x00")
+            header = await reader.readexactly(4)
+            length = (await reader.readexactly(1))[0] if header[3] == 3 else {1: 4, 4: 16}[header[3]]
+            await reader.readexactly(length + 2)
+            writer.write(b"\x05\x00\x00\x01" + bytes(4) + struct.pack("!H", 0))
+        else:
+            await reader.readuntil(b"\r\n\r\n")
+            writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        origin_reader, origin_writer = await asyncio.open_connection("127.0.0.1", origin_port)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        writer.close()
+        return
+    try:
+        await asyncio.gather(_pipe(reader, origin_writer), _pipe(origin_reader, writer))
+    except asyncio.CancelledError:
+        # Имитатор останавливается с открытыми туннелями
+        pass
+
+
+def _standin_process(args, conn):
+    rng = random.Random(1)
+    body = b"x" * args.body
+
+    async def handler(request):
+        delay = args.slow if rng.random() < args.slow_rate else rng.expovariate(1 / args.fast)
+        await asyncio.sleep(delay)
+        return web.Response(body=body, content_type="text/html")
+
+    async def serve():
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        addresses = []
+        servers = []
+        if args.protocol == "http":
+            for _ in range(args.ports):
+                site = web.TCPSite(runner, "127.0.0.1", 0)
+                await site.start()
+                addresses.append(f"127.0.0.1:{site._server.sockets[0].getsockname()[1]}")
+        else:
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            origin_port = site._server.sockets[0].getsockname()[1]
+            for _ in range(args.ports):
+                server = await asyncio.start_server(
+                    lambda reader, writer: _tunnel(reader, writer, args.protocol, origin_port), "127.0.0.1", 0)
+                servers.append(server)
+                addresses.append(f"127.0.0.1:{server.sockets[0].getsockname()[1]}")
+        conn.send(addresses)
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        for server in servers:
+            server.close()
+        await runner.cleanup()
+
+    asyncio.run(serve())
+
+
+async def measure(proxies, args, max_attempts):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    protocols = dict.fromkeys(proxies, args.protocol)
+    truncated = 0
+    async with ProxyPool(proxies, protocols=protocols, timeout=args.slow * 2, max_attempts=max_attempts) as pool:
+        async def call(i):
+            nonlocal truncated
+            async with semaphore:
+                started = time.perf_counter()
+                result = await pool.fetch(f"http://vats.invalid/{i}")
+                if len(result.body) != args.body:
+                    truncated += 1
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = sorted(await asyncio.gather(*(call(i) for i in range(args.calls))))
+        elapsed = time.perf_counter() - started
+        summary = pool.summary()
+
+    def quantile(q):
+        return latencies[int(q * (len(latencies) - 1))] * 1000
+
+    print(f"попыток до {max_attempts}: p50 {quantile(0.5):7.1f} мс, p90 {quantile(0.9):7.1f} мс, "
+          f"p99 {quantile(0.99):7.1f} мс, всего {elapsed:5.2f} с, "
+          f"подстраховок {summary.get('hedged', 0)}/{args.calls}, выиграли {summary.get('hedge_won', 0)}, "
+          f"неполных ответов {truncated}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк запросов с подстраховкой через пул прокси")
+    parser.add_argument("--calls", type=int, default=500, help="Количество вызовов fetch")
+    parser.add_argument("--concurrency", type=int, default=20, help="Одновременных вызовов")
+    parser.add_argument("--ports", type=int, default=20, help="Прокси имитатора")
+    parser.add_argument("--fast", type=float, default=0.05, help="Среднее время обычного ответа, с")
+    parser.add_argument("--slow", type=float, default=2.0, help="Время медленного ответа, с")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Доля медленных ответов")
+    parser.add_argument("--protocol", choices=("http", "connect", "socks5"), default="http",
+                        help="Протокол прокси имитатора")
+    parser.add_argument("--body", type=int, default=16, help="Размер тела ответа, байт")
+    args = parser.parse_args()
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_standin_process, args=(args, child_conn), daemon=True)
+    server.start()
+    proxies = parent_conn.recv()
+    try:
+        for max_attempts in (1, 3):
+            asyncio.run(measure(proxies, args, max_attempts))
+    finally:
+        parent_conn.send("stop")
+        server.join(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк разбора HTML-страниц источников прокси.
+
+Для каждого HTML-источника сравнивается время разбора сохранённой страницы
+из benchmarks/fixtures: исходный способ (BeautifulSoup + html.parser и CSS-
+селекторы) и быстрый путь html_tables на регулярных выражениях. Результаты
+обоих способов сверяются.
+
+Страницы в fixtures повторяют разметку таблиц источников. Чтобы измерить
+разбор настоящих страниц, сохраните их под теми же именами (<источник>.html);
+--regenerate пересоздаёт синтетические страницы.
+
+Запуск: python benchmarks/bench_html_parse.py --repeat 20
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from html_tables import extract_proxies, find_ip_ports  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# источник -> (обёртка таблицы, число колонок, аргументы extract_proxies)
+SOURCES = {
+    "freeproxy_world": ('<table class="layui-table table-striped">', 8,
+                        dict(selector=".table-striped", country_col=6, countries=("Russia", "RU"))),
+    "proxy_list_ru": ('<table class="proxy-list-table">', 5, dict(selector=".proxy-list-table")),
+    "hidemy_name": ('<div class="table_block"><table>', 7, dict(selector=".table_block")),
+    "free_proxy_list": ('<div class="table-responsive" id="list"><table class="table table-striped">', 8,
+                        dict(selector="#list", country_col=2, countries=("RU",), min_columns=8)),
+    "proxyservers_ru": ('<table class="table proxy-list">', 6,
+                        dict(selector="table.proxy-list", ip_col=1, port_col=2)),
+    "2ip_ru": ('<div class="proxy__table"><table>', 5, dict(selector=".proxy__table")),
+    "proxy24_net_ru": ('<table class="table table-striped">', 6,
+                       dict(selector="table.table-striped", country_col=3, countries=("RU",))),
+    "proxy5_net": ('<table class="proxy-table">', 6, dict(selector="table.proxy-table")),
+    "fineproxy_org": ('<table class="proxy__list">', 6, dict(selector="table.proxy__list")),
+    "proxyfreeonly": ('<table class="proxy-table">', 6, dict(selector="table.proxy-table")),
+    "good_proxies_ru": ('<table class="proxy-list">', 6,
+                        dict(selector="table.proxy-list", country_col=2, countries=("RU", "Россия"))),
+    "iproyal_ru": ('<table class="proxies-table">', 6, dict(selector="table.proxies-table")),
+}
+
+_PAGE_HEAD = """<!DOCTYPE html>
+<html lang="ru"><head><meta charset="utf-8"><title>Бесплатные прокси</title>
+<link rel="stylesheet" href="/static/app.css"><script>window.dataLayer = window.dataLayer || [];</script>
+</head><body><header class="header"><nav class="menu">{nav}</nav></header><main class="content">
+<h1>Список прокси-серверов</h1><p class="lead">Обновлено {rows} прокси. Наш IP: 93.184.216.34</p>
+"""
+_PAGE_TAIL = """</main><footer class="footer">{nav}<p>&copy; 2024</p></footer>
+<script src="/static/app.js"></script></body></html>
+"""
+
+
+def _random_ip(rng):
+    return f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+
+
+def generate_page(name, rows=100, seed=0):
+    """Синтетическая страница с таблицей в разметке источника."""
+    opening, columns, options = SOURCES[name]
+    rng = random.Random(f"{name}-{seed}")
+    nav = "".join(f'<a href="/page/{i}" class="menu__item">Раздел {i}</a>' for i in range(30))
+    ip_col, port_col = options.get("ip_col", 0), options.get("port_col", 1)
+    country_col = options.get("country_col")
+
+    lines = [_PAGE_HEAD.format(nav=nav, rows=rows), opening]
+    lines.append("<thead><tr>" + "".join(f"<th>Колонка {i}</th>" for i in range(columns)) + "</tr></thead><tbody>")
+    for _ in range(rows):
+        cells = []
+        for col in range(columns):
+            if col == ip_col:
+                cells.append(f"<td>{_random_ip(rng)}</td>")
+            elif col == port_col:
+                cells.append(f'<td><span class="port">{rng.choice([80, 3128, 8080, 8888, 1080])}</span></td>')
+            elif col == country_col:
+                country = rng.choice(["RU", "RU", "Russia", "Россия", "DE", "US"])
+                cells.append(f'<td class="country"><img src="/flags/{country}.png" alt=""> {country}</td>')
+            else:
+                value = rng.choice(["HTTP", "HTTPS", "Высокая", "Анонимный", f"{rng.randint(1, 99)} мин."])
+                cells.append(f'<td class="col-{col}"><div class="bar" style="width:{rng.randint(1, 100)}%">'
+                             f'{value}</div></td>')
+        lines.append("<tr>" + "".join(cells) + "</tr>")
+    lines.append("</tbody></table>" + ("</div>" if opening.startswith("<div") else ""))
+    lines.append(_PAGE_TAIL.format(nav=nav))
+    return "\n".join(lines)
+
+
+def generate_proxy_list_org(rows=100, seed=0):
+    rng = random.Random(f"proxy_list_org-{seed}")
+    items = "".join(
+        f'<ul><li class="proxy">{_random_ip(rng)}:{rng.choice([80, 3128, 8080])}</li>'
+        f'<li class="type">HTTP</li><li class="country-city">Russia</li></ul>'
+        for _ in range(rows)
+    )
+    nav = "".join(f'<a href="/page/{i}">Раздел {i}</a>' for i in range(30))
+    return _PAGE_HEAD.format(nav=nav, rows=rows) + f'<div class="table">{items}</div>' + _PAGE_TAIL.format(nav=nav)
+
+
+def legacy_parse(name, text):
+    """Исходный разбор: дерево BeautifulSoup и CSS-селекторы."""
+    if name == "proxy_list_org":
+        soup = BeautifulSoup(text, "html.parser")
+        proxies = []
+        for block in soup.select(".table ul li"):
+            match = re.search(r"(\d+\.\d+\.\d+\.\d+):(\d+)", block.text.strip())
+            if match:
+                proxies.append("%s:%s" % match.groups())
+        return proxies
+    return extract_proxies(text, parser="tree", **SOURCES[name][2])
+
+
+def fast_parse(name, text):
+    if name == "proxy_list_org":
+        return find_ip_ports(text, ".table")
+    return extract_proxies(text, **SOURCES[name][2])
+
+
+def load_fixtures(rows=100, regenerate=False):
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    fixtures = {}
+    for name in list(SOURCES) + ["proxy_list_org"]:
+        path = os.path.join(FIXTURES_DIR, f"{name}.html")
+        if regenerate or not os.path.exists(path):
+            page = generate_proxy_list_org(rows) if name == "proxy_list_org" else generate_page(name, rows)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(page)
+        with open(path, encoding="utf-8") as f:
+            fixtures[name] = f.read()
+    return fixtures
+
+
+def measure(func, name, text, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(name, text)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора HTML-страниц источников")
+    parser.add_argument("--rows", type=int, default=100, help="Строк в синтетических страницах")
+    parser.add_argument("--repeat", type=int, default=10, help="Повторов разбора (берётся лучшее время)")
+    parser.add_argument("--regenerate", action="store_true", help="Пересоздать синтетические страницы")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.rows, args.regenerate)
+    print(f"{'источник':<18}{'КБ':>7}{'прокси':>8}{'bs4, мс':>10}{'быстрый, мс':>13}{'ускорение':>11}")
+    total_legacy = total_fast = 0.0
+    for name, text in fixtures.items():
+        legacy_time, legacy_result = measure(legacy_parse, name, text, args.repeat)
+        fast_time, fast_result = measure(fast_parse, name, text, args.repeat)
+        total_legacy += legacy_time
+        total_fast += fast_time
+        mark = "" if legacy_result == fast_result else "  (результаты различаются!)"
+        print(f"{name:<18}{len(text) / 1024:>7.0f}{len(fast_result):>8}{legacy_time * 1000:>10.2f}"
+              f"{fast_time * 1000:>13.2f}{legacy_time / fast_time:>10.1f}x{mark}")
+    print(f"{'всего':<33}{total_legacy * 1000:>10.2f}{total_fast * 1000:>13.2f}{total_legacy / total_fast:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Воспроизводимый офлайн-бенчмарк RussianProxyFinder на локальных имитаторах.
+
+Отдельный процесс поднимает «мир» без выхода в интернет:
+- все источники реестра sources.SOURCES - ответы в формате каждого
+  источника (текст, JSON с постраничной выдачей, HTML-таблицы);
+- имитатор ip-api.com / ipinfo.io (bench_geo.MockGeoServer);
+- тысячи «прокси» на адресах 127.x.y.z: рабочие отвечают страницей входа
+  VATS с заданной задержкой, часть обрывает соединение (drop), часть
+  принимает его и молчит (blackhole), часть отдаёт страницу без формы
+  входа, а часть адресов не слушается вовсе (dead).
+
+Поведение каждого прокси и страна его IP определяются хэшем адреса, поэтому
+при одних параметрах прогоны сравнимы между коммитами. Замеряются фазы по
+отдельности (сбор, геолокация, проверка VATS), весь цикл и потоковый режим:
+пропускная способность, время до первого рабочего прокси, p50/p99
+задержек, пиковые RSS и число открытых дескрипторов. Результат сохраняется
+в JSON; --compare печатает изменения относительно прошлого прогона.
+
+Запуск: python benchmarks/bench_offline.py --candidates 5000
+        python benchmarks/bench_offline.py --compare data/bench_offline-<коммит>.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter
+from dataclasses import replace
+
+from aiohttp import web
+from yarl import URL
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import use_proxy_api  # noqa: E402
+from bench_geo import MockGeoServer, fake_country  # noqa: E402
+from bench_vats_probe import LOGIN_PAGE  # noqa: E402
+from finder_config import DATA_DIR, FinderConfig, Timeouts  # noqa: E402
+from geo_scheduler import GeoScheduler  # noqa: E402
+from output import QUIET, output  # noqa: E402
+from sources import SOURCES  # noqa: E402
+from tcp_prefilter import _open_fds  # noqa: E402
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NO_FORM_PAGE = "<html><body><h1>It works!</h1></body></html>"
+# Прокси на страницу источника без page_size (htmlweb)
+PAGE_SIZE = 100
+# Показатели, которые сравниваются с прошлым прогоном
+COMPARED = ("elapsed", "throughput", "ttfr", "source_p50", "source_p99", "probe_p50", "probe_p99",
+            "peak_rss_mb", "peak_fds", "working")
+
+
+# --- Детерминированный «мир» ---
+
+def _fraction(text):
+    """Число из [0, 1), одинаковое для одного адреса в любом процессе."""
+    return zlib.crc32(text.encode()) / 2 ** 32
+
+
+def behavior(proxy, args):
+    """ok, no_form, drop или blackhole."""
+    u = _fraction(proxy)
+    for kind, share in (("blackhole", args.blackhole), ("drop", args.drop), ("no_form", args.no_form)):
+        if u < share:
+            return kind
+        u -= share
+    return "ok"
+
+
+def proxy_latency(proxy, args):
+    """Задержка ответа прокси: экспоненциальное распределение по прокси со средним args.latency."""
+    return min(-args.latency * math.log(1 - _fraction(proxy[::-1])), args.latency * 10)
+
+
+def make_candidates(args, ports, dead_port):
+    candidates = []
+    for i in range(args.candidates):
+        ip = f"127.{i // (254 * 256) % 256}.{i // 254 % 256}.{i % 254 + 1}"
+        dead = _fraction(f"dead:{ip}") < args.dead
+        candidates.append(f"{ip}:{dead_port if dead else ports[i % len(ports)]}")
+    return candidates
+
+
+def source_lists(candidates, args):
+    """Прокси каждого источника; доля args.duplicates попадает и в соседний источник."""
+    lists = {source.name: [] for source in SOURCES}
+    for i, proxy in enumerate(candidates):
+        lists[SOURCES[i % len(SOURCES)].name].append(proxy)
+        if _fraction(f"dup:{proxy}") < args.duplicates:
+            lists[SOURCES[(i + 1) % len(SOURCES)].name].append(proxy)
+    return lists
+
+
+def served(source, proxies):
+    """Прокси, которые загрузчик получит от источника (постраничные - не больше max_pages страниц)."""
+    if source.format == "json" and source.page_param:
+        return proxies[:source.max_pages * (source.page_size or PAGE_SIZE)]
+    return proxies
+
+
+def render(source, proxies, page=1):
+    """Ответ источника в его формате: (тело, тип содержимого)."""
+    if source.format == "text":
+        return "\n".join(proxies), "text/plain"
+    if source.format == "json":
+        if source.page_param:
+            size = source.page_size or PAGE_SIZE
+            proxies_page = proxies[(page - 1) * size:page * size] if page <= source.max_pages else []
+        else:
+            proxies_page = proxies
+        items = []
+        for proxy in proxies_page:
+            ip, port = proxy.split(":")
+            items.append({source.ip_key: ip, source.port_key: port})
+        data = items
+        if source.items:
+            data = {source.items: items}
+            if source.total_key:
+                data[source.total_key] = len(proxies)
+        return json.dumps(data), "application/json"
+
+    tag, kind, name = re.match(r"^(\w*)([.#])([\w-]+)$", source.selector).groups()
+    attribute = f'{"class" if kind == "." else "id"}="{name}"'
+    rows = []
+    if source.format == "ip_ports":
+        rows = [f"<tr><td>{proxy}</td><td>HTTP</td></tr>" for proxy in proxies]
+    else:
+        columns = max(source.min_columns, source.ip_col + 1, source.port_col + 1, (source.country_col or 0) + 1)
+        for proxy in proxies:
+            cells = ["-"] * columns
+            cells[source.ip_col], cells[source.port_col] = proxy.split(":")
+            if source.country_col is not None:
+                cells[source.country_col] = source.countries[0]
+            rows.append("<tr>" + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>")
+    table = "<tr><th>IP</th><th>Port</th></tr>" + "\n".join(rows)
+    if tag in ("", "table"):
+        body = f"<table {attribute}>{table}</table>"
+    else:
+        body = f"<{tag} {attribute}><table>{table}</table></{tag}>"
+    return f"<html><head><meta charset='utf-8'></head><body>{body}</body></html>", "text/html"
+
+
+def expected_working(candidates, lists, dead_port, args):
+    """Сколько рабочих прокси должен найти полный цикл."""
+    declared = set()
+    listed = set()
+    for source in SOURCES:
+        proxies = served(source, lists[source.name])
+        listed.update(proxies)
+        if source.russian:
+            declared.update(proxies)
+    return sum(1 for proxy in candidates
+               if proxy in listed and not proxy.endswith(f":{dead_port}")
+               and (proxy in declared or fake_country(proxy.split(":")[0]) == "RU")
+               and behavior(proxy, args) == "ok")
+
+
+def _free_port():
+    """Порт, который никто не слушает (адреса dead)."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _raise_nofile():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def _handle_proxy(reader, writer, args):
+    """Имитатор HTTP-прокси: поведение определяется адресом, на который пришло соединение."""
+    ip, port = writer.get_extra_info("sockname")[:2]
+    proxy = f"{ip}:{port}"
+    kind = behavior(proxy, args)
+    try:
+        if kind == "drop":
+            return
+        first = await reader.readexactly(1)
+        if first in (b"\x04", b"\x05"):
+            # SOCKS-рукопожатие: прокси его не понимает
+            return
+        head = first + await reader.readuntil(b"\r\n\r\n")
+        if kind == "blackhole":
+            await reader.read()
+            return
+        method = head.split(b" ", 1)[0]
+        if method == b"CONNECT":
+            writer.write(b"HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            return
+        await asyncio.sleep(proxy_latency(proxy, args))
+        body = (LOGIN_PAGE if kind == "ok" else NO_FORM_PAGE).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n"
+                     b"Content-Length: %d\r\nConnection: close\r\n\r\n" % len(body))
+        if method != b"HEAD":
+            writer.write(body)
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def _world_process(args, conn):
+    """Процесс с имитаторами источников, геолокации и прокси."""
+    _raise_nofile()
+
+    async def serve():
+        geo = MockGeoServer(latency=args.geo_latency, max_in_flight=args.geo_limit)
+        geo_base = await geo.start()
+        proxy_servers = []
+        ports = []
+        for _ in range(args.ports):
+            server = await asyncio.start_server(lambda r, w: _handle_proxy(r, w, args), "0.0.0.0", 0, backlog=4096)
+            proxy_servers.append(server)
+            ports.append(server.sockets[0].getsockname()[1])
+        dead_port = _free_port()
+        lists = source_lists(make_candidates(args, ports, dead_port), args)
+        registry = {source.name: source for source in SOURCES}
+
+        async def source_handler(request):
+            source = registry[request.match_info["name"]]
+            await asyncio.sleep(args.source_latency)
+            page = int(request.query.get(source.page_param, 1)) if source.page_param else 1
+            body, content_type = render(source, lists[source.name], page)
+            return web.Response(text=body, content_type=content_type)
+
+        async def vats_handler(request):
+            return web.Response(text=LOGIN_PAGE, content_type="text/html")
+
+        app = web.Application()
+        app.router.add_get("/src/{name}", source_handler)
+        app.router.add_get("/vats/", vats_handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        conn.send({"sources": f"{base}/src", "vats": f"{base}/vats/", "geo": geo_base,
+                   "ports": ports, "dead_port": dead_port})
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        for server in proxy_servers:
+            server.close()
+        await runner.cleanup()
+        await geo.stop()
+
+    asyncio.run(serve())
+
+
+# --- Замеры ---
+
+def _rss():
+    """Текущий RSS процесса в байтах."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def quantile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[int(q * (len(ordered) - 1))], 4)
+
+
+class ResourceSampler:
+    """Время фазы, пиковые RSS и число открытых дескрипторов (опрос каждые interval секунд)."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_fds = 0
+
+    def _sample(self):
+        self.peak_rss = max(self.peak_rss, _rss())
+        self.peak_fds = max(self.peak_fds, _open_fds())
+
+    async def _run(self):
+        while True:
+            self._sample()
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        self.started = time.perf_counter()
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._sample()
+        self.elapsed = time.perf_counter() - self.started
+
+    def report(self, **fields):
+        return {"elapsed": round(self.elapsed, 4), **fields,
+                "peak_rss_mb": round(self.peak_rss / 2 ** 20, 1), "peak_fds": self.peak_fds}
+
+
+class EventCollector:
+    """Приёмник событий output: время проверок и момент первого рабочего прокси."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.first_working = None
+        self.probe_times = []
+        self.outcomes = Counter()
+
+    def emit(self, event):
+        kind = event["event"]
+        if kind == "probe":
+            self.outcomes[event["outcome"]] += 1
+            if event.get("elapsed") is not None:
+                self.probe_times.append(event["elapsed"])
+        elif kind == "working" and self.first_working is None:
+            self.first_working = time.perf_counter() - self.started
+
+
+async def make_finder(world, args):
+    config = FinderConfig(use_store=False, use_geo_cache=False, use_source_cache=False, metrics_json="",
+                          vats_url=world["vats"], probe_concurrency=args.concurrency,
+                          probe_timeout=Timeouts(total=args.probe_timeout, connect=min(3, args.probe_timeout),
+                                                 read=args.probe_timeout),
+                          prefilter_limit=args.prefilter_limit, adaptive_probe=not args.fixed_concurrency)
+    finder = use_proxy_api.RussianProxyFinder(config)
+    finder.source_registry = [
+        replace(source, url=str(URL(f"{world['sources']}/{source.name}").with_query(URL(source.url).query)))
+        for source in finder.source_registry
+    ]
+    await finder.initialize()
+    # Лимиты частоты настоящих сервисов здесь только мешали бы замеру кода
+    await finder.geo_scheduler.close()
+    finder.geo_scheduler = GeoScheduler(finder.session, concurrency=config.geo_concurrency, ipapi_rate=None,
+                                        ipinfo_rate=None, backoff=0.05, timeout=config.geo_timeout.client_timeout(),
+                                        ipapi_url=world["geo"], ipinfo_url=world["geo"])
+    return finder
+
+
+async def run_phases(world, args, events):
+    """Сбор, геолокация и проверка VATS по отдельности и весь цикл целиком."""
+    finder = await make_finder(world, args)
+    phases = {}
+    try:
+        async with ResourceSampler() as sampler:
+            await finder.get_proxies_from_api()
+        latencies = [stats["fetch_latency"] for stats in finder.metrics.report()["sources"].values()]
+        phases["scrape"] = sampler.report(
+            sources=len(latencies), failed=finder.source_fetcher.stats["failed"], candidates=len(finder.pool),
+            throughput=round(len(finder.pool) / sampler.elapsed, 1),
+            source_p50=quantile(latencies, 0.5), source_p99=quantile(latencies, 0.99))
+
+        ips = len({proxy.split(":")[0] for proxy in finder.pool.unverified()})
+        async with ResourceSampler() as sampler:
+            await finder.verify_russian_proxies()
+        phases["geolocate"] = sampler.report(ips=ips, russian=len(finder.russian_proxies),
+                                             throughput=round(ips / sampler.elapsed, 1),
+                                             geo_requests=finder.geo_scheduler.stats["requests"])
+
+        candidates = len(finder.russian_proxies)
+        events.reset()
+        async with ResourceSampler() as sampler:
+            working = await finder.check_vats_access()
+        phases["probe"] = sampler.report(
+            candidates=candidates, working=len(working), throughput=round(candidates / sampler.elapsed, 1),
+            ttfr=round(events.first_working, 4) if events.first_working is not None else None,
+            probe_p50=quantile(events.probe_times, 0.5), probe_p99=quantile(events.probe_times, 0.99),
+            outcomes=dict(events.outcomes))
+    finally:
+        await finder.close()
+
+    elapsed = sum(phase["elapsed"] for phase in phases.values())
+    probe = phases.get("probe", {})
+    phases["end_to_end"] = {
+        "elapsed": round(elapsed, 4),
+        "working": probe.get("working"),
+        "throughput": round(phases["scrape"]["candidates"] / elapsed, 1),
+        "ttfr": round(elapsed - probe["elapsed"] + probe["ttfr"], 4) if probe.get("ttfr") is not None else None,
+        "peak_rss_mb": max(phase["peak_rss_mb"] for phase in phases.values()),
+        "peak_fds": max(phase["peak_fds"] for phase in phases.values()),
+    }
+    return phases
+
+
+async def run_stream(world, args, events):
+    """Потоковый режим: все фазы одновременно."""
+    finder = await make_finder(world, args)
+    working = 0
+    events.reset()
+    try:
+        async with ResourceSampler() as sampler:
+            async for _ in finder.stream_working_proxies():
+                working += 1
+    finally:
+        await finder.close()
+    return sampler.report(
+        working=working, candidates=len(finder.pool), throughput=round(len(finder.pool) / sampler.elapsed, 1),
+        ttfr=round(events.first_working, 4) if events.first_working is not None else None,
+        probe_p50=quantile(events.probe_times, 0.5), probe_p99=quantile(events.probe_times, 0.99))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(result, previous=None):
+    for name, phase in result["phases"].items():
+        fields = []
+        for key in COMPARED:
+            value = phase.get(key)
+            if value is None:
+                continue
+            text = f"{key}={value}"
+            old = ((previous or {}).get("phases", {}).get(name) or {}).get(key)
+            if isinstance(old, (int, float)) and old:
+                text += f" ({(value - old) / old:+.0%})"
+            fields.append(text)
+        print(f"{name:>11}: " + "  ".join(fields))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк RussianProxyFinder на локальных имитаторах")
+    parser.add_argument("--candidates", type=int, default=5000, help="Прокси во всех источниках")
+    parser.add_argument("--ports", type=int, default=50, help="Портов имитатора прокси")
+    parser.add_argument("--latency", type=float, default=0.05, help="Средняя задержка рабочего прокси, с")
+    parser.add_argument("--dead", type=float, default=0.3, help="Доля адресов, которые никто не слушает")
+    parser.add_argument("--drop", type=float, default=0.1, help="Доля прокси, обрывающих соединение")
+    parser.add_argument("--blackhole", type=float, default=0.02, help="Доля прокси, не отвечающих вовсе")
+    parser.add_argument("--no-form", type=float, default=0.1, help="Доля прокси со страницей без формы входа")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="Доля прокси, повторяющихся в двух источниках")
+    parser.add_argument("--source-latency", type=float, default=0.1, help="Задержка ответа источника, с")
+    parser.add_argument("--geo-latency", type=float, default=0.02, help="Задержка ответа имитатора геолокации, с")
+    parser.add_argument("--geo-limit", type=int, default=50, help="Одновременных запросов к геолокации до 429")
+    parser.add_argument("--concurrency", type=int, default=100,
+                        help="Одновременных проверок VATS (начальное число без --fixed-concurrency)")
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="Фиксированные число проверок и таймаут вместо probe_controller")
+    parser.add_argument("--probe-timeout", type=float, default=5, help="Таймаут проверки VATS, с")
+    parser.add_argument("--prefilter-limit", type=int, default=500, help="Одновременных проверок TCP-соединения")
+    parser.add_argument("--no-stream", action="store_true", help="Не замерять потоковый режим")
+    parser.add_argument("--out", help="Файл результата (по умолчанию data/bench_offline-<коммит>.json)")
+    parser.add_argument("--compare", metavar="PATH", help="Сравнить с результатом прошлого прогона")
+    args = parser.parse_args()
+
+    _raise_nofile()
+    output.configure(QUIET, events := EventCollector())
+    # Файлы результатов проверки не должны попадать в data/ проекта
+    use_proxy_api.DATA_DIR = tempfile.mkdtemp()
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    world_process = multiprocessing.Process(target=_world_process, args=(args, child_conn), daemon=True)
+    world_process.start()
+    world = parent_conn.recv()
+    candidates = make_candidates(args, world["ports"], world["dead_port"])
+    expected = expected_working(candidates, source_lists(candidates, args), world["dead_port"], args)
+    try:
+        phases = asyncio.run(run_phases(world, args, events))
+        if not args.no_stream:
+            phases["stream"] = asyncio.run(run_stream(world, args, events))
+    finally:
+        parent_conn.send("stop")
+        world_process.join(timeout=5)
+
+    commit = git_commit()
+    params = {key: value for key, value in vars(args).items() if key not in ("out", "compare")}
+    result = {"commit": commit, "created": round(time.time()), "python": platform.python_version(),
+              "cpus": os.cpu_count(), "params": params, "expected_working": expected, "phases": phases}
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous.get("params") != params:
+            print("[!] Параметры прогонов различаются - сравнение приблизительное")
+    print(f"Коммит {commit or '?'}, кандидатов {args.candidates}, ожидается рабочих {expected}")
+    print_report(result, previous)
+
+    path = args.out or os.path.join(DATA_DIR, f"bench_offline-{commit or 'local'}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"Результат сохранён в {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк предварительной проверки TCP-соединения перед проверкой VATS.
+
+Список кандидатов похож на типичный бесплатный список: малая часть прокси
+рабочие (локальный имитатор из bench_vats_probe), часть адресов отвечает
+отказом в соединении, а большинство «молчит» - соединение не устанавливается
+до таймаута (слушающий сокет с заполненной очередью). Сравнивается время
+check_vats_access без предварительной проверки и с ней.
+
+Запуск: python benchmarks/bench_prefilter.py --candidates 300 --alive 0.1
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import use_proxy_api  # noqa: E402
+from bench_vats_probe import _standin_process  # noqa: E402
+from finder_config import FinderConfig, Timeouts  # noqa: E402
+from output import QUIET, output  # noqa: E402
+
+
+def blackhole():
+    """Слушающий сокет, очередь которого заполнена: новые соединения не устанавливаются."""
+    server = socket.socket()
+    server.bind(("0.0.0.0", 0))
+    server.listen(0)
+    port = server.getsockname()[1]
+    fillers = []
+    for _ in range(4):
+        client = socket.socket()
+        client.setblocking(False)
+        try:
+            client.connect(("127.0.0.1", port))
+        except BlockingIOError:
+            pass
+        fillers.append(client)
+    time.sleep(0.2)
+    return port, [server, *fillers]
+
+
+def closed_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def build_candidates(args, alive):
+    rng = random.Random(0)
+    silent_port, keep = blackhole()
+    refused_port = closed_port()
+    candidates = list(alive)
+    while len(candidates) < args.candidates:
+        # Разные адреса 127.x.y.z, чтобы пул кандидатов не схлопнул их в один
+        host = f"127.{rng.randint(1, 254)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        port = refused_port if rng.random() < args.refused else silent_port
+        candidates.append(f"{host}:{port}")
+    rng.shuffle(candidates)
+    return candidates, keep
+
+
+async def measure(candidates, prefilter, args):
+    config = FinderConfig(use_store=False, use_geo_cache=False, use_source_cache=False, metrics_json="",
+                          probe_concurrency=args.concurrency, prefilter=prefilter,
+                          probe_timeout=Timeouts(total=args.timeout), prefilter_timeout=args.prefilter_timeout)
+    finder = use_proxy_api.RussianProxyFinder(config)
+    await finder.initialize()
+    finder.russian_proxies = candidates
+    started = time.perf_counter()
+    try:
+        working = await finder.check_vats_access()
+    finally:
+        elapsed = time.perf_counter() - started
+        await finder.close()
+    return elapsed, len(working), finder.metrics.probe_outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк предварительной проверки TCP-соединения")
+    parser.add_argument("--candidates", type=int, default=300, help="Число кандидатов")
+    parser.add_argument("--alive", type=float, default=0.1, help="Доля рабочих прокси")
+    parser.add_argument("--refused", type=float, default=0.2, help="Доля неработающих, отвечающих отказом")
+    parser.add_argument("--concurrency", type=int, default=20, help="Одновременных проверок VATS")
+    parser.add_argument("--timeout", type=float, default=2, help="Таймаут проверки VATS")
+    parser.add_argument("--prefilter-timeout", type=float, default=0.5, help="Таймаут TCP-проверки")
+    args = parser.parse_args()
+
+    output.configure(QUIET)
+    use_proxy_api.DATA_DIR = tempfile.mkdtemp()
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_standin_process,
+                                     args=(max(1, int(args.candidates * args.alive)), child_conn), daemon=True)
+    server.start()
+    alive = parent_conn.recv()
+    candidates, keep = build_candidates(args, alive)
+    try:
+        print(f"Кандидатов: {len(candidates)}, рабочих: {len(alive)}")
+        for label, prefilter in (("без предварительной проверки", False), ("с проверкой TCP", True)):
+            elapsed, found, outcomes = asyncio.run(measure(candidates, prefilter, args))
+            print(f"{label:<30} {elapsed:7.2f} с  {len(candidates) / elapsed:8.1f} прокси/с  "
+                  f"найдено {found}  {dict(outcomes)}")
+    finally:
+        parent_conn.send("stop")
+        server.join(5)
+        for sock in keep:
+            sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк проверки VATS в нескольких процессах (probe_shards).
+
+Все кандидаты - рабочие прокси локального имитатора из bench_vats_probe,
+поэтому время уходит не на ожидание сети, а на работу цикла событий:
+соединения, рукопожатия и разбор ответов. Сравнивается check_vats_access
+в одном процессе и в N процессах; на машине с одним ядром выигрыша нет.
+
+Запуск: python benchmarks/bench_probe_shards.py --candidates 5000 --processes 4
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import use_proxy_api  # noqa: E402
+from bench_vats_probe import _standin_process  # noqa: E402
+from finder_config import FinderConfig  # noqa: E402
+from output import QUIET, output  # noqa: E402
+
+
+async def measure(candidates, processes, args):
+    config = FinderConfig(use_store=False, use_geo_cache=False, use_source_cache=False, metrics_json="",
+                          probe_concurrency=args.concurrency, probe_processes=processes,
+                          vats_url="http://127.0.0.1:9/",
+                          # Иначе тысячи рукопожатий одновременно перегружают имитатор, а не клиента
+                          prefilter_limit=args.concurrency * 4)
+    finder = use_proxy_api.RussianProxyFinder(config)
+    await finder.initialize()
+    finder.russian_proxies = candidates
+    started = time.perf_counter()
+    try:
+        working = await finder.check_vats_access()
+    finally:
+        elapsed = time.perf_counter() - started
+        await finder.close()
+    return elapsed, len(working)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк проверки VATS в нескольких процессах")
+    parser.add_argument("--candidates", type=int, default=5000, help="Число кандидатов")
+    parser.add_argument("--ports", type=int, default=200, help="Портов имитатора прокси")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Процессов проверки")
+    parser.add_argument("--concurrency", type=int, default=100, help="Одновременных проверок в процессе")
+    args = parser.parse_args()
+
+    output.configure(QUIET)
+    use_proxy_api.DATA_DIR = tempfile.mkdtemp()
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_standin_process, args=(args.ports, child_conn, "0.0.0.0"),
+                                     daemon=True)
+    server.start()
+    ports = [address.rpartition(":")[2] for address in parent_conn.recv()]
+    # Разные адреса 127.x.y.z (имитатор слушает все адреса), чтобы пул
+    # кандидатов не схлопнул их в один
+    candidates = [f"127.{i // 65536 % 256}.{i // 256 % 256}.{i % 256 or 1}:{ports[i % len(ports)]}"
+                  for i in range(args.candidates)]
+    candidates = list(dict.fromkeys(candidates))
+    try:
+        print(f"Кандидатов: {len(candidates)}, ядер: {os.cpu_count()}")
+        baseline = None
+        for processes in sorted({1, args.processes}):
+            elapsed, found = asyncio.run(measure(candidates, processes, args))
+            baseline = baseline or elapsed
+            print(f"{processes:>2} процесс(ов) {elapsed:7.2f} с  {len(candidates) / elapsed:8.1f} прокси/с  "
+                  f"найдено {found}  ускорение {baseline / elapsed:.2f}x")
+    finally:
+        parent_conn.send("stop")
+        server.join(5)
+
+
+if __name__ == "__main__":
+    main()
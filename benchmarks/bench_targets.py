@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Бенчмарк проверки прокси на нескольких сайтах: соединение на каждую цель
+против одного соединения с keep-alive и конвейером (target_checks).
+
+Имитатор в отдельном процессе изображает HTTP-прокси с задержками сети:
+новое соединение (вместе с рукопожатием) стоит --handshake секунд, а ответ
+на каждый запрос приходит через --rtt секунд после получения запроса.
+Запросы одного соединения, отправленные конвейером, обрабатываются
+одновременно, а ответы уходят по порядку - как у настоящего прокси.
+Сравниваются время проверки одного прокси и число соединений на прокси.
+
+Запуск: python benchmarks/bench_targets.py --targets 5 --proxies 50
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_vats_probe import LOGIN_PAGE  # noqa: E402
+from target_checks import Target, TargetChecker  # noqa: E402
+
+
+def _standin_process(args, conn):
+    body = LOGIN_PAGE.encode()
+
+    async def handle(reader, writer):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(args.handshake)
+        responses = asyncio.Queue()
+
+        async def send():
+            while True:
+                due, method = await responses.get()
+                if method is None:
+                    return
+                await asyncio.sleep(max(0.0, due - loop.time()))
+                if method == "HEAD":
+                    writer.write(b"HTTP/1.1 301 Moved Permanently\r\nLocation: https://example/\r\n"
+                                 b"Content-Length: 0\r\n\r\n")
+                else:
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/html; charset=utf-8\r\n"
+                                 b"Content-Length: %d\r\n\r\n" % len(body) + body)
+                await writer.drain()
+
+        sender = asyncio.ensure_future(send())
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                responses.put_nowait((loop.time() + args.rtt, head.split(b" ", 1)[0].decode()))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            responses.put_nowait((0, None))
+            try:
+                await sender
+            except ConnectionError:
+                pass
+            writer.close()
+
+    async def serve():
+        servers = []
+        addresses = []
+        for _ in range(args.proxies):
+            server = await asyncio.start_server(handle, "127.0.0.1", 0)
+            servers.append(server)
+            addresses.append(f"127.0.0.1:{server.sockets[0].getsockname()[1]}")
+        conn.send(addresses)
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        for server in servers:
+            server.close()
+
+    asyncio.run(serve())
+
+
+async def measure(label, proxies, targets, args, pipeline=True, per_target=False):
+    checker = TargetChecker(targets, timeout=args.handshake * 4 + args.rtt * len(targets) * 4, pipeline=pipeline)
+    single = [TargetChecker([target], timeout=checker.timeout) for target in targets]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(proxy):
+        async with semaphore:
+            started = time.perf_counter()
+            if per_target:
+                # Как раньше: каждая цель - отдельное соединение, цели по очереди
+                checks = [await target_checker.check(proxy, "http") for target_checker in single]
+                passed = all(check.passed() for check in checks)
+                connections = sum(check.connections for check in checks)
+            else:
+                check = await checker.check(proxy, "http")
+                passed, connections = check.passed(), check.connections
+            return time.perf_counter() - started, passed, connections
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(one(proxy) for proxy in proxies))
+    elapsed = time.perf_counter() - started
+    times = sorted(result[0] for result in results)
+    passed = sum(result[1] for result in results)
+    connections = sum(result[2] for result in results) / len(results)
+    print(f"{label:<28} p50 {times[len(times) // 2] * 1000:7.1f} мс, "
+          f"максимум {times[-1] * 1000:7.1f} мс, соединений на прокси {connections:4.1f}, "
+          f"прошли {passed}/{len(results)}, всего {elapsed:5.2f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк проверки прокси на нескольких сайтах")
+    parser.add_argument("--targets", type=int, default=5, help="Целей (сайтов) на прокси")
+    parser.add_argument("--proxies", type=int, default=50, help="Прокси имитатора")
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременно проверяемых прокси")
+    parser.add_argument("--handshake", type=float, default=0.15, help="Стоимость нового соединения, с")
+    parser.add_argument("--rtt", type=float, default=0.1, help="Время ответа на запрос, с")
+    args = parser.parse_args()
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_standin_process, args=(args, child_conn), daemon=True)
+    server.start()
+    proxies = parent_conn.recv()
+    # Первая цель - форма входа VATS (GET), остальные - разные сайты (HEAD)
+    targets = [Target("vats", "http://vats.invalid/", form=True)]
+    targets += [Target(f"site{i}", f"http://site{i}.invalid/") for i in range(1, args.targets)]
+    try:
+        asyncio.run(measure("соединение на каждую цель", proxies, targets, args, per_target=True))
+        asyncio.run(measure("keep-alive, по очереди", proxies, targets, args, pipeline=False))
+        asyncio.run(measure("keep-alive и конвейер", proxies, targets, args))
+    finally:
+        parent_conn.send("stop")
+        server.join(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Микробенчмарк проверки VATS на локальном имитаторе HTTP-прокси.
+
+Сравнивает исходную схему (новая ClientSession на каждый прокси) с VatsProber
+(одна сессия с общим TCPConnector). Имитатор работает в отдельном процессе,
+слушает несколько портов и на любой запрос через прокси отвечает страницей
+с формой входа; время CPU считается только для клиента.
+
+Запуск: python benchmarks/bench_vats_probe.py --probes 3000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from form_detector import LOGIN_INDICATORS  # noqa: E402
+from output import QUIET, output  # noqa: E402
+from vats_prober import VATS_URL, VatsProber  # noqa: E402
+
+LOGIN_PAGE = "<html><body><form><input name='login'><input type='password'></form></body></html>"
+
+
+async def start_proxy_standin(ports, host="127.0.0.1"):
+    """Имитатор прокси: отвечает страницей входа на запрос с абсолютным URI."""
+    async def handler(request):
+        return web.Response(text=LOGIN_PAGE, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    addresses = []
+    for _ in range(ports):
+        site = web.TCPSite(runner, host, 0)
+        await site.start()
+        addresses.append(f"127.0.0.1:{site._server.sockets[0].getsockname()[1]}")
+    return runner, addresses
+
+
+def _standin_process(ports, conn, host="127.0.0.1"):
+    """Имитатор в отдельном процессе, чтобы его CPU не смешивался с клиентским."""
+    async def serve():
+        runner, addresses = await start_proxy_standin(ports, host)
+        conn.send(addresses)
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        await runner.cleanup()
+    asyncio.run(serve())
+
+
+async def probe_per_session(proxy, semaphore):
+    """Исходная check_single_proxy: отдельная ClientSession на каждый прокси."""
+    async with semaphore:
+        timeout = aiohttp.ClientTimeout(total=5)
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.get(VATS_URL, proxy=f"http://{proxy}", ssl=False) as response:
+                    html_content = (await response.text()).lower()
+                    if any(indicator.lower() in html_content for indicator in LOGIN_INDICATORS):
+                        return proxy
+        except Exception:
+            pass
+        return None
+
+
+async def run(args):
+    # Вывод в консоль измеряется отдельно: здесь сравнивается только сетевая часть
+    output.configure(QUIET)
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_standin_process, args=(args.ports, child_conn), daemon=True)
+    server.start()
+    addresses = parent_conn.recv()
+    proxies = [addresses[i % len(addresses)] for i in range(args.probes)]
+
+    try:
+        for name in ("session-per-probe", "shared-connector"):
+            semaphore = asyncio.Semaphore(args.concurrency)
+            cpu_started = time.process_time()
+            started = time.perf_counter()
+            if name == "session-per-probe":
+                results = await asyncio.gather(*(probe_per_session(p, semaphore) for p in proxies))
+            else:
+                async with VatsProber(limit=args.concurrency) as prober:
+                    async def probe(proxy):
+                        async with semaphore:
+                            return await prober.probe(proxy)
+                    results = await asyncio.gather(*(probe(p) for p in proxies))
+            elapsed = time.perf_counter() - started
+            cpu = time.process_time() - cpu_started
+            ok = sum(1 for r in results if r)
+            print(f"{name:>18}: {elapsed:6.2f} с, {len(proxies) / elapsed:8.0f} проверок/с, "
+                  f"CPU {cpu:5.2f} с, успешно {ok}/{len(proxies)}")
+    finally:
+        parent_conn.send("stop")
+        server.join(timeout=5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк проверки VATS через прокси")
+    parser.add_argument("--probes", type=int, default=3000, help="Количество проверок")
+    parser.add_argument("--ports", type=int, default=50, help="Количество портов-«прокси» имитатора")
+    parser.add_argument("--concurrency", type=int, default=100, help="Одновременных проверок")
+    args = parser.parse_args()
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Компактный пул кандидатов без дубликатов.
+
+Прокси хранятся не строками "ip:port", а одним целым числом (IPv4 << 16 | порт)
+в записях со __slots__. Повтор одного и того же прокси от разных источников
+не создаёт новой записи: у существующей только дополняется битовая маска
+источников. Строки от источников проверяются и нормализуются - мусор,
+фрагменты с \\r\\n и несколько адресов в одной строке разбираются корректно.
+Память и число проверок зависят от числа уникальных прокси, а не от объёма
+собранных списков.
+"""
+
+import re
+
+# Необязательная схема, IPv4 из десятичных октетов и порт
+_PROXY_RE = re.compile(r"(?:[a-z0-9]+://)?(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3}):(\d{1,5})/?", re.IGNORECASE)
+_SPLIT_RE = re.compile(r"[\s,;]+")
+
+
+def pack_proxy(text):
+    """Разбор "ip:port" в ключ (IPv4 << 16 | порт); None для некорректной строки."""
+    match = _PROXY_RE.fullmatch(text)
+    if not match:
+        return None
+    a, b, c, d, port = (int(group) for group in match.groups())
+    if a > 255 or b > 255 or c > 255 or d > 255 or not 0 < port < 65536 or a == 0:
+        return None
+    return (((a << 24) | (b << 16) | (c << 8) | d) << 16) | port
+
+
+def unpack_proxy(key):
+    """Обратное преобразование ключа в строку "ip:port"."""
+    ip = key >> 16
+    return f"{ip >> 24}.{(ip >> 16) & 255}.{(ip >> 8) & 255}.{ip & 255}:{key & 0xFFFF}"
+
+
+class ProxyEntry:
+    __slots__ = ("key", "sources", "declared", "country")
+
+    def __init__(self, key):
+        self.key = key
+        # Битовая маска источников (номера в CandidatePool.source_names)
+        self.sources = 0
+        # Источник сам отфильтровал прокси по России
+        self.declared = False
+        # Код страны по геолокации (None - ещё не определена)
+        self.country = None
+
+    @property
+    def proxy(self):
+        return unpack_proxy(self.key)
+
+    @property
+    def russian(self):
+        return self.declared or self.country == "RU"
+
+
+class CandidatePool:
+    def __init__(self):
+        self._entries = {}
+        self.source_names = []
+        self._source_bits = {}
+        self.stats = {"added": 0, "duplicates": 0, "invalid": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, proxy):
+        key = pack_proxy(proxy.strip())
+        return key is not None and key in self._entries
+
+    def __iter__(self):
+        return iter(self._entries.values())
+
+    def _source_bit(self, source):
+        bit = self._source_bits.get(source)
+        if bit is None:
+            bit = self._source_bits[source] = 1 << len(self.source_names)
+            self.source_names.append(source)
+        return bit
+
+    def add_many(self, raw_proxies, source=None, russian=False):
+        """Добавление строк от источника.
+
+        Возвращает пару списков нормализованных прокси: все корректные прокси
+        из ответа источника и новые кандидаты - впервые встреченные или впервые
+        заявленные источником как российские.
+        """
+        bit = self._source_bit(source) if source else 0
+        entries = self._entries
+        stats = self.stats
+        valid = []
+        fresh = []
+        for raw in raw_proxies:
+            if not raw:
+                continue
+            for token in _SPLIT_RE.split(str(raw).strip()):
+                if not token:
+                    continue
+                key = pack_proxy(token)
+                if key is None:
+                    stats["invalid"] += 1
+                    continue
+                valid.append(key)
+                entry = entries.get(key)
+                if entry is None:
+                    entry = entries[key] = ProxyEntry(key)
+                    stats["added"] += 1
+                    fresh.append(entry)
+                elif russian and not entry.russian:
+                    fresh.append(entry)
+                else:
+                    stats["duplicates"] += 1
+                entry.sources |= bit
+                if russian:
+                    entry.declared = True
+        return [unpack_proxy(key) for key in valid], [entry.proxy for entry in fresh]
+
+    def get(self, proxy):
+        key = pack_proxy(proxy.strip())
+        return self._entries.get(key) if key is not None else None
+
+    def set_country(self, proxy, country):
+        entry = self.get(proxy)
+        if entry is not None:
+            entry.country = country
+        return entry
+
+    def sources_of(self, proxy):
+        """Имена источников, сообщивших о прокси."""
+        entry = self.get(proxy)
+        if entry is None:
+            return []
+        return [name for i, name in enumerate(self.source_names) if entry.sources >> i & 1]
+
+    def all(self):
+        return [entry.proxy for entry in self._entries.values()]
+
+    def russian(self):
+        return [entry.proxy for entry in self._entries.values() if entry.russian]
+
+    def unverified(self):
+        """Прокси, для которых источник не заявил Россию и страна ещё не определена."""
+        return [entry.proxy for entry in self._entries.values() if not entry.declared and entry.country is None]
+
+    def reset_countries(self):
+        """Сброс заявленных и определённых стран у всех кандидатов."""
+        for entry in self._entries.values():
+            entry.declared = False
+            entry.country = None
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Настройки RussianProxyFinder: параллельность и таймауты для каждой фазы.
+
+Фазы: сбор прокси из источников (scrape), определение страны (geo)
+и проверка доступа к VATS (probe). Таймауты каждой фазы разделены на
+установку соединения (connect), чтение ответа (read) и общий (total).
+"""
+
+import os
+from dataclasses import dataclass, field
+
+import aiohttp
+
+from vats_prober import VATS_URL
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+
+
+@dataclass
+class Timeouts:
+    total: float
+    connect: float = None
+    read: float = None
+
+    def client_timeout(self):
+        """Таймаут aiohttp для запросов этой фазы."""
+        return aiohttp.ClientTimeout(total=self.total, sock_connect=self.connect, sock_read=self.read)
+
+
+@dataclass
+class FinderConfig:
+    # Сбор прокси: сколько источников опрашивается одновременно
+    scrape_concurrency: int = 18
+    scrape_timeout: Timeouts = field(default_factory=lambda: Timeouts(total=10, connect=5, read=10))
+    # Разбор HTML: число процессов (0 - пул потоков по умолчанию)
+    parse_processes: int = 0
+    # Кэш ответов источников и условные запросы (data/source_cache.sqlite3)
+    use_source_cache: bool = True
+
+    # Геолокация: одновременные запросы к сервисам и число обработчиков потокового режима
+    geo_concurrency: int = 20
+    geo_workers: int = 50
+    geo_timeout: Timeouts = field(default_factory=lambda: Timeouts(total=5, connect=3, read=5))
+    use_geo_cache: bool = True
+    geo_db: str = None
+
+    # Проверка VATS: адрес и одновременные проверки через прокси
+    vats_url: str = VATS_URL
+    probe_concurrency: int = 20
+    # Число процессов проверки VATS (0 или 1 - в текущем процессе);
+    # probe_concurrency действует в каждом процессе отдельно
+    probe_processes: int = 0
+    probe_timeout: Timeouts = field(default_factory=lambda: Timeouts(total=5, connect=3, read=5))
+    # Подбор числа проверок и таймаутов по ходу проверки (probe_controller):
+    # probe_concurrency и probe_timeout - начальные значения; верхняя граница
+    # числа проверок (None - по запасу файловых дескрипторов)
+    adaptive_probe: bool = True
+    probe_max_concurrency: int = None
+    # Предварительная проверка TCP-соединения: таймаут и число одновременных
+    # соединений (None - по запасу файловых дескрипторов)
+    prefilter: bool = True
+    prefilter_timeout: float = 1.5
+    prefilter_limit: int = None
+    # Определение протокола прокси (HTTP, CONNECT, SOCKS4, SOCKS5) перед проверкой
+    detect_protocol: bool = True
+    detect_timeout: float = 3
+
+    # Проверка рабочих прокси на нескольких сайтах (target_checks): список
+    # адресов, пустой список - VATS и популярные российские сайты, None - не проверять
+    targets: list = None
+    targets_timeout: float = 10
+
+    # История проверок: хранилище и порог «мёртвого» прокси (неудач подряд)
+    use_store: bool = True
+    dead_after: int = 3
+
+    # Отчёт о метриках запуска: JSON (пустая строка - не сохранять) и Prometheus
+    metrics_json: str = os.path.join(DATA_DIR, "run_metrics.json")
+    metrics_prometheus: str = None
+
+    @classmethod
+    def from_args(cls, args):
+        """Настройки из аргументов командной строки main.py."""
+        config = cls()
+        config.probe_concurrency = args.concurrent
+        config.probe_processes = args.probe_processes
+        config.adaptive_probe = not args.fixed_concurrency
+        config.probe_max_concurrency = args.max_concurrent
+        config.probe_timeout = Timeouts(
+            total=args.timeout,
+            connect=args.connect_timeout or min(3, args.timeout),
+            read=args.read_timeout or args.timeout,
+        )
+        config.scrape_concurrency = args.scrape_concurrency
+        config.scrape_timeout = Timeouts(
+            total=args.scrape_timeout,
+            connect=min(args.connect_timeout or 5, args.scrape_timeout),
+            read=min(args.read_timeout or args.scrape_timeout, args.scrape_timeout),
+        )
+        config.parse_processes = args.parse_processes
+        config.geo_concurrency = args.geo_concurrency
+        config.geo_workers = args.geo_workers
+        config.geo_timeout = Timeouts(
+            total=args.geo_timeout,
+            connect=min(args.connect_timeout or 3, args.geo_timeout),
+            read=min(args.read_timeout or args.geo_timeout, args.geo_timeout),
+        )
+        config.prefilter = not args.no_prefilter
+        config.prefilter_timeout = args.prefilter_timeout
+        config.prefilter_limit = args.prefilter_limit
+        config.detect_protocol = not args.no_detect_protocol
+        config.detect_timeout = args.detect_timeout
+        config.use_geo_cache = not args.no_geo_cache
+        config.use_source_cache = not args.no_source_cache
+        config.geo_db = args.geo_db
+        config.use_store = not args.no_store
+        config.targets = args.targets
+        if args.metrics_json is not None:
+            config.metrics_json = args.metrics_json
+        config.metrics_prometheus = args.prometheus
+        return config
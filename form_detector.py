@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Потоковое распознавание формы входа VATS в ответе, полученном через прокси.
+
+Вместо чтения всего тела, перевода в нижний регистр и отдельного поиска
+каждого признака FormDetector получает тело фрагментами и ищет все признаки
+формы входа и диагностической страницы за один проход: одним регулярным
+выражением-перечислением байтовых строк (поиск выполняется в C, без цикла
+Python по байтам). Кириллические признаки ищутся сразу в кодировках
+UTF-8, CP1251 и KOI8-R, поэтому тело не нужно декодировать.
+
+Чтение прекращается, как только известен ответ:
+- найден признак диагностической страницы - прокси не подходит, где бы
+  на странице ни был признак формы входа (диагностика приоритетнее);
+- тело кончилось или прочитано MAX_BODY байт - форма входа найдена или нет.
+
+После признака формы входа тело дочитывается до конца (или MAX_BODY) в
+поисках признаков диагностической страницы: у диагностической страницы
+прокси признаки формы могут быть в начале, а remote_addr - ниже.
+"""
+
+import re
+
+# Характерные признаки формы входа
+LOGIN_INDICATORS = [
+    'input[name="login"]', 'input[name="username"]',
+    'input[type="password"]', 'form', '<form',
+    'Логин', 'Пароль', 'Вход', 'Авторизация',
+    'Личный кабинет', 'Виртуальной АТС'
+]
+
+# Признаки диагностической страницы прокси вместо настоящего интерфейса
+DIAGNOSTIC_MARKERS = ["remote_addr", "request_method"]
+
+# Кодировки русскоязычных страниц
+ENCODINGS = ("utf-8", "cp1251", "koi8-r")
+# Сколько байт тела читать не больше
+MAX_BODY = 256 * 1024
+
+OK = "ok"
+DIAGNOSTIC = "diagnostic"
+NO_FORM = "no_form"
+
+
+def _variants(text):
+    """Байтовые варианты строки: регистр кириллицы и кодировки страниц.
+
+    Латиница приводится к нижнему регистру через bytes.lower(), кириллица
+    этим методом не меняется - поэтому её регистры перечисляются явно.
+    """
+    variants = set()
+    for form in {text.lower(), text.upper(), text.capitalize(), text}:
+        for encoding in ENCODINGS:
+            try:
+                variants.add(form.encode(encoding).lower())
+            except UnicodeEncodeError:
+                continue
+    return variants
+
+
+class _Patterns:
+    def __init__(self, indicators, markers):
+        self.kinds = {}
+        for marker in markers:
+            for variant in _variants(marker):
+                self.kinds[variant] = DIAGNOSTIC
+        for indicator in indicators:
+            for variant in _variants(indicator):
+                self.kinds.setdefault(variant, OK)
+        self.longest = max(map(len, self.kinds))
+        # Длинные варианты первыми: при общем начале выигрывает более полное совпадение
+        ordered = sorted(self.kinds, key=len, reverse=True)
+        self.any = re.compile(b"|".join(re.escape(p) for p in ordered))
+        self.diagnostic = re.compile(b"|".join(re.escape(p) for p in ordered if self.kinds[p] == DIAGNOSTIC))
+
+
+_DEFAULT = _Patterns(LOGIN_INDICATORS, DIAGNOSTIC_MARKERS)
+
+
+class FormDetector:
+    def __init__(self, indicators=None, markers=None, max_body=MAX_BODY):
+        if indicators is None and markers is None:
+            self.patterns = _DEFAULT
+        else:
+            self.patterns = _Patterns(indicators or LOGIN_INDICATORS, markers or DIAGNOSTIC_MARKERS)
+        self.max_body = max_body
+        self.received = 0
+        # Позиция конца первого найденного признака формы входа
+        self.found_at = None
+        self.verdict = None
+        self._tail = b""
+
+    def feed(self, chunk):
+        """Очередной фрагмент тела; возвращает ответ, если он уже известен, иначе None."""
+        if self.verdict:
+            return self.verdict
+        window = self._tail + chunk.lower()
+        offset = self.received - len(self._tail)
+        self.received += len(chunk)
+        if self.found_at is None:
+            match = self.patterns.any.search(window)
+            if match is not None:
+                if self.patterns.kinds[match.group()] == DIAGNOSTIC:
+                    self.verdict = DIAGNOSTIC
+                    return self.verdict
+                self.found_at = offset + match.end()
+                # Дальше важны только признаки диагностической страницы
+                if self.patterns.diagnostic.search(window, match.end()):
+                    self.verdict = DIAGNOSTIC
+                    return self.verdict
+        elif self.patterns.diagnostic.search(window):
+            self.verdict = DIAGNOSTIC
+            return self.verdict
+        # Совпадение может начинаться в одном фрагменте и заканчиваться в следующем
+        self._tail = window[-(self.patterns.longest - 1):]
+        if self.received >= self.max_body:
+            self.verdict = self.finish()
+        return self.verdict
+
+    def finish(self):
+        """Ответ после конца тела (или по достижении max_body)."""
+        if not self.verdict:
+            self.verdict = OK if self.found_at is not None else NO_FORM
+        return self.verdict
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Постоянный кэш геолокации IP-адресов (IP -> код страны) на SQLite.
+
+Каждая запись хранит срок годности. Неудачные определения страны
+кэшируются отдельно (негативный кэш) с более коротким сроком, чтобы
+не тратить лимит запросов ipinfo.io на заведомо проблемные адреса.
+"""
+
+import os
+import sqlite3
+import time
+
+# Срок хранения успешного определения страны (7 дней)
+DEFAULT_TTL = 7 * 24 * 3600
+# Срок хранения неудачного определения (1 час)
+DEFAULT_NEGATIVE_TTL = 3600
+
+# Признак отсутствия записи в кэше (None означает закэшированную ошибку)
+MISS = object()
+
+
+class GeoCache:
+    def __init__(self, path, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL, commit_every=100):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.commit_every = commit_every
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS geo ("
+            " ip TEXT PRIMARY KEY,"
+            " country TEXT,"
+            " expires REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get(self, ip):
+        """Код страны из кэша, None для закэшированной ошибки или MISS."""
+        row = self.conn.execute(
+            "SELECT country, expires FROM geo WHERE ip = ?", (ip,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            self.misses += 1
+            return MISS
+        self.hits += 1
+        return row[0]
+
+    def get_many(self, ips):
+        """Пакетное чтение: словарь ip -> страна только для найденных записей."""
+        found = {}
+        ips = list(ips)
+        now = time.time()
+        # SQLite ограничивает число параметров в одном запросе
+        for i in range(0, len(ips), 500):
+            chunk = ips[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT ip, country FROM geo WHERE expires >= ? AND ip IN ({placeholders})",
+                [now, *chunk],
+            )
+            found.update(rows)
+        self.hits += len(found)
+        self.misses += len(ips) - len(found)
+        return found
+
+    def put(self, ip, country):
+        """Сохранение результата; country=None - негативная запись."""
+        ttl = self.ttl if country else self.negative_ttl
+        self.conn.execute(
+            "INSERT OR REPLACE INTO geo (ip, country, expires) VALUES (?, ?, ?)",
+            (ip, country, time.time() + ttl),
+        )
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.flush()
+
+    def purge_expired(self):
+        """Удаление просроченных записей."""
+        self.conn.execute("DELETE FROM geo WHERE expires < ?", (time.time(),))
+        self.conn.commit()
+
+    def flush(self):
+        self.conn.commit()
+        self._pending = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Офлайн-геолокация IPv4 по таблице диапазонов адресов стран.
+
+Набор данных загружается в отсортированные массивы (array) начал и концов
+диапазонов, поиск выполняется бинарным поиском без сетевых запросов.
+
+Поддерживаемые форматы:
+- CSV с диапазонами: ``начало,конец,код_страны[,...]``, где адреса заданы
+  в точечной нотации или целыми числами (DB-IP Lite, IP2Location LITE);
+- CSV с сетями: ``1.2.3.0/24,RU[,...]``;
+- список сетей по одной на строку (например, ru.zone от ipdeny.com)
+  с кодом страны, переданным отдельно (по умолчанию DEFAULT_COUNTRY);
+- MMDB (GeoLite2-Country и совместимые), если установлен пакет maxminddb.
+"""
+
+import csv
+import ipaddress
+import socket
+import struct
+from array import array
+from bisect import bisect_right
+
+_unpack_ip = struct.Struct("!I").unpack
+# Страна списка сетей без кода страны
+DEFAULT_COUNTRY = "RU"
+# Сколько значимых строк просматривать при определении формата
+SNIFF_LINES = 20
+
+
+def ip_to_int(ip):
+    """Преобразование IPv4 в целое число; ValueError для некорректного адреса."""
+    try:
+        return _unpack_ip(socket.inet_aton(ip))[0]
+    except OSError:
+        raise ValueError(f"Некорректный IPv4-адрес: {ip!r}")
+
+
+def _is_cidr_list(path):
+    """Список сетей по одной на строку: в значимых строках нет запятых."""
+    seen = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            if "," in line or "/" not in line:
+                return False
+            seen += 1
+            if seen >= SNIFF_LINES:
+                break
+    return seen > 0
+
+
+def _parse_bound(value):
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return ip_to_int(value)
+
+
+class CountryRangeIndex:
+    def __init__(self):
+        self.starts = array("I")
+        self.ends = array("I")
+        self.codes = array("H")
+        self.countries = []
+        self._country_ids = {}
+        self._pending = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    # --- Загрузка данных ---
+
+    def add_range(self, start, end, country):
+        """Добавление диапазона [start, end] (целые числа) для страны."""
+        country = country.strip().upper()
+        if not country or start > end or end > 0xFFFFFFFF:
+            return
+        code = self._country_ids.get(country)
+        if code is None:
+            code = self._country_ids[country] = len(self.countries)
+            self.countries.append(country)
+        self._pending.append((start, end, code))
+
+    def add_network(self, network, country):
+        """Добавление сети в нотации CIDR (IPv6 пропускается)."""
+        net = ipaddress.ip_network(network.strip(), strict=False)
+        if net.version == 4:
+            self.add_range(int(net.network_address), int(net.broadcast_address), country)
+
+    def load_csv(self, path):
+        """Загрузка CSV с диапазонами или сетями."""
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.reader(f):
+                if not row or row[0].lstrip().startswith("#"):
+                    continue
+                try:
+                    if "/" in row[0] and len(row) >= 2:
+                        self.add_network(row[0], row[1])
+                    elif len(row) >= 3:
+                        self.add_range(_parse_bound(row[0]), _parse_bound(row[1]), row[2])
+                except ValueError:
+                    # Заголовок, IPv6 или мусорная строка
+                    continue
+        return self.build()
+
+    def load_cidr_list(self, path, country):
+        """Загрузка списка сетей одной страны (по одной сети на строку)."""
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if not line:
+                    continue
+                try:
+                    self.add_network(line, country)
+                except ValueError:
+                    continue
+        return self.build()
+
+    def load_mmdb(self, path):
+        """Загрузка MMDB-файла (требуется пакет maxminddb >= 2.5)."""
+        try:
+            import maxminddb
+        except ImportError:
+            raise RuntimeError("Для загрузки MMDB установите пакет maxminddb: pip install maxminddb")
+        with maxminddb.open_database(path) as reader:
+            for network, record in reader:
+                if network.version != 4 or not isinstance(record, dict):
+                    continue
+                country = (record.get("country") or record.get("registered_country") or {}).get("iso_code")
+                if country:
+                    self.add_range(int(network.network_address), int(network.broadcast_address), country)
+        return self.build()
+
+    def build(self):
+        """Сортировка и слияние смежных диапазонов одной страны."""
+        ranges = [(s, e, c) for s, e, c in zip(self.starts, self.ends, self.codes)]
+        ranges.extend(self._pending)
+        self._pending = []
+        ranges.sort()
+
+        starts, ends, codes = array("I"), array("I"), array("H")
+        for start, end, code in ranges:
+            if starts and codes[-1] == code and start <= ends[-1] + 1:
+                if end > ends[-1]:
+                    ends[-1] = end
+                continue
+            if starts and start <= ends[-1]:
+                # Пересечение с другой страной: приоритет у более раннего диапазона
+                if end <= ends[-1]:
+                    continue
+                start = ends[-1] + 1
+            starts.append(start)
+            ends.append(end)
+            codes.append(code)
+        self.starts, self.ends, self.codes = starts, ends, codes
+        return self
+
+    @classmethod
+    def from_file(cls, path, country=None):
+        """Загрузка набора данных с определением формата по расширению и содержимому.
+
+        country - страна списка сетей без кода страны (по умолчанию
+        DEFAULT_COUNTRY). ValueError, если в файле не нашлось ни одного
+        диапазона IPv4.
+        """
+        index = cls()
+        if path.lower().endswith(".mmdb"):
+            index.load_mmdb(path)
+        elif country or _is_cidr_list(path):
+            index.load_cidr_list(path, country or DEFAULT_COUNTRY)
+        else:
+            index.load_csv(path)
+        if not len(index):
+            raise ValueError(f"В {path} не найдено ни одного диапазона IPv4 в поддерживаемом формате")
+        return index
+
+    # --- Поиск ---
+
+    def lookup_int(self, value):
+        i = bisect_right(self.starts, value) - 1
+        if i >= 0 and value <= self.ends[i]:
+            return self.countries[self.codes[i]]
+        return None
+
+    def lookup(self, ip):
+        """Код страны для IPv4 или None, если адреса нет в наборе данных."""
+        try:
+            return self.lookup_int(ip_to_int(ip))
+        except ValueError:
+            return None
+
+    def lookup_many(self, ips):
+        """Пакетная классификация: список кодов стран в порядке входных IP.
+
+        Весь список обрабатывается одним циклом с локальными ссылками на
+        массивы индекса, без накладных расходов на вызов lookup для каждого IP.
+        """
+        starts, ends, codes, countries = self.starts, self.ends, self.codes, self.countries
+        inet_aton, unpack = socket.inet_aton, _unpack_ip
+        result = []
+        append = result.append
+        for ip in ips:
+            try:
+                value = unpack(inet_aton(ip))[0]
+            except (OSError, TypeError):
+                append(None)
+                continue
+            i = bisect_right(starts, value) - 1
+            append(countries[codes[i]] if i >= 0 and value <= ends[i] else None)
+        return result
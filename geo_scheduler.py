@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Планировщик запросов геолокации с ограничением параллельности и частоты.
+
+Отдельные запросы resolve(ip) накапливаются и отправляются пакетами по 100 IP
+в ip-api.com/batch. Адреса, для которых пакетный запрос не вернул ответа
+(ошибка сети, лимит запросов), проверяются поштучно через ipinfo.io; адреса,
+которые ip-api явно не смог определить (status "fail": частные и
+зарезервированные диапазоны, некорректный адрес), туда не отправляются. Для каждого сервиса действует свой token bucket,
+общее число одновременных запросов ограничено семафором, а ошибки сети и
+ответы 429/5xx повторяются с экспоненциальной задержкой.
+"""
+
+import asyncio
+import random
+import time
+
+import aiohttp
+
+IPAPI_URL = "http://ip-api.com"
+IPINFO_URL = "https://ipinfo.io"
+
+# Максимальный размер пакета ip-api.com/batch
+BATCH_SIZE = 100
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, не более capacity подряд."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Блокировка выдачи токенов, когда сервис сообщил об исчерпании лимита."""
+        if self.rate:
+            self.updated = time.monotonic()
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class RetryableError(Exception):
+    def __init__(self, message, delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+
+class GeoScheduler:
+    def __init__(self, session, concurrency=20, ipapi_rate=15 / 60, ipapi_burst=15,
+                 ipinfo_rate=5, ipinfo_burst=10, retries=3, backoff=0.5, batch_delay=0.05,
+                 timeout=5, ipapi_url=IPAPI_URL, ipinfo_url=IPINFO_URL):
+        self.session = session
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.buckets = {
+            "ip-api": TokenBucket(ipapi_rate, ipapi_burst),
+            "ipinfo": TokenBucket(ipinfo_rate, ipinfo_burst),
+        }
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_delay = batch_delay
+        # Число секунд (общий таймаут) или готовый aiohttp.ClientTimeout
+        self.timeout = timeout if isinstance(timeout, aiohttp.ClientTimeout) else aiohttp.ClientTimeout(total=timeout)
+        self.ipapi_url = ipapi_url.rstrip("/")
+        self.ipinfo_url = ipinfo_url.rstrip("/")
+
+        self._pending = {}
+        self._flush_handle = None
+        self._tasks = set()
+        self.stats = {"requests": 0, "batches": 0, "retries": 0, "failures": 0, "resolved": 0,
+                      "unresolvable": 0}
+
+    # --- Публичный интерфейс ---
+
+    async def resolve(self, ip):
+        """Код страны для IP или None, если ни один сервис не ответил."""
+        future = self._pending.get(ip)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[ip] = future
+            if len(self._pending) >= BATCH_SIZE:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.batch_delay, self._flush)
+        return await asyncio.shield(future)
+
+    async def resolve_many(self, ips):
+        """Словарь ip -> код страны (None для неопределённых адресов)."""
+        ips = list(dict.fromkeys(ips))
+        countries = await asyncio.gather(*(self.resolve(ip) for ip in ips))
+        return dict(zip(ips, countries))
+
+    async def close(self):
+        """Отмена незавершённых пакетов."""
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for future in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending = {}
+
+    # --- Пакетирование ---
+
+    def _flush(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch):
+        try:
+            found = {}
+            try:
+                found = await self._with_retries("ip-api", self._fetch_ipapi_batch, list(batch))
+            except Exception:
+                self.stats["failures"] += 1
+
+            # Явный отказ ip-api (None в found) окончателен - ipinfo его тоже не определит
+            missing = [ip for ip in batch if ip not in found]
+            if missing:
+                countries = await asyncio.gather(*(self._resolve_ipinfo(ip) for ip in missing))
+                found.update(zip(missing, countries))
+
+            for ip, future in batch.items():
+                if not future.done():
+                    country = found.get(ip)
+                    if country:
+                        self.stats["resolved"] += 1
+                    future.set_result(country)
+        except asyncio.CancelledError:
+            for future in batch.values():
+                if not future.done():
+                    future.cancel()
+            raise
+        except Exception as e:
+            # Ошибка передана ожидающим resolve; задачу пакета никто не ждёт
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _resolve_ipinfo(self, ip):
+        try:
+            return await self._with_retries("ipinfo", self._fetch_ipinfo, ip)
+        except Exception:
+            self.stats["failures"] += 1
+            return None
+
+    async def _with_retries(self, provider, fetch, arg):
+        attempt = 0
+        while True:
+            await self.buckets[provider].acquire()
+            try:
+                async with self.semaphore:
+                    self.stats["requests"] += 1
+                    return await fetch(arg)
+            except (RetryableError, aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    raise
+                delay = getattr(e, "delay", None)
+                if delay:
+                    self.buckets[provider].pause(delay)
+                else:
+                    delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                attempt += 1
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _check_status(response):
+        """429 и 5xx повторяются, остальные ошибочные коды - нет."""
+        if response.status == 429 or response.status >= 500:
+            delay = response.headers.get("Retry-After") or response.headers.get("X-Ttl")
+            raise RetryableError(f"HTTP {response.status}", float(delay) if delay and delay.isdigit() else None)
+        response.raise_for_status()
+
+    # --- Сервисы ---
+
+    async def _fetch_ipapi_batch(self, ips):
+        self.stats["batches"] += 1
+        url = f"{self.ipapi_url}/batch?fields=status,countryCode,query"
+        async with self.session.post(url, json=ips, timeout=self.timeout) as response:
+            self._check_status(response)
+            data = await response.json(content_type=None)
+            # Сервис сообщает, сколько запросов осталось в текущем окне
+            if response.headers.get("X-Rl") == "0":
+                ttl = response.headers.get("X-Ttl", "60")
+                self.buckets["ip-api"].pause(float(ttl) if ttl.isdigit() else 60)
+        found = {}
+        for item in data:
+            if not isinstance(item, dict) or not item.get("query"):
+                continue
+            if item.get("status") == "success":
+                found[item["query"]] = item.get("countryCode") or None
+            elif item.get("status") == "fail":
+                # Адрес, который не определит ни один сервис
+                self.stats["unresolvable"] += 1
+                found[item["query"]] = None
+        return found
+
+    async def _fetch_ipinfo(self, ip):
+        url = f"{self.ipinfo_url}/{ip}/json"
+        async with self.session.get(url, timeout=self.timeout) as response:
+            self._check_status(response)
+            data = await response.json(content_type=None)
+        return data.get("country") or None
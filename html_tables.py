@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Извлечение прокси из HTML-таблиц источников.
+
+Быстрый путь не строит дерево документа: таблица находится по классу или id
+(простой селектор вида "table.proxy-list", ".proxy__table" или "#list"),
+строки и ячейки выделяются регулярными выражениями, а из ячеек берутся
+только нужные колонки. Незакрытые <tr> и <td> допускаются. Разбор через
+BeautifulSoup оставлен для источников, разметку которых быстрый путь не
+понимает (parser="tree").
+
+Функции модуля не зависят от состояния и могут выполняться в пуле потоков
+или процессов, чтобы разбор не блокировал цикл событий.
+"""
+
+import html
+import re
+
+from bs4 import BeautifulSoup
+
+_SELECTOR_RE = re.compile(r"^(\w*)([.#])([\w-]+)$")
+_TABLE_END_RE = re.compile(r"</table\s*>", re.IGNORECASE)
+_TABLE_START_RE = re.compile(r"<table\b", re.IGNORECASE)
+_ROW_RE = re.compile(r"<tr\b[^>]*>(.*?)(?=<tr\b|</tbody|</table|\Z)", re.IGNORECASE | re.DOTALL)
+_CELL_RE = re.compile(r"<td\b[^>]*>(.*?)(?=<td\b|<th\b|</tr|\Z)", re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]*>")
+_IP_PORT_RE = re.compile(r"\b(\d{1,3}(?:\.\d{1,3}){3}):(\d{1,5})\b")
+
+
+def _marker_re(selector):
+    """Регулярное выражение для открывающего тега элемента, заданного селектором."""
+    match = _SELECTOR_RE.match(selector.strip())
+    if not match:
+        raise ValueError(f"Быстрый разбор не поддерживает селектор {selector!r}")
+    tag, kind, name = match.groups()
+    attribute = "class" if kind == "." else "id"
+    return re.compile(
+        rf"<{tag or r'[a-z][a-z0-9]*'}\b[^>]*\b{attribute}\s*=\s*[\"']"
+        rf"(?:[^\"']*\s)?{re.escape(name)}(?:\s[^\"']*)?[\"']",
+        re.IGNORECASE,
+    )
+
+
+def find_tables(text, selector):
+    """Фрагменты HTML таблиц внутри элементов, подходящих под селектор."""
+    tables = []
+    position = 0
+    marker = _marker_re(selector)
+    while True:
+        match = marker.search(text, position)
+        if not match:
+            return tables
+        # Селектор может указывать как на саму таблицу, так и на её контейнер
+        start = match.start() if match.group(0)[1:6].lower() == "table" else None
+        if start is None:
+            table = _TABLE_START_RE.search(text, match.end())
+            if not table:
+                return tables
+            start = table.start()
+        end = _TABLE_END_RE.search(text, start)
+        stop = end.end() if end else len(text)
+        tables.append(text[start:stop])
+        position = stop
+
+
+def cell_text(fragment):
+    return html.unescape(_TAG_RE.sub("", fragment)).strip()
+
+
+def iter_rows(table):
+    """Строки таблицы как списки текста ячеек <td> (строки заголовка из <th> пропускаются)."""
+    for row in _ROW_RE.finditer(table):
+        cells = _CELL_RE.findall(row.group(1))
+        if cells:
+            yield [cell_text(cell) for cell in cells]
+
+
+def _select_proxies(rows, ip_col, port_col, country_col, countries, min_columns):
+    required = max(min_columns, ip_col + 1, port_col + 1)
+    proxies = []
+    for columns in rows:
+        if len(columns) < required:
+            continue
+        if countries:
+            country = columns[country_col] if country_col is not None and len(columns) > country_col else ""
+            if not any(code in country for code in countries):
+                continue
+        proxies.append(f"{columns[ip_col]}:{columns[port_col]}")
+    return proxies
+
+
+def _tree_rows(text, selector):
+    soup = BeautifulSoup(text, "html.parser")
+    for row in soup.select(f"{selector} tr"):
+        cells = row.select("td")
+        if cells:
+            yield [cell.text.strip() for cell in cells]
+
+
+def extract_proxies(text, selector, ip_col=0, port_col=1, country_col=None, countries=None,
+                    min_columns=2, parser="fast"):
+    """Прокси "ip:port" из таблиц, найденных по селектору.
+
+    countries - подстроки, одна из которых должна встречаться в колонке
+    country_col (например, ("RU", "Россия")); None - без фильтра по стране.
+    """
+    if parser == "tree":
+        rows = _tree_rows(text, selector)
+    else:
+        rows = (row for table in find_tables(text, selector) for row in iter_rows(table))
+    return _select_proxies(rows, ip_col, port_col, country_col, countries, min_columns)
+
+
+def find_ip_ports(text, selector=None):
+    """Все пары ip:port в тексте (или начиная с элемента, заданного селектором)."""
+    if selector:
+        match = _marker_re(selector).search(text)
+        if not match:
+            return []
+        text = text[match.start():]
+    return [f"{ip}:{port}" for ip, port in _IP_PORT_RE.findall(html.unescape(_TAG_RE.sub(" ", text)))]
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Потоковый разбор JSON-ответов со списком прокси.
+
+JsonArrayStream получает ответ фрагментами и выдаёт элементы массива по мере
+поступления (json.JSONDecoder.raw_decode), поэтому всё тело ответа никогда
+не хранится целиком: в буфере остаётся только недочитанный элемент. Текст
+вне массива (например, "total" и "page" у geonode) сохраняется, чтобы после
+окончания ответа прочитать из него служебные поля.
+"""
+
+import json
+import re
+
+_WHITESPACE = " \t\r\n"
+
+
+class JsonArrayStream:
+    def __init__(self, key=None):
+        # Ключ объекта верхнего уровня с массивом (None - ответ сам является массивом)
+        self.key = key
+        self._start_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key) if key else r"\[")
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        # 0 - ищем начало массива, 1 - внутри массива, 2 - массив закончился
+        self._state = 0
+        self._outside = []
+
+    def feed(self, text):
+        """Добавление фрагмента; возвращает элементы массива, разобранные целиком."""
+        self._buffer += text
+        items = []
+        if self._state == 0:
+            match = self._start_re.search(self._buffer)
+            if not match:
+                # Ключ может быть разрезан между фрагментами - оставляем хвост
+                keep = len(self.key or "") + 16
+                self._outside.append(self._buffer[:-keep])
+                self._buffer = self._buffer[-keep:]
+                return items
+            self._outside.append(self._buffer[:match.start()])
+            self._buffer = self._buffer[match.end():]
+            self._state = 1
+
+        if self._state == 1:
+            buffer = self._buffer
+            position = 0
+            while True:
+                while position < len(buffer) and (buffer[position] in _WHITESPACE or buffer[position] == ","):
+                    position += 1
+                if position >= len(buffer):
+                    break
+                if buffer[position] == "]":
+                    self._state = 2
+                    position += 1
+                    break
+                try:
+                    item, position = self._decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    # Элемент ещё не получен полностью
+                    break
+                items.append(item)
+            self._buffer = buffer[position:]
+
+        if self._state == 2:
+            self._outside.append(self._buffer)
+            self._buffer = ""
+        return items
+
+    def field(self, name):
+        """Число или строка из поля верхнего уровня вне массива (после окончания ответа)."""
+        outside = "".join(self._outside) + self._buffer
+        match = re.search(r'"%s"\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?)' % re.escape(name), outside)
+        return json.loads(match.group(1)) if match else None
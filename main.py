@@ -17,16 +17,60 @@ import asyncio
 import argparse
 import os
 import sys
-from rich.console import Console
 from rich.table import Table
-from use_proxy_api import RussianProxyFinder
+from finder_config import FinderConfig, Timeouts
+from output import LEVELS, PROGRESS, QUIET, VERBOSE, output
+from proxy_daemon import ProxyDaemon
+from target_checks import matrix_table
+from use_proxy_api import PROXY_JSON_FILE, RussianProxyFinder
+
+
+def build_config(max_concurrent=20, timeout=5, config=None):
+    """Настройки поиска: готовый FinderConfig или параметры проверки VATS."""
+    if config is not None:
+        return config
+    config = FinderConfig()
+    config.probe_concurrency = max_concurrent
+    config.probe_timeout = Timeouts(total=timeout, connect=min(3, timeout), read=timeout)
+    return config
+
+
+async def stream_proxies(max_concurrent=20, timeout=5, config=None, limit=None):
+    """Потоковый поиск: выдаёт рабочие прокси для VATS по мере нахождения."""
+    finder = RussianProxyFinder(build_config(max_concurrent, timeout, config))
+    await finder.initialize()
 
-console = Console()
+    try:
+        working_proxies = []
+        async for proxy in finder.stream_working_proxies(limit=limit):
+            working_proxies.append(proxy)
+            yield proxy
+        await finder.save_proxies()
+        await check_targets(finder, working_proxies)
+    finally:
+        await finder.close()
 
 
-async def find_proxies(check_vats=True, max_concurrent=20, timeout=5):
-    """Полный процесс поиска и проверки прокси."""
-    finder = RussianProxyFinder()
+async def find_proxies(check_vats=True, max_concurrent=20, timeout=5, stream=False, config=None, limit=None):
+    """Полный процесс поиска и проверки прокси.
+
+    max_concurrent и timeout задают параметры проверки VATS; для тонкой
+    настройки всех фаз передайте готовый FinderConfig в config.
+    limit - остановиться после нахождения limit рабочих прокси.
+    """
+    config = build_config(max_concurrent, timeout, config)
+    if stream and check_vats:
+        working_proxies = []
+        async for proxy in stream_proxies(config=config, limit=limit):
+            working_proxies.append(proxy)
+            output.info(f"[bold green]➜ Найден рабочий прокси #{len(working_proxies)}: {proxy}")
+        if working_proxies:
+            show_working_proxies(working_proxies)
+        else:
+            output.result("[bold red]Не найдено прокси, которые могут открыть VATS с формой входа!")
+        return working_proxies
+
+    finder = RussianProxyFinder(config)
     await finder.initialize()
 
     try:
@@ -40,22 +84,42 @@ async def find_proxies(check_vats=True, max_concurrent=20, timeout=5):
 
         # Если нужно проверить доступность VATS
         if check_vats:
-            working_proxies = await finder.check_vats_access()
+            working_proxies = await finder.check_vats_access(limit=limit)
             if working_proxies:
                 show_working_proxies(working_proxies)
+                await check_targets(finder, working_proxies)
                 return working_proxies
             else:
-                console.print("[bold red]Не найдено прокси, которые могут открыть VATS с формой входа!")
+                output.result("[bold red]Не найдено прокси, которые могут открыть VATS с формой входа!")
 
         return finder.russian_proxies
     finally:
         await finder.close()
 
 
+async def run_daemon(config, source_interval=None, recheck_min=60, recheck_max=1800, expire_after=3):
+    """Режим демона: поддержание пула рабочих прокси до прерывания."""
+    finder = RussianProxyFinder(config)
+    await finder.initialize()
+    daemon = ProxyDaemon(finder, PROXY_JSON_FILE, source_interval=source_interval,
+                         recheck_min=recheck_min, recheck_max=recheck_max, expire_after=expire_after)
+    try:
+        await daemon.run()
+    finally:
+        await finder.close()
+
+
+async def check_targets(finder, proxies):
+    """Матрица проверки рабочих прокси на сайтах, если заданы --targets."""
+    if finder.config.targets is None or not proxies:
+        return
+    output.result(matrix_table(await finder.check_targets(proxies)))
+
+
 def show_working_proxies(proxies):
     """Отображение списка рабочих прокси в виде таблицы."""
     if not proxies:
-        console.print("[bold red]Нет рабочих прокси для отображения.")
+        output.result("[bold red]Нет рабочих прокси для отображения.")
         return
 
     table = Table(title="Рабочие прокси для доступа к VATS")
@@ -65,28 +129,108 @@ def show_working_proxies(proxies):
     for idx, proxy in enumerate(proxies, 1):
         table.add_row(str(idx), proxy)
 
-    console.print(table)
-    console.print("\nИспользуйте эти прокси для доступа к VATS через браузер.")
+    output.result(table)
+    output.info("\nИспользуйте эти прокси для доступа к VATS через браузер.")
 
 
 async def main():
     """Главная функция программы с обработкой аргументов командной строки."""
     parser = argparse.ArgumentParser(description="Поиск и проверка российских прокси для доступа к VATS")
     parser.add_argument("-n", "--novats", action="store_true", help="Не проверять доступность VATS")
-    parser.add_argument("-c", "--concurrent", type=int, default=20, help="Количество одновременных запросов")
-    parser.add_argument("-t", "--timeout", type=int, default=5, help="Таймаут соединения в секундах")
+    parser.add_argument("-c", "--concurrent", type=int, default=20,
+                        help="Количество одновременных проверок VATS (начальное, если не задан --fixed-concurrency)")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="Верхняя граница одновременных проверок VATS (по умолчанию - четверть запаса дескрипторов, не больше 1000)")
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="Не подбирать число одновременных проверок и таймауты: использовать -c и -t как есть")
+    parser.add_argument("-t", "--timeout", type=float, default=5,
+                        help="Общий таймаут проверки VATS в секундах (начальный, если не задан --fixed-concurrency)")
+    parser.add_argument("--connect-timeout", type=float, help="Таймаут установки соединения в секундах")
+    parser.add_argument("--read-timeout", type=float,
+                        help="Таймаут чтения ответа в секундах (для источников, геолокации и проверки VATS, "
+                             "не больше общего таймаута каждой фазы)")
+    parser.add_argument("--scrape-concurrency", type=int, default=18,
+                        help="Количество одновременно опрашиваемых источников прокси")
+    parser.add_argument("--scrape-timeout", type=float, default=10, help="Таймаут запроса к источнику прокси")
+    parser.add_argument("--parse-processes", type=int, default=0,
+                        help="Число процессов для разбора HTML источников (0 - в потоках)")
+    parser.add_argument("--geo-concurrency", type=int, default=20,
+                        help="Количество одновременных запросов к сервисам геолокации")
+    parser.add_argument("--geo-workers", type=int, default=50,
+                        help="Количество обработчиков геолокации в потоковом режиме")
+    parser.add_argument("--geo-timeout", type=float, default=5, help="Таймаут запроса геолокации в секундах")
+    parser.add_argument("-f", "--first", type=int, metavar="N",
+                        help="Остановиться после нахождения N рабочих прокси")
+    parser.add_argument("-s", "--stream", action="store_true",
+                        help="Потоковый режим: проверять прокси, не дожидаясь завершения сбора")
+    parser.add_argument("--probe-processes", type=int, default=0, metavar="N",
+                        help="Проверять VATS в N процессах (--concurrent действует в каждом)")
+    parser.add_argument("--no-prefilter", action="store_true",
+                        help="Не проверять TCP-соединение с прокси перед проверкой VATS")
+    parser.add_argument("--prefilter-timeout", type=float, default=1.5,
+                        help="Таймаут предварительной проверки TCP-соединения в секундах")
+    parser.add_argument("--prefilter-limit", type=int, default=None,
+                        help="Одновременных TCP-проверок (по умолчанию - половина запаса файловых дескрипторов)")
+    parser.add_argument("--no-detect-protocol", action="store_true",
+                        help="Не определять протокол прокси: считать все прокси HTTP")
+    parser.add_argument("--detect-timeout", type=float, default=3,
+                        help="Таймаут определения протокола прокси (HTTP, CONNECT, SOCKS4, SOCKS5) в секундах")
+    parser.add_argument("--no-geo-cache", action="store_true",
+                        help="Не использовать кэш геолокации (data/geo_cache.sqlite3)")
+    parser.add_argument("--no-source-cache", action="store_true",
+                        help="Загружать все источники заново, без кэша ответов (data/source_cache.sqlite3)")
+    parser.add_argument("-d", "--daemon", action="store_true",
+                        help="Режим демона: постоянно обновлять пул рабочих прокси")
+    parser.add_argument("--source-interval", type=float, default=None,
+                        help="Демон: интервал повторного опроса источников в секундах "
+                             "(по умолчанию - интервал обновления каждого источника)")
+    parser.add_argument("--recheck-min", type=float, default=60,
+                        help="Демон: минимальный интервал перепроверки прокси в секундах")
+    parser.add_argument("--recheck-max", type=float, default=1800,
+                        help="Демон: максимальный интервал перепроверки стабильных прокси в секундах")
+    parser.add_argument("--expire-after", type=int, default=3,
+                        help="Демон: удалять прокси после K неудачных проверок подряд")
+    parser.add_argument("--targets", nargs="*", metavar="URL",
+                        help="Проверить рабочие прокси на сайтах через одно соединение на прокси "
+                             "(без адресов - VATS, ya.ru, mail.ru, vk.com, gosuslugi.ru)")
+    parser.add_argument("--no-store", action="store_true",
+                        help="Не использовать историю проверок прокси (data/proxies.sqlite3)")
+    parser.add_argument("--metrics-json", metavar="PATH",
+                        help="Куда сохранить JSON-отчёт о метриках запуска (по умолчанию data/run_metrics.json)")
+    parser.add_argument("--prometheus", metavar="PATH",
+                        help="Сохранить метрики в текстовом формате Prometheus")
+    parser.add_argument("--geo-db", metavar="PATH",
+                        help="Офлайн-набор диапазонов IP стран (CSV, MMDB или список сетей RU) для геолокации без HTTP-запросов")
+    parser.add_argument("--output", choices=LEVELS, default=PROGRESS,
+                        help="Подробность вывода: quiet - только итог, progress - индикаторы и сводки (по умолчанию), "
+                             "verbose - строка на каждый источник и прокси")
+    parser.add_argument("-q", "--quiet", dest="output", action="store_const", const=QUIET,
+                        help="То же, что --output quiet")
+    parser.add_argument("-v", "--verbose", dest="output", action="store_const", const=VERBOSE,
+                        help="То же, что --output verbose")
+    parser.add_argument("--events", metavar="PATH",
+                        help="Записывать события (источники, геолокация, проверки) в файл JSON Lines")
     args = parser.parse_args()
 
-    console.print("\n🔍 Поиск российских прокси для доступа к VATS...\n")
+    output.configure(args.output, args.events)
+    output.info("\n🔍 Поиск российских прокси для доступа к VATS...\n")
 
     try:
-        await find_proxies(check_vats=not args.novats, max_concurrent=args.concurrent, timeout=args.timeout)
+        if args.daemon:
+            await run_daemon(FinderConfig.from_args(args), source_interval=args.source_interval,
+                             recheck_min=args.recheck_min, recheck_max=args.recheck_max,
+                             expire_after=args.expire_after)
+            return
+        await find_proxies(check_vats=not args.novats, stream=args.stream, config=FinderConfig.from_args(args),
+                           limit=args.first)
     except KeyboardInterrupt:
-        console.print("\n[bold yellow]Работа программы прервана пользователем.")
+        output.result("\n[bold yellow]Работа программы прервана пользователем.")
         sys.exit(0)
     except Exception as e:
-        console.print(f"\n[bold red]Ошибка при выполнении: {str(e)}")
+        output.result(f"\n[bold red]Ошибка при выполнении: {str(e)}")
         sys.exit(1)
+    finally:
+        output.close()
 
 
 if __name__ == "__main__":
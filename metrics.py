@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Метрики запуска RussianProxyFinder: время фаз, статистика источников и проверок.
+
+Сетевые замеры снимаются через aiohttp.TraceConfig, поэтому методы источников
+не нужно менять: источник, к которому относится запрос, определяется по
+контекстной переменной, установленной на время его работы. Отчёт выводится
+в JSON и, при необходимости, в текстовом формате Prometheus.
+"""
+
+import contextvars
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+import aiohttp
+
+# Источник, к которому относятся текущие запросы
+current_source = contextvars.ContextVar("current_source", default=None)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 10)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def merge(self, other):
+        """Добавление наблюдений другой гистограммы с теми же корзинами."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.count += other.count
+
+    def quantile(self, q):
+        """Оценка квантиля по верхней границе корзины."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.total, 4),
+            "mean": round(self.total / self.count, 4) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {str(b): c for b, c in zip(list(self.buckets) + ["+Inf"], self.counts)},
+        }
+
+    def prometheus(self, name, labels=""):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += count
+            sep = "," if labels else ""
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.total}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class SourceStats:
+    __slots__ = ("requests", "errors", "fetch_time", "parse_time", "bytes", "wall_time", "yielded")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = Counter()
+        self.fetch_time = 0.0
+        # Время самого разбора; ответы из кэша и 304 не разбираются
+        self.parse_time = 0.0
+        self.bytes = 0
+        self.wall_time = 0.0
+        self.yielded = 0
+
+
+class RunMetrics:
+    def __init__(self):
+        self.started = time.time()
+        self.phases = {}
+        self.sources = defaultdict(SourceStats)
+        # Какие источники сообщили о каждом прокси - для подсчёта уникального вклада
+        self.reported_by = defaultdict(set)
+        self.probe_connect = Histogram()
+        self.probe_ttfb = Histogram()
+        self.probe_total = Histogram()
+        self.probe_outcomes = Counter()
+        self.probe_errors = Counter()
+        # Прочитанные байты тела ответа и проверки, остановленные до конца тела
+        self.probe_body = Counter()
+        self.first_result_after = None
+        self.extra = {}
+
+    # --- Фазы ---
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def mark_result(self):
+        """Отметка о найденном рабочем прокси (время до первого результата)."""
+        if self.first_result_after is None:
+            self.first_result_after = time.time() - self.started
+
+    # --- Источники ---
+
+    @contextmanager
+    def source(self, name):
+        stats = self.sources[name]
+        token = current_source.set(name)
+        started = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.wall_time += time.perf_counter() - started
+            current_source.reset(token)
+
+    def record_yield(self, source, proxies):
+        if not source:
+            return
+        self.sources[source].yielded += len(proxies)
+        for proxy in proxies:
+            self.reported_by[proxy].add(source)
+
+    def record_parse(self, source, elapsed):
+        """Время разбора ответа источника (SourceFetcher, параметр on_parse)."""
+        self.sources[source].parse_time += elapsed
+
+    def scrape_trace_config(self):
+        """TraceConfig для сессии источников: задержка загрузки и объём ответа."""
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            name = current_source.get()
+            if name:
+                self.sources[name].requests += 1
+                ctx.source = name
+                ctx.last = time.perf_counter()
+
+        async def on_chunk(session, ctx, params):
+            name = getattr(ctx, "source", None)
+            if name:
+                # Время загрузки - от начала запроса до последнего полученного фрагмента
+                now = time.perf_counter()
+                stats = self.sources[name]
+                stats.bytes += len(params.chunk)
+                stats.fetch_time += now - ctx.last
+                ctx.last = now
+
+        async def on_request_exception(session, ctx, params):
+            name = getattr(ctx, "source", None)
+            if name:
+                self.sources[name].errors[type(params.exception).__name__] += 1
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_response_chunk_received.append(on_chunk)
+        trace.on_request_exception.append(on_request_exception)
+        return trace
+
+    # --- Проверки VATS ---
+
+    def probe_trace_config(self):
+        """TraceConfig для проверок: время соединения и до первого байта ответа."""
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            ctx.started = time.perf_counter()
+
+        async def on_connection_create_start(session, ctx, params):
+            ctx.connect_started = time.perf_counter()
+
+        async def on_connection_create_end(session, ctx, params):
+            if hasattr(ctx, "connect_started"):
+                self.probe_connect.observe(time.perf_counter() - ctx.connect_started)
+
+        async def on_request_end(session, ctx, params):
+            self.probe_ttfb.observe(time.perf_counter() - ctx.started)
+
+        trace.on_request_start.append(on_request_start)
+        trace.on_connection_create_start.append(on_connection_create_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+    def record_probe(self, outcome, elapsed=None, error=None):
+        """outcome: ok, no_form, diagnostic, http_<код> или error."""
+        self.probe_outcomes[outcome] += 1
+        if error is not None:
+            self.probe_errors[type(error).__name__] += 1
+        if elapsed is not None:
+            self.probe_total.observe(elapsed)
+
+    def record_body(self, received, early):
+        """Байты тела, прочитанные при проверке; early - чтение остановлено до конца тела."""
+        self.probe_body["bytes"] += received
+        self.probe_body["bodies"] += 1
+        self.probe_body["early_stop"] += int(early)
+
+    def probe_state(self):
+        """Статистика проверок для передачи из процесса-обработчика (см. probe_shards)."""
+        return {
+            "connect": self.probe_connect,
+            "ttfb": self.probe_ttfb,
+            "total": self.probe_total,
+            "outcomes": self.probe_outcomes,
+            "errors": self.probe_errors,
+            "body": self.probe_body,
+        }
+
+    def merge_probe_state(self, state):
+        self.probe_connect.merge(state["connect"])
+        self.probe_ttfb.merge(state["ttfb"])
+        self.probe_total.merge(state["total"])
+        self.probe_outcomes.update(state["outcomes"])
+        self.probe_errors.update(state["errors"])
+        self.probe_body.update(state["body"])
+
+    # --- Отчёт ---
+
+    def report(self):
+        unique = Counter()
+        for sources in self.reported_by.values():
+            if len(sources) == 1:
+                unique[next(iter(sources))] += 1
+
+        sources = {}
+        for name, stats in sorted(self.sources.items()):
+            sources[name] = {
+                "requests": stats.requests,
+                "fetch_latency": round(stats.fetch_time, 4),
+                "parse_time": round(stats.parse_time, 4),
+                "wall_time": round(stats.wall_time, 4),
+                "bytes": stats.bytes,
+                "yield": stats.yielded,
+                "unique": unique[name],
+                "errors": dict(stats.errors),
+            }
+
+        return {
+            "started": self.started,
+            "duration": round(time.time() - self.started, 4),
+            "time_to_first_result": round(self.first_result_after, 4) if self.first_result_after else None,
+            "phases": {name: round(value, 4) for name, value in self.phases.items()},
+            "sources": sources,
+            "unique_candidates": len(self.reported_by),
+            "probes": {
+                "outcomes": dict(self.probe_outcomes),
+                "errors": dict(self.probe_errors),
+                "connect_latency": self.probe_connect.to_dict(),
+                "ttfb": self.probe_ttfb.to_dict(),
+                "total_latency": self.probe_total.to_dict(),
+                "body": dict(self.probe_body),
+            },
+            **self.extra,
+        }
+
+    def write_json(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def write_prometheus(self, path):
+        """Текстовый формат Prometheus (для node_exporter textfile collector)."""
+        report = self.report()
+        lines = [
+            "# TYPE ru_proxy_phase_seconds gauge",
+            *(f'ru_proxy_phase_seconds{{phase="{name}"}} {value}' for name, value in report["phases"].items()),
+        ]
+        # Каждое семейство метрик - отдельным блоком со своей строкой TYPE
+        for family, key in (("fetch_seconds", "fetch_latency"), ("parse_seconds", "parse_time"),
+                            ("bytes", "bytes"), ("yield", "yield"), ("unique", "unique")):
+            lines.append(f"# TYPE ru_proxy_source_{family} gauge")
+            for name, stats in report["sources"].items():
+                lines.append(f'ru_proxy_source_{family}{{source="{name}"}} {stats[key]}')
+        lines.append("# TYPE ru_proxy_probe_outcomes_total counter")
+        for outcome, count in self.probe_outcomes.items():
+            lines.append(f'ru_proxy_probe_outcomes_total{{outcome="{outcome}"}} {count}')
+        lines.append("# TYPE ru_proxy_probe_errors_total counter")
+        for error, count in self.probe_errors.items():
+            lines.append(f'ru_proxy_probe_errors_total{{error="{error}"}} {count}')
+        lines.append("# TYPE ru_proxy_probe_body_bytes_total counter")
+        lines.append(f"ru_proxy_probe_body_bytes_total {self.probe_body['bytes']}")
+        lines.append("# TYPE ru_proxy_probe_connect_seconds histogram")
+        lines.extend(self.probe_connect.prometheus("ru_proxy_probe_connect_seconds"))
+        lines.append("# TYPE ru_proxy_probe_ttfb_seconds histogram")
+        lines.extend(self.probe_ttfb.prometheus("ru_proxy_probe_ttfb_seconds"))
+        lines.append("# TYPE ru_proxy_probe_total_seconds histogram")
+        lines.extend(self.probe_total.prometheus("ru_proxy_probe_total_seconds"))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
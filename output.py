@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Вывод хода работы: уровни подробности и поток событий JSON Lines.
+
+Уровни:
+- quiet - только итоговые результаты и ошибки;
+- progress (по умолчанию) - сообщения о фазах и индикаторы tqdm с общими
+  счётчиками; индикатор перерисовывается не чаще раза в REFRESH секунд;
+- verbose - дополнительно строка на каждый источник, IP и прокси.
+
+Сообщения о каждом прокси (detail) при уровне ниже verbose отбрасываются
+без разбора разметки rich и записи в терминал, поэтому не занимают цикл
+событий. События (event) только
+кладутся в очередь: сериализацию в JSON и запись в файл выполняет фоновый
+поток EventWriter.
+"""
+
+import json
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+
+from rich.console import Console
+from tqdm import tqdm
+
+QUIET = "quiet"
+PROGRESS = "progress"
+VERBOSE = "verbose"
+LEVELS = (QUIET, PROGRESS, VERBOSE)
+
+# Минимальный интервал перерисовки индикатора, секунды
+REFRESH = 0.5
+
+_STOP = object()
+
+
+class EventWriter:
+    """Фоновая запись событий в файл JSON Lines."""
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.written = 0
+        self.thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+        self.thread.start()
+
+    def emit(self, event):
+        self.queue.put(event)
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                event = self.queue.get()
+                batch = [event]
+                # Всё, что накопилось, записывается одним вызовом
+                while event is not _STOP:
+                    try:
+                        event = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    batch.append(event)
+                lines = [json.dumps(item, ensure_ascii=False, default=str) for item in batch if item is not _STOP]
+                if lines:
+                    f.write("\n".join(lines) + "\n")
+                    f.flush()
+                    self.written += len(lines)
+                if batch[-1] is _STOP:
+                    return
+
+    def close(self):
+        self.queue.put(_STOP)
+        self.thread.join()
+
+
+class Output:
+    def __init__(self):
+        self.level = PROGRESS
+        self.console = Console()
+        # EventWriter или любой объект с методом emit (см. probe_shards)
+        self.events = None
+        self._bars = {}
+        self.counts = {}
+
+    def configure(self, level=PROGRESS, events=None):
+        """Уровень вывода и файл событий (путь, объект с emit или None)."""
+        if level not in LEVELS:
+            raise ValueError(f"Неизвестный уровень вывода: {level}")
+        self.close()
+        self.level = level
+        self.events = EventWriter(events) if isinstance(events, str) else events
+
+    @property
+    def verbose(self):
+        return self.level == VERBOSE
+
+    def _print(self, *objects):
+        if self._bars:
+            # Строка выводится над индикаторами, а не поверх них
+            with tqdm.external_write_mode(file=sys.stderr):
+                self.console.print(*objects)
+        else:
+            self.console.print(*objects)
+
+    def info(self, message):
+        """Сообщение о фазе работы: не выводится только при quiet."""
+        if self.level != QUIET:
+            self._print(message)
+
+    def detail(self, message):
+        """Сообщение об отдельном источнике или прокси: только при verbose."""
+        if self.level == VERBOSE:
+            self._print(message)
+
+    def result(self, *objects):
+        """Итоговый результат или ошибка: выводится всегда."""
+        self._print(*objects)
+
+    def event(self, kind, **fields):
+        if self.events is not None:
+            self.events.emit({"ts": round(time.time(), 3), "event": kind, **fields})
+
+    # --- Индикаторы ---
+
+    def start(self, phase, total=None, label=None, unit=" прокси"):
+        """Начало фазы со счётчиком; индикатор tqdm - только при уровне progress."""
+        self.finish(phase)
+        self.counts[phase] = Counter()
+        if self.level == PROGRESS:
+            self._bars[phase] = tqdm(total=total, desc=label or phase, unit=unit, mininterval=REFRESH,
+                                     dynamic_ncols=True, leave=False, file=sys.stderr)
+
+    def advance(self, phase, n=1, **counts):
+        """Продвижение фазы; counts - счётчики, показываемые рядом с индикатором."""
+        counter = self.counts.get(phase)
+        if counter is None:
+            return
+        counter.update(counts)
+        bar = self._bars.get(phase)
+        if bar is not None:
+            if counts:
+                bar.set_postfix(counter, refresh=False)
+            bar.update(n)
+
+    def finish(self, phase):
+        bar = self._bars.pop(phase, None)
+        if bar is not None:
+            bar.close()
+        return self.counts.get(phase, Counter())
+
+    def close(self):
+        for phase in list(self._bars):
+            self.finish(phase)
+        if isinstance(self.events, EventWriter):
+            self.events.close()
+        self.events = None
+
+
+output = Output()
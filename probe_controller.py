@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Адаптивное число одновременных проверок VATS и таймауты проверки.
+
+ProbeController заменяет фиксированный семафор: используется как
+`async with controller:` и получает исход каждой проверки от VatsProber.
+Лимит одновременных проверок подбирается по схеме AIMD:
+- пока признаков перегрузки нет и лимит полностью занят, он растёт:
+  сначала удваивается (как slow start в TCP), затем прибавляет ~√лимита;
+- при перегрузке лимит умножается на BACKOFF.
+
+Признаки перегрузки:
+- задержка цикла событий выше LAG_THRESHOLD (не хватает процессора);
+- доля таймаутов и ошибок соединения заметно выше базовой. Часть прокси
+  не работает всегда, поэтому сравнивается со сглаженной долей прошлых
+  интервалов, а не с нулём;
+- нехватка дескрипторов или локальных портов.
+
+Время ответа само по себе сигналом не служит: оно определяется в основном
+самими прокси, а не загрузкой нашего канала.
+
+Таймауты соединения и общий берутся как p95 недавних проверок × TIMEOUT_FACTOR
+в пределах [MIN_TIMEOUT, max_timeout]. Так медленные, но рабочие прокси на
+перегруженном канале не отсекаются, а на быстром канале не приходится ждать
+зависшие прокси лишние секунды.
+"""
+
+import asyncio
+import errno
+import heapq
+import itertools
+import math
+import time
+from collections import Counter, deque
+
+import aiohttp
+
+from output import output
+
+# Как часто измеряется задержка цикла событий и принимается решение, секунды
+LAG_SAMPLE = 0.05
+INTERVAL = 0.5
+# Средняя задержка цикла событий за интервал, при которой лимит снижается
+LAG_THRESHOLD = 0.05
+# Минимум завершённых проверок для решения по доле неудач
+MIN_SAMPLES = 20
+# Насколько доля неудач может превысить базовую (абсолютная разница)
+FAILURE_TOLERANCE = 0.15
+# Сглаживание базовой доли неудач
+BASELINE_ALPHA = 0.1
+# Множитель лимита при перегрузке и число интервалов без решений после снижения
+BACKOFF = 0.7
+COOLDOWN = 2
+# Таймауты: квантиль времени проверки, множитель и границы
+TIMEOUT_QUANTILE = 0.95
+TIMEOUT_FACTOR = 3
+MIN_TIMEOUT = 1.0
+MIN_CONNECT_TIMEOUT = 0.5
+# Сколько последних измерений учитывается в таймаутах и сколько нужно для
+# первого пересчёта: первыми завершаются быстрые проверки, и по малой выборке
+# таймаут получился бы слишком коротким для медленных рабочих прокси
+WINDOW = 500
+TIMEOUT_SAMPLES = 100
+# Верхняя граница лимита, если не задана явно
+MAX_CONCURRENCY = 1000
+
+# Ошибки, означающие нехватку ресурсов у нас, а не неисправный прокси
+RESOURCE_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.EADDRNOTAVAIL, errno.ENOBUFS}
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _resource_error(error):
+    while error is not None:
+        if isinstance(error, OSError) and error.errno in RESOURCE_ERRNOS:
+            return True
+        error = error.__cause__ or getattr(error, "os_error", None)
+    return False
+
+
+class ProbeController:
+    def __init__(self, initial=20, minimum=4, maximum=MAX_CONCURRENCY, timeout=5, connect_timeout=3,
+                 max_timeout=None, interval=INTERVAL, lag_threshold=LAG_THRESHOLD):
+        self.limit = max(minimum, min(initial, maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        # Таймауты до накопления TIMEOUT_SAMPLES измерений - заданные в настройках
+        self.default_timeout = timeout
+        self.default_connect = connect_timeout or timeout
+        self.max_timeout = max_timeout or timeout * 4
+        self.timeout = aiohttp.ClientTimeout(total=timeout, sock_connect=self.default_connect, sock_read=timeout)
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self.in_flight = 0
+        self.peak = self.limit
+        self.slow_start = True
+        self.stats = Counter()
+        self._waiters = deque()
+        self._latencies = deque(maxlen=WINDOW)
+        self._connects = deque(maxlen=WINDOW)
+        self._tick = Counter()
+        self._saturated = False
+        self._cooldown = 0
+        self._baseline = None
+        self._lag = 0.0
+        self._monitor = None
+
+    # --- Семафор ---
+
+    async def acquire(self):
+        if self._monitor is None:
+            self._monitor = asyncio.ensure_future(self._run())
+        if self.in_flight < self.limit and not self._waiters:
+            self._take()
+            return
+        self._saturated = True
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже выдан, но задача отменена - отдаём его следующему
+                self.release()
+            elif future in self._waiters:
+                self._waiters.remove(future)
+            raise
+
+    def _take(self):
+        self.in_flight += 1
+        if self.in_flight >= self.limit:
+            self._saturated = True
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.limit:
+            future = self._waiters.popleft()
+            if not future.done():
+                self._take()
+                future.set_result(None)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+    # --- Измерения ---
+
+    def observe(self, outcome, elapsed, error=None):
+        """Исход проверки (см. VatsProber._record)."""
+        self._tick["completed"] += 1
+        if outcome != "error":
+            # Прокси ответил: время ответа идёт в расчёт таймаутов
+            self._latencies.append(elapsed)
+        elif _resource_error(error):
+            self._tick["resource"] += 1
+        elif isinstance(error, asyncio.TimeoutError):
+            self._tick["timeouts"] += 1
+        else:
+            self._tick["errors"] += 1
+
+    def observe_connect(self, elapsed):
+        """Время установки соединения (или туннеля) с прокси."""
+        self._connects.append(elapsed)
+
+    def trace_config(self):
+        """TraceConfig aiohttp: время соединения с HTTP-прокси."""
+        trace = aiohttp.TraceConfig()
+
+        async def on_connection_create_start(session, ctx, params):
+            ctx.connect_started = time.perf_counter()
+
+        async def on_connection_create_end(session, ctx, params):
+            if hasattr(ctx, "connect_started"):
+                self.observe_connect(time.perf_counter() - ctx.connect_started)
+
+        trace.on_connection_create_start.append(on_connection_create_start)
+        trace.on_connection_create_end.append(on_connection_create_end)
+        return trace
+
+    # --- Решения ---
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        lags = []
+        deadline = loop.time() + self.interval
+        while True:
+            started = loop.time()
+            await asyncio.sleep(LAG_SAMPLE)
+            lags.append(max(0.0, loop.time() - started - LAG_SAMPLE))
+            if loop.time() >= deadline:
+                self._lag = sum(lags) / len(lags)
+                self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], round(self._lag * 1000))
+                lags = []
+                deadline = loop.time() + self.interval
+                self.adjust(self._lag)
+
+    def adjust(self, lag=0.0):
+        """Решение по итогам интервала: изменить лимит и пересчитать таймауты."""
+        self._update_timeouts()
+        busy = self.in_flight > 0 or self._waiters
+        if self._cooldown:
+            self._cooldown -= 1
+            self._reset_tick()
+            return
+        if busy and lag > self.lag_threshold:
+            return self._decrease("lag")
+        if self._tick["resource"]:
+            return self._decrease("resources")
+
+        completed = self._tick["completed"]
+        if completed < MIN_SAMPLES:
+            # Мало данных для решения - копим измерения следующего интервала
+            return
+        failures = (self._tick["timeouts"] + self._tick["errors"]) / completed
+        baseline = self._baseline
+        # Базовая доля обновляется всегда: устойчивый сдвиг (другой набор
+        # прокси) за несколько интервалов становится новой нормой
+        self._baseline = failures if baseline is None else baseline + BASELINE_ALPHA * (failures - baseline)
+        if baseline is not None and failures > baseline + FAILURE_TOLERANCE:
+            return self._decrease("failures")
+        if self._saturated:
+            self._increase()
+        self._reset_tick()
+
+    def _reset_tick(self):
+        self._tick = Counter()
+        self._saturated = bool(self._waiters)
+
+    def _increase(self):
+        previous = self.limit
+        if self.slow_start:
+            self.limit = min(self.maximum, self.limit * 2)
+        else:
+            self.limit = min(self.maximum, self.limit + max(1, int(math.sqrt(self.limit))))
+        if self.limit != previous:
+            self.stats["increases"] += 1
+            self.peak = max(self.peak, self.limit)
+            self._changed("increase")
+            self._wake()
+
+    def _decrease(self, reason):
+        self.slow_start = False
+        self.limit = max(self.minimum, int(self.limit * BACKOFF))
+        self.stats["decreases"] += 1
+        self.stats[f"decrease_{reason}"] += 1
+        self._cooldown = COOLDOWN
+        self._changed(reason)
+        self._reset_tick()
+
+    def _changed(self, reason):
+        output.detail(f"[dim]Проверок VATS одновременно: {self.limit} ({reason}), "
+                      f"таймаут {self.timeout.total:.1f}с")
+        output.event("probe_control", limit=self.limit, reason=reason, in_flight=self.in_flight,
+                     timeout=round(self.timeout.total, 3), connect_timeout=round(self.timeout.sock_connect, 3),
+                     lag=round(self._lag, 4))
+
+    def _update_timeouts(self):
+        total = self.default_timeout
+        if len(self._latencies) >= TIMEOUT_SAMPLES:
+            total = min(self.max_timeout, max(MIN_TIMEOUT, _quantile(self._latencies, TIMEOUT_QUANTILE) * TIMEOUT_FACTOR))
+        connect = min(self.default_connect, total)
+        if len(self._connects) >= TIMEOUT_SAMPLES:
+            connect = min(total, max(MIN_CONNECT_TIMEOUT, _quantile(self._connects, TIMEOUT_QUANTILE) * TIMEOUT_FACTOR))
+        self.timeout = aiohttp.ClientTimeout(total=total, sock_connect=connect, sock_read=total)
+
+    def report(self):
+        """Итоги для отчёта о метриках запуска."""
+        return {
+            "limit": self.limit,
+            "peak_limit": self.peak,
+            "timeout": round(self.timeout.total, 3),
+            "connect_timeout": round(self.timeout.sock_connect, 3),
+            **self.stats,
+        }
+
+    async def close(self):
+        if self._monitor:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+
+
+class PriorityGate:
+    """Выдача слотов ограничителя (ProbeController или семафора) по приоритету.
+
+    Перед проверкой VATS задача проходит проверку TCP и определение
+    протокола, поэтому к ограничителю задачи приходят в порядке завершения
+    этих проверок, а не в порядке prioritize(). Gate выдаёт освободившийся
+    слот ожидающей задаче с наименьшим rank: `async with gate.slot(rank):`.
+    """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self._heap = []
+        self._order = itertools.count()
+        self._dispatcher = None
+
+    def slot(self, rank):
+        return _GateSlot(self, rank)
+
+    async def _wait(self, rank):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (rank, next(self._order), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Слот уже выдан, но задача отменена
+                await self.limiter.__aexit__(None, None, None)
+            raise
+
+    async def _dispatch(self):
+        while self._heap:
+            await self.limiter.__aenter__()
+            # Пока ждали слот, могли прийти задачи с меньшим rank
+            while self._heap:
+                _, _, future = heapq.heappop(self._heap)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                await self.limiter.__aexit__(None, None, None)
+
+    async def close(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+
+class _GateSlot:
+    def __init__(self, gate, rank):
+        self.gate = gate
+        self.rank = rank
+
+    async def __aenter__(self):
+        await self.gate._wait(self.rank)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.gate.limiter.__aexit__(*exc)
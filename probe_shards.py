@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Проверка VATS в нескольких процессах.
+
+Один цикл событий упирается в одно ядро процессора задолго до пропускной
+способности сети: разбор ответов, рукопожатия и вывод в консоль выполняются
+в том же потоке. Здесь уникальные кандидаты делятся на N частей, каждую
+проверяет отдельный процесс со своим циклом событий, сессией aiohttp и
+проверками TCP и протокола. Процессы не пишут в консоль и в хранилище:
+каждый результат (вызов record_probe) и событие вывода передаются через
+очередь в родительский процесс, который ведёт хранилище, метрики и вывод.
+"""
+
+import asyncio
+import multiprocessing
+import queue
+import time
+from dataclasses import replace
+
+from output import QUIET, output
+from probe_controller import PriorityGate
+
+# Ожидание сообщений от процессов за один вызов, секунды
+POLL_INTERVAL = 0.5
+# Меньше кандидатов на процесс не окупают запуск интерпретатора (~1-2 с)
+MIN_PER_PROCESS = 200
+
+
+def shard_count(candidates, processes):
+    """Сколько процессов имеет смысл запускать (меньше 2 - проверка в текущем)."""
+    return min(processes, candidates // MIN_PER_PROCESS)
+
+
+def split(items, shards):
+    """Раздача по кругу: порядок приоритета сохраняется внутри каждой части."""
+    return [items[i::shards] for i in range(shards)]
+
+
+class _QueueStore:
+    """Замена ProxyStore в процессе-обработчике: результаты уходят в очередь."""
+
+    def __init__(self, results):
+        self.results = results
+
+    def record_probe(self, proxy, ok, latency=None, protocol=None):
+        self.results.put(("probe", proxy, ok, latency, protocol))
+
+    def close(self):
+        pass
+
+
+class _QueueEvents:
+    """События вывода процесса-обработчика (см. output.Output.events)."""
+
+    def __init__(self, results):
+        self.results = results
+
+    def emit(self, event):
+        self.results.put(("event", event))
+
+
+def _worker(config, items, results, stop, events):
+    asyncio.run(_work(config, items, results, stop, events))
+
+
+async def _work(config, items, results, stop, events):
+    # Импорт здесь: use_proxy_api сам импортирует этот модуль
+    import use_proxy_api
+
+    output.configure(QUIET, _QueueEvents(results) if events else None)
+    finder = use_proxy_api.RussianProxyFinder(config)
+    await finder.start_probing()
+    finder.store = _QueueStore(results)
+    gate = PriorityGate(finder.probe_limiter())
+    # items идут в порядке приоритета (см. split)
+    tasks = [asyncio.ensure_future(finder.check_candidate(proxy, gate.slot(rank), hints))
+             for rank, (proxy, hints) in enumerate(items)]
+    try:
+        pending = set(tasks)
+        while pending and not stop.is_set():
+            _, pending = await asyncio.wait(pending, timeout=POLL_INTERVAL)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await gate.close()
+        stats = {
+            "prefilter": dict(finder.connect_checker.stats) if finder.connect_checker else {},
+            "protocols": dict(finder.protocol_detector.stats) if finder.protocol_detector else {},
+        }
+        results.put(("done", finder.metrics.probe_state(), stats))
+        await finder.close()
+
+
+def _drain(results, timeout):
+    """Все накопившиеся сообщения; ждёт первое не дольше timeout."""
+    try:
+        messages = [results.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    while True:
+        try:
+            messages.append(results.get_nowait())
+        except queue.Empty:
+            return messages
+
+
+async def check_sharded(finder, candidates, processes, limit=None):
+    """Проверка кандидатов в processes процессах; рабочие прокси в порядке нахождения.
+
+    При заданном limit процессы останавливаются после limit рабочих прокси.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    stop = context.Event()
+    # Кэши, хранилище и отчёты ведёт только родительский процесс
+    worker_config = replace(finder.config, use_store=False, use_geo_cache=False, use_source_cache=False,
+                            metrics_json="", metrics_prometheus=None, parse_processes=0, probe_processes=0)
+    items = [(proxy, finder.protocol_hints(proxy)) for proxy in candidates]
+    events = output.events is not None
+    workers = [context.Process(target=_worker, args=(worker_config, shard, results, stop, events), daemon=True)
+               for shard in split(items, processes) if shard]
+    output.info(f"[blue]Проверка {len(candidates)} прокси в {len(workers)} процессах "
+                f"(до {finder.config.probe_concurrency} одновременных проверок в каждом)...")
+    for worker in workers:
+        worker.start()
+    output.start("probe", total=len(candidates), label="Проверка VATS")
+
+    loop = asyncio.get_running_loop()
+    working = []
+    finished = 0
+    try:
+        while finished < len(workers):
+            messages = await loop.run_in_executor(None, _drain, results, POLL_INTERVAL)
+            if not messages and not any(worker.is_alive() for worker in workers):
+                output.result("[red]Процессы проверки завершились, не передав результаты")
+                break
+            for message in messages:
+                if message[0] == "event":
+                    if output.events is not None:
+                        output.events.emit(message[1])
+                    continue
+                if message[0] == "done":
+                    _, state, stats = message
+                    finished += 1
+                    finder.metrics.merge_probe_state(state)
+                    for name, target in (("prefilter", finder.connect_checker),
+                                         ("protocols", finder.protocol_detector)):
+                        if target:
+                            for key, value in stats[name].items():
+                                target.stats[key] = target.stats.get(key, 0) + value
+                    continue
+                _, proxy, ok, latency, protocol = message
+                if protocol:
+                    finder.protocols[proxy] = protocol
+                if finder.store:
+                    finder.store.record_probe(proxy, ok, latency, protocol)
+                output.advance("probe", ok=int(ok))
+                if not ok or (limit and len(working) >= limit):
+                    continue
+                finder.metrics.mark_result()
+                working.append(proxy)
+                output.detail(f"[bold green]✅ Прокси {proxy} ({protocol or 'http'}) успешно открывает форму входа VATS!")
+                output.event("working", proxy=proxy, protocol=protocol or "http")
+                if limit and len(working) >= limit:
+                    output.info(f"[bold green]Найдено {limit} рабочих прокси, остальные проверки отменены")
+                    stop.set()
+    finally:
+        output.finish("probe")
+        stop.set()
+        deadline = time.monotonic() + 5
+        for worker in workers:
+            worker.join(max(0, deadline - time.monotonic()))
+            if worker.is_alive():
+                worker.terminate()
+        results.close()
+    return working
@@ -10,34 +10,53 @@ import json
 import os
 import random
 import webbrowser
-import requests
 import aiohttp
-import urllib3
 from rich.console import Console
 from rich.table import Table
 import time
+from proxy_store import ProxyStore
+from proxy_protocols import url_scheme
+from proxy_gateway import LOCAL_HOST, ProxyGateway
+from target_checks import VATS_TARGET, TargetChecker, matrix_table
+from vats_prober import VatsProber
 
 console = Console()
 
-# Отключаем предупреждения о незащищенных HTTPS запросах
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
 # Конфигурация
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 PROXY_FILE = os.path.join(DATA_DIR, "async_ru_proxies.json")
+STORE_FILE = os.path.join(DATA_DIR, "proxies.sqlite3")
 VATS_URL = "https://vats290368.megapbx.ru/#/"
 
-# Порт для локального прокси-сервера
+# Порт для локального прокси-сервера (proxy_gateway)
 LOCAL_PORT = 8080
 
+# Одновременных проверок при поиске первого рабочего прокси (обычно хватает на весь список)
+RACE_CONCURRENCY = 100
+# Таймаут проверки одного прокси, секунды
+RACE_TIMEOUT = 10
+
 class ProxyBrowser:
     def __init__(self):
+        self.store = ProxyStore(STORE_FILE) if os.path.exists(STORE_FILE) else None
         self.proxies = self.load_proxies()
         self.current_proxy = None
     
     def load_proxies(self):
-        """Загрузка найденных прокси из файла"""
+        """Загрузка найденных прокси из хранилища или файла"""
+        if self.store:
+            # Лучшие по оценке и задержке прокси идут первыми
+            return [
+                {
+                    "proxy": record["proxy"],
+                    "protocol": record["protocol"],
+                    "latency": round(record["latency_ewma"] or 0, 3),
+                    "vats_access": True,
+                }
+                for record in self.store.working()
+            ]
+
         if not os.path.exists(PROXY_FILE):
             console.print("[red]Ошибка: Файл с прокси не найден. Сначала запустите use_proxy_api.py для поиска прокси.")
             return []
@@ -83,37 +102,32 @@ class ProxyBrowser:
         
         console.print(table)
 
-    def open_in_browser(self, proxy_idx=None):
-        """Открытие браузера с прокси"""
-        if not self.select_proxy(proxy_idx):
-            return
+    def open_in_browser(self, proxy_idx=None, verified=False):
+        """Открытие браузера с прокси
+
+        verified=True - открыть уже проверенный текущий прокси (после find_working_proxy).
+        """
+        if not (verified and self.current_proxy):
+            if not self.select_proxy(proxy_idx):
+                return
+            # Проверяем VATS и популярные сайты через одно соединение с прокси
+            console.print(f"[yellow]Проверяем прокси {self.current_proxy['proxy']}...")
+            check, = asyncio.run(self.check_targets([self.current_proxy]))
+            console.print(matrix_table([check]))
+            if not check.passed(VATS_TARGET):
+                console.print(f"[red]Прокси {self.current_proxy['proxy']} не открывает VATS")
+                return
 
         # Настройка прокси
         proxy_info = self.current_proxy
-        proxy_url = f"{proxy_info['protocol']}://{proxy_info['proxy']}"
-        
-        # Проверяем работоспособность прокси
-        try:
-            console.print(f"[yellow]Проверяем прокси {proxy_url}...")
-            proxies = {
-                "http": proxy_url,
-                "https": proxy_url
-            }
-            response = requests.get("https://www.yandex.ru", proxies=proxies, timeout=5, verify=False)
-            if response.status_code == 200:
-                console.print(f"[green]Прокси {proxy_url} работает!")
-            else:
-                console.print(f"[red]Прокси {proxy_url} вернул код {response.status_code}")
-                return
-        except Exception as e:
-            console.print(f"[red]Ошибка при проверке прокси: {str(e)}")
-            return
+        proxy_url = f"{url_scheme(proxy_info['protocol'])}://{proxy_info['proxy']}"
+        console.print(f"[green]Прокси {proxy_url} работает!")
 
         # Выводим инструкцию по настройке прокси в браузере
         console.print("\n[bold green]Для использования этого прокси в браузере:")
         console.print(f"1. Настройте свой браузер для использования прокси: [bold blue]{proxy_url}[/bold blue]")
         
-        if proxy_info['protocol'] == 'http':
+        if url_scheme(proxy_info['protocol']) == 'http':
             console.print("2. Для Chrome: Настройки -> Дополнительные -> Система -> Открыть настройки прокси")
             console.print("   Для Firefox: Настройки -> Общие -> Параметры сети -> Настроить")
         else:  # SOCKS4/SOCKS5
@@ -126,40 +140,124 @@ class ProxyBrowser:
         # Выводим список доступных прокси
         console.print("\n[bold]Список всех доступных прокси с доступом к VATS:")
         for i, proxy in enumerate(self.proxies):
-            console.print(f"{i+1}. {proxy['protocol']}://{proxy['proxy']} - Задержка: {proxy['latency']}с")
+            console.print(f"{i+1}. {url_scheme(proxy['protocol'])}://{proxy['proxy']} - Задержка: {proxy['latency']}с")
+
+    def record_result(self, proxy, ok, latency=None):
+        """Сохранение результата проверки в хранилище (запись - в flush_results)"""
+        if self.store:
+            self.store.record_probe(proxy["proxy"], ok, latency, proxy.get("protocol"))
+
+    def flush_results(self):
+        """Запись накопленных результатов проверок - один раз после серии проверок"""
+        if self.store:
+            self.store.flush()
+
+    async def race_proxies(self, proxies=None, timeout=RACE_TIMEOUT, concurrency=RACE_CONCURRENCY):
+        """Первый прокси, открывший форму входа VATS, или None.
+
+        Прокси проверяются одновременно; слоты выдаются в порядке прошлой
+        задержки, поэтому быстрые прокси проверяются первыми. Как только
+        один прокси прошёл проверку, остальные проверки отменяются.
+        """
+        # Прокси без измеренной задержки - в конце
+        candidates = sorted(proxies or self.proxies, key=lambda proxy: proxy.get("latency") or float("inf"))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async with VatsProber(limit=concurrency, timeout=timeout) as prober:
+            async def attempt(proxy):
+                async with semaphore:
+                    started = time.monotonic()
+                    ok = await prober.probe(proxy["proxy"], protocol=proxy.get("protocol"))
+                    return proxy, ok is not None, time.monotonic() - started
+
+            tasks = [asyncio.ensure_future(attempt(proxy)) for proxy in candidates]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    proxy, ok, latency = await next_done
+                    self.record_result(proxy, ok, latency if ok else None)
+                    if ok:
+                        proxy["latency"] = round(latency, 3)
+                        return proxy
+                return None
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                self.flush_results()
+
+    async def check_targets(self, proxies=None, timeout=RACE_TIMEOUT, concurrency=RACE_CONCURRENCY):
+        """Проверка прокси на VATS и популярных российских сайтах (target_checks).
+
+        Все сайты проверяются через одно соединение с прокси (для CONNECT и
+        SOCKS - по туннелю на сайт). Результат проверки VATS сохраняется в
+        хранилище, как и в race_proxies.
+        """
+        proxies = proxies or self.proxies
+        checker = TargetChecker(timeout=timeout)
+        checks = await checker.check_many([(proxy["proxy"], proxy.get("protocol")) for proxy in proxies],
+                                          concurrency=concurrency)
+        for proxy, check in zip(proxies, checks):
+            vats = check.results[VATS_TARGET]
+            self.record_result(proxy, vats.ok, vats.latency if vats.ok else None)
+            if vats.ok:
+                proxy["latency"] = vats.latency
+        self.flush_results()
+        return checks
 
-    def test_all_proxies_sequentially(self):
-        """Последовательно проверить все прокси, пока не найдется рабочий"""
+    def show_target_matrix(self):
+        """Проверка всех прокси на VATS и популярных сайтах с таблицей результатов"""
+        if not self.proxies:
+            console.print("[red]Нет доступных прокси!")
+            return
+        console.print(f"[bold yellow]Проверяем {len(self.proxies)} прокси на VATS и популярных сайтах...")
+        started = time.monotonic()
+        checks = asyncio.run(self.check_targets())
+        console.print(matrix_table(checks, title="Доступность сайтов через прокси"))
+        console.print(f"[bold]Все сайты открывают {sum(check.passed() for check in checks)} из {len(checks)} прокси "
+                      f"(проверка заняла {time.monotonic() - started:.1f}с)")
+
+    def find_working_proxy(self):
+        """Найти первый рабочий прокси параллельной проверкой всех сохранённых прокси"""
         if not self.proxies:
             console.print("[red]Нет доступных прокси!")
             return False
-        
-        console.print("[bold yellow]Последовательно проверяем все прокси, пока не найдем рабочий...")
-        
-        for idx, proxy in enumerate(self.proxies):
-            proxy_url = f"{proxy['protocol']}://{proxy['proxy']}"
-            console.print(f"[yellow]Проверка прокси #{idx+1}: {proxy_url}...")
-            
-            try:
-                proxies = {
-                    "http": proxy_url,
-                    "https": proxy_url
-                }
-                response = requests.get("https://vats290368.megapbx.ru/#/", proxies=proxies, timeout=10, verify=False)
-                if response.status_code in [200, 301, 302]:
-                    console.print(f"[bold green]✅ Прокси {proxy_url} работает для доступа к VATS!")
-                    self.current_proxy = proxy
-                    return True
-                else:
-                    console.print(f"[red]❌ Прокси вернул код {response.status_code}")
-            except Exception as e:
-                console.print(f"[red]❌ Ошибка: {str(e)}")
-            
-            # Небольшая пауза между запросами
-            time.sleep(1)
-        
-        console.print("[bold red]❌ Не найдено рабочих прокси для доступа к VATS!")
-        return False
+
+        console.print(f"[bold yellow]Одновременно проверяем {len(self.proxies)} прокси до первого рабочего...")
+        started = time.monotonic()
+        proxy = asyncio.run(self.race_proxies())
+        if proxy is None:
+            console.print("[bold red]❌ Не найдено рабочих прокси для доступа к VATS!")
+            return False
+
+        console.print(f"[bold green]✅ Прокси {url_scheme(proxy.get('protocol'))}://{proxy['proxy']} работает для доступа к VATS! "
+                      f"(задержка {proxy['latency']}с, поиск занял {time.monotonic() - started:.1f}с)")
+        self.current_proxy = proxy
+        return True
+
+    def run_gateway(self, port=LOCAL_PORT):
+        """Локальный прокси-сервер на port поверх всех рабочих прокси (до Ctrl+C)"""
+        if not self.proxies:
+            console.print("[red]Нет доступных прокси!")
+            return
+
+        gateway = ProxyGateway(self.proxies, port, record=self.record_result, flush=self.flush_results)
+        proxy_url = f"http://{LOCAL_HOST}:{port}"
+        console.print(f"[bold green]Локальный прокси {proxy_url} запущен поверх {len(self.proxies)} прокси")
+        console.print(f"Настройте браузер на HTTP-прокси [bold blue]{proxy_url}[/bold blue] (для HTTP и HTTPS) "
+                      "- при сбое прокси запросы автоматически переключаются на следующий")
+        console.print("[yellow]Остановка: Ctrl+C")
+        webbrowser.open(VATS_URL)
+        try:
+            asyncio.run(gateway.serve_forever())
+        except KeyboardInterrupt:
+            pass
+        except OSError as e:
+            console.print(f"[red]Не удалось запустить локальный прокси на порту {port}: {e}")
+            return
+        stats = gateway.stats
+        console.print(f"[bold]Запросов: {stats['requests']}, туннелей: {stats['tunnels']}, "
+                      f"переключений на другой прокси: {stats['failovers']}, отказов: {stats['failed']}, "
+                      f"исключено прокси: {stats['ejected']}")
 
 def main():
     proxy_browser = ProxyBrowser()
@@ -172,9 +270,11 @@ def main():
     console.print("\n[bold]Выберите действие:")
     console.print("1. Открыть VATS через случайный прокси")
     console.print("2. Выбрать конкретный прокси")
-    console.print("3. Последовательно проверить все прокси до первого рабочего")
+    console.print("3. Найти первый рабочий прокси (все прокси проверяются одновременно)")
+    console.print(f"4. Запустить локальный прокси на порту {LOCAL_PORT} (все рабочие прокси с автоматическим переключением)")
+    console.print("5. Проверить все прокси на VATS и популярных российских сайтах")
     
-    choice = input("\nВаш выбор (1, 2 или 3): ")
+    choice = input("\nВаш выбор (1-5): ")
     
     if choice == "1":
         proxy_browser.open_in_browser()
@@ -182,10 +282,14 @@ def main():
         proxy_idx = int(input(f"\nВведите номер прокси (1-{len(proxy_browser.proxies)}): ")) - 1
         proxy_browser.open_in_browser(proxy_idx)
     elif choice == "3":
-        # Автоматически перебираем все прокси
-        if proxy_browser.test_all_proxies_sequentially():
+        # Проверяем все прокси одновременно, берём первый рабочий
+        if proxy_browser.find_working_proxy():
             # Если нашли рабочий прокси, открываем VATS
-            proxy_browser.open_in_browser(None) # Используем текущий прокси
+            proxy_browser.open_in_browser(verified=True)
+    elif choice == "4":
+        proxy_browser.run_gateway()
+    elif choice == "5":
+        proxy_browser.show_target_matrix()
     else:
         console.print("[red]Неверный выбор!")
 
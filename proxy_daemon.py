@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Режим демона: постоянное поддержание пула рабочих прокси.
+
+Вместо полного цикла «собрать всё - проверить всё» демон держит пул в памяти:
+- каждый источник опрашивается по своему расписанию (интервал обновления
+  из реестра источников или общий source_interval) условными запросами;
+- новые кандидаты сразу проходят геолокацию и попадают в пул;
+- живые прокси перепроверяются адаптивно: после успешной проверки интервал
+  удваивается (до recheck_max), после неудачной сбрасывается до recheck_min;
+- прокси, проваливший expire_after проверок подряд, удаляется из пула;
+- актуальный снимок рабочих прокси атомарно записывается в JSON.
+"""
+
+import asyncio
+import heapq
+import json
+import os
+import random
+import time
+
+from output import output
+
+# Сколько секунд не возвращаться к отклонённым кандидатам (не Россия или удалённые)
+REJECT_TTL = 6 * 3600
+
+
+class PoolEntry:
+    __slots__ = ("proxy", "interval", "next_check", "failures", "successes",
+                 "latency", "working", "last_checked", "in_flight", "hints")
+
+    def __init__(self, proxy, interval, latency=None, working=False, hints=None):
+        self.proxy = proxy
+        # Протоколы, заявленные источниками прокси (finder.protocol_hints)
+        self.hints = hints or []
+        self.interval = interval
+        self.next_check = time.monotonic()
+        self.failures = 0
+        self.successes = 0
+        self.latency = latency
+        self.working = working
+        self.last_checked = None
+        self.in_flight = False
+
+
+def _jitter(seconds):
+    """Разброс ±10%, чтобы проверки и опросы источников не шли залпами."""
+    return seconds * random.uniform(0.9, 1.1)
+
+
+class ProxyDaemon:
+    def __init__(self, finder, snapshot_path, source_interval=None, source_intervals=None,
+                 recheck_min=60, recheck_max=1800, expire_after=3, snapshot_every=10):
+        self.finder = finder
+        self.snapshot_path = snapshot_path
+        # Общий интервал опроса (None - интервал обновления каждого источника)
+        self.source_interval = source_interval
+        # Индивидуальные интервалы опроса: имя источника -> секунды
+        self.source_intervals = source_intervals or {}
+        self.recheck_min = recheck_min
+        self.recheck_max = recheck_max
+        self.expire_after = expire_after
+        self.snapshot_every = snapshot_every
+
+        self.pool = {}
+        self.rejected = {}
+        self._schedule = []
+        self._tasks = set()
+        self._dirty = False
+        # Будит цикл перепроверки, когда в расписание добавлена новая проверка
+        self._wakeup = asyncio.Event()
+        self._probe_semaphore = finder.probe_limiter()
+        self._geo_semaphore = asyncio.Semaphore(finder.config.geo_workers)
+        self.stats = {"scrapes": 0, "candidates": 0, "admitted": 0, "checks": 0, "expired": 0}
+
+    # --- Пул ---
+
+    def _schedule_check(self, entry, delay=0):
+        entry.next_check = time.monotonic() + delay
+        heapq.heappush(self._schedule, (entry.next_check, entry.proxy))
+        self._wakeup.set()
+
+    def admit(self, proxy, latency=None, working=False, hints=None):
+        """Добавление прокси в пул с немедленной проверкой."""
+        if proxy in self.pool:
+            return
+        entry = PoolEntry(proxy, self.recheck_min, latency, working, hints)
+        self.pool[proxy] = entry
+        self.stats["admitted"] += 1
+        self._schedule_check(entry)
+
+    def _reject(self, proxy):
+        self.rejected[proxy] = time.monotonic() + REJECT_TTL
+
+    def _is_rejected(self, proxy):
+        until = self.rejected.get(proxy)
+        if until is None:
+            return False
+        if until < time.monotonic():
+            del self.rejected[proxy]
+            return False
+        return True
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # --- Фоновые циклы ---
+
+    async def _source_loop(self, name, fetch, refresh=1800):
+        interval = self.source_intervals.get(name) or self.source_interval or refresh
+        # Разносим первые опросы, чтобы источники не стартовали одновременно
+        await asyncio.sleep(random.uniform(0, min(5, interval)))
+        while True:
+            await self.finder.run_source(name, fetch)
+            self.stats["scrapes"] += 1
+            await asyncio.sleep(_jitter(interval))
+
+    async def _intake_loop(self):
+        queue = self.finder._candidates
+        while True:
+            proxy, russian = await queue.get()
+            self.stats["candidates"] += 1
+            if proxy not in self.pool and not self._is_rejected(proxy):
+                # Источники прокси известны, пока он в списках поиска (finder.pool)
+                hints = self.finder.protocol_hints(proxy)
+                if russian:
+                    self.admit(proxy, hints=hints)
+                else:
+                    self._spawn(self._geolocate(proxy, hints))
+            if queue.empty():
+                # Все кандидаты из очереди разобраны, списки поиска в демоне больше не нужны
+                self.finder.pool.clear()
+
+    async def _geolocate(self, proxy, hints=None):
+        async with self._geo_semaphore:
+            if proxy in self.pool:
+                return
+            if await self.finder.check_proxy_country(proxy):
+                self.admit(proxy, hints=hints)
+            else:
+                self._reject(proxy)
+
+    async def _recheck_loop(self):
+        while True:
+            now = time.monotonic()
+            while self._schedule and self._schedule[0][0] <= now:
+                due, proxy = heapq.heappop(self._schedule)
+                entry = self.pool.get(proxy)
+                # Устаревшие записи расписания (прокси удалён или перенесён) пропускаем
+                if entry is None or entry.next_check != due or entry.in_flight:
+                    continue
+                entry.in_flight = True
+                self._spawn(self._check(entry))
+            delay = self._schedule[0][0] - now if self._schedule else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=None if delay is None else max(delay, 0.01))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, entry):
+        try:
+            started = time.monotonic()
+            hints = self.finder.protocol_hints(entry.proxy)
+            hints += [protocol for protocol in entry.hints if protocol not in hints]
+            ok = await self.finder.check_candidate(entry.proxy, self._probe_semaphore, hints)
+            entry.last_checked = time.time()
+            self.stats["checks"] += 1
+            if ok:
+                entry.latency = time.monotonic() - started
+                entry.successes += 1
+                entry.failures = 0
+                entry.interval = min(entry.interval * 2, self.recheck_max)
+            else:
+                entry.failures += 1
+                entry.interval = self.recheck_min
+                if entry.failures >= self.expire_after:
+                    del self.pool[entry.proxy]
+                    self.finder.protocols.pop(entry.proxy, None)
+                    self._reject(entry.proxy)
+                    self.stats["expired"] += 1
+                    self._dirty = self._dirty or entry.working
+                    return
+            self._dirty = self._dirty or entry.working != bool(ok)
+            entry.working = bool(ok)
+            self._schedule_check(entry, _jitter(entry.interval))
+        finally:
+            entry.in_flight = False
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_every)
+            if self._dirty:
+                self._dirty = False
+                self.write_snapshot()
+            if self.finder.store:
+                self.finder.store.flush()
+
+    # --- Снимок ---
+
+    def working(self):
+        entries = [e for e in self.pool.values() if e.working]
+        entries.sort(key=lambda e: e.latency or 0)
+        return entries
+
+    def write_snapshot(self):
+        """Атомарная запись рабочих прокси (формат data/async_ru_proxies.json)."""
+        snapshot = {
+            "updated": time.time(),
+            "proxies": [
+                {
+                    "proxy": entry.proxy,
+                    "protocol": self.finder.protocols.get(entry.proxy, "http"),
+                    "latency": round(entry.latency or 0, 3),
+                    "vats_access": True,
+                    "last_checked": entry.last_checked,
+                }
+                for entry in self.working()
+            ],
+        }
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.snapshot_path)
+        output.info(f"[dim]Снимок пула: {len(snapshot['proxies'])} рабочих прокси из {len(self.pool)} "
+                      f"(проверок {self.stats['checks']}, удалено {self.stats['expired']})")
+
+    async def run(self):
+        """Работа до отмены (Ctrl+C)."""
+        self.finder._candidates = asyncio.Queue()
+        # Тёплый старт: прокси, работавшие при прошлых запусках
+        if self.finder.store:
+            for record in self.finder.store.working():
+                self.admit(record["proxy"], record["latency_ewma"], working=True)
+
+        loops = [self._intake_loop(), self._recheck_loop(), self._snapshot_loop()]
+        # Кэш ответов не заменяет опрос по расписанию: каждый раз отправляется условный запрос
+        refresh = {source.name: source.refresh for source in self.finder.source_registry}
+        sources = self.finder.sources(max_age=0)
+        loops += [self._source_loop(name, fetch, refresh.get(name, 1800)) for name, fetch in sources.items()]
+        output.info(f"[bold]Демон запущен: {len(sources)} источников, "
+                      f"в пуле {len(self.pool)} прокси")
+        try:
+            await asyncio.gather(*loops)
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self.finder._candidates = None
+            self.write_snapshot()
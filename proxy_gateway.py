@@ -0,0 +1,509 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Локальный прокси-сервер (HTTP и CONNECT) поверх проверенных прокси.
+
+Браузер настраивается один раз на 127.0.0.1:LOCAL_PORT, а шлюз сам
+распределяет запросы между рабочими прокси: запрос уходит через прокси
+с наименьшей ожидаемой задержкой с учётом числа его текущих запросов.
+Если соединение с прокси или чтение ответа не удалось, запрос незаметно
+для браузера повторяется через следующий прокси: для CONNECT - пока
+туннель не установлен, для обычных запросов - пока браузер не получил ни
+одного байта ответа (неидемпотентные запросы, например POST, после
+отправки не повторяются). Соединения с прокси переиспользуются
+(keep-alive).
+
+Прокси, не ответивший EJECT_AFTER раз подряд, исключается из ротации.
+Фоновая задача раз в HEALTH_INTERVAL секунд проверяет все прокси через
+VatsProber: неработающие исключаются, восстановившиеся возвращаются.
+
+HTTP-прокси проверен только на обычных запросах и может не поддерживать
+CONNECT. Неудачные туннели через него считаются отдельно: после
+EJECT_AFTER неудач подряд он перестаёт выбираться для CONNECT, но остаётся
+в ротации для обычных запросов. Фоновая проверка пробует такой прокси и
+через CONNECT и, если туннель заработал, возвращает его для туннелей.
+"""
+
+import asyncio
+import time
+from collections import Counter, deque
+from urllib.parse import urlsplit
+
+from output import output
+from proxy_protocols import IDEMPOTENT, open_tunnel
+from proxy_store import LATENCY_ALPHA
+from vats_prober import VatsProber
+
+LOCAL_HOST = "127.0.0.1"
+# Сколько прокси пробовать для одного запроса
+MAX_ATTEMPTS = 3
+# Таймаут соединения с прокси (вместе с рукопожатием), секунды
+CONNECT_TIMEOUT = 5
+# Таймаут ожидания ответа и каждого чтения тела, секунды
+READ_TIMEOUT = 20
+# Сколько держать неиспользуемое соединение с прокси (и с браузером), секунды
+IDLE_TIMEOUT = 30
+# Свободных соединений не больше на прокси (и на цель туннеля)
+MAX_IDLE = 8
+# Неудач подряд до исключения прокси
+EJECT_AFTER = 2
+# Интервал и таймаут фоновой проверки прокси, секунды
+HEALTH_INTERVAL = 60
+HEALTH_TIMEOUT = 10
+HEALTH_CONCURRENCY = 50
+CHUNK = 64 * 1024
+
+# Заголовки, относящиеся к одному соединению, а не к запросу
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-connection", "proxy-authorization",
+              "proxy-authenticate", "te", "trailer", "upgrade"}
+
+
+class Upstream:
+    """Прокси в ротации шлюза: задержка, нагрузка, неудачи и свободные соединения."""
+
+    def __init__(self, info):
+        # Запись из ProxyBrowser.proxies (proxy, protocol, latency)
+        self.info = info
+        self.proxy = info["proxy"]
+        self.protocol = info.get("protocol") or "http"
+        self.latency = info.get("latency") or 1.0
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected = False
+        # Поддержка CONNECT: True для connect и SOCKS, для HTTP-прокси неизвестна (None)
+        # до первого туннеля; False - туннели не удались EJECT_AFTER раз подряд
+        self.supports_connect = None if self.protocol == "http" else True
+        self.tunnel_failures = 0
+        # Свободные соединения: ключ (None для HTTP-прокси, (host, port) для туннеля)
+        self.idle = {}
+
+    def cost(self):
+        """Ожидаемое время ответа: задержка с поправкой на текущие запросы."""
+        return self.latency * (self.in_flight + 1)
+
+    def observe(self, latency):
+        self.latency += LATENCY_ALPHA * (latency - self.latency)
+        self.failures = 0
+
+    def take(self, key):
+        """Свободное соединение для key или None."""
+        pool = self.idle.get(key)
+        while pool:
+            reader, writer, since = pool.pop()
+            if time.monotonic() - since < IDLE_TIMEOUT and not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    def put(self, key, reader, writer):
+        pool = self.idle.setdefault(key, deque())
+        if len(pool) >= MAX_IDLE:
+            writer.close()
+            return
+        pool.append((reader, writer, time.monotonic()))
+
+    def close_idle(self):
+        for pool in self.idle.values():
+            for _, writer, _ in pool:
+                writer.close()
+        self.idle.clear()
+
+
+def _split_host_port(authority, default_port):
+    host, sep, port = authority.rpartition(":")
+    if not sep or not port.isdigit():
+        return authority.strip("[]"), default_port
+    return host.strip("[]"), int(port)
+
+
+async def _read_head(reader, timeout):
+    """Стартовая строка и заголовки HTTP-сообщения."""
+    data = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+    lines = data.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers.append((name.strip(), value.strip()))
+    return lines[0], headers
+
+
+def _header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _keep_alive(version, headers):
+    connection = (_header(headers, "connection") or _header(headers, "proxy-connection") or "").lower()
+    if version == "HTTP/1.0":
+        return "keep-alive" in connection
+    return "close" not in connection
+
+
+def _serialize(start_line, headers, connection):
+    lines = [start_line]
+    lines.extend(f"{name}: {value}" for name, value in headers if name.lower() not in HOP_BY_HOP)
+    lines.append(f"Connection: {connection}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _relay_exactly(reader, writer, size):
+    while size > 0:
+        data = await asyncio.wait_for(reader.read(min(size, CHUNK)), READ_TIMEOUT)
+        if not data:
+            raise asyncio.IncompleteReadError(b"", size)
+        writer.write(data)
+        await writer.drain()
+        size -= len(data)
+
+
+async def _relay_chunked(reader, writer):
+    while True:
+        line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+        writer.write(line)
+        size = int(line.split(b";", 1)[0].strip() or b"0", 16)
+        if size == 0:
+            # Завершающие заголовки до пустой строки
+            while line not in (b"\r\n", b"\n", b""):
+                line = await asyncio.wait_for(reader.readline(), READ_TIMEOUT)
+                writer.write(line)
+            await writer.drain()
+            return
+        await _relay_exactly(reader, writer, size + 2)
+
+
+async def _copy(reader, writer, timeout=None):
+    """Передача данных до конца потока; timeout - на каждое чтение."""
+    try:
+        while True:
+            data = await asyncio.wait_for(reader.read(CHUNK), timeout)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, OSError, asyncio.TimeoutError):
+        pass
+    finally:
+        try:
+            if writer.can_write_eof():
+                writer.write_eof()
+        except OSError:
+            pass
+
+
+class ProxyGateway:
+    def __init__(self, proxies, port, host=LOCAL_HOST, vats_url=None, record=None, flush=None,
+                 health_interval=HEALTH_INTERVAL):
+        self.upstreams = [Upstream(info) for info in proxies]
+        self.host = host
+        self.port = port
+        self.vats_url = vats_url
+        # record(info, ok, latency) - результат фоновой проверки (ProxyBrowser.record_result)
+        self.record = record
+        # flush() - после фоновой проверки всех прокси (ProxyBrowser.flush_results)
+        self.flush = flush
+        self.health_interval = health_interval
+        self.stats = Counter()
+        self.server = None
+        self._health_task = None
+        self._clients = set()
+
+    # --- Выбор прокси ---
+
+    def candidates(self, tunnel=False):
+        """Прокси для очередной попытки: каждый раз лучший из ещё не опробованных.
+
+        tunnel=True - только прокси, которые могут поддерживать CONNECT.
+        """
+        upstreams = [upstream for upstream in self.upstreams if not tunnel or upstream.supports_connect is not False]
+        healthy = [upstream for upstream in upstreams if not upstream.ejected]
+        # Если исключены все, лучше попробовать их, чем сразу отказать
+        pool = healthy or upstreams
+        for _ in range(min(MAX_ATTEMPTS, len(pool))):
+            upstream = min(pool, key=Upstream.cost)
+            pool.remove(upstream)
+            yield upstream
+
+    def _failed(self, upstream, error):
+        upstream.failures += 1
+        self.stats["upstream_errors"] += 1
+        output.detail(f"[red]❌ Прокси {upstream.proxy}: {type(error).__name__}: {str(error)[:50]}")
+        if upstream.failures >= EJECT_AFTER and not upstream.ejected:
+            self.eject(upstream)
+
+    def _tunnel_failed(self, upstream, error):
+        """Неудачный туннель через HTTP-прокси: не повод исключать его из обычных запросов."""
+        upstream.tunnel_failures += 1
+        self.stats["tunnel_errors"] += 1
+        output.detail(f"[red]❌ Туннель через {upstream.proxy}: {type(error).__name__}: {str(error)[:50]}")
+        if upstream.tunnel_failures >= EJECT_AFTER and upstream.supports_connect is not False:
+            upstream.supports_connect = False
+            self.stats["no_connect"] += 1
+            output.info(f"[yellow]Прокси {upstream.proxy} не поддерживает CONNECT - только обычные запросы")
+
+    def _tunnel_ok(self, upstream):
+        if upstream.supports_connect is False:
+            output.info(f"[green]Прокси {upstream.proxy} снова используется для CONNECT")
+        upstream.supports_connect = True
+        upstream.tunnel_failures = 0
+
+    def eject(self, upstream):
+        upstream.ejected = True
+        upstream.close_idle()
+        self.stats["ejected"] += 1
+        output.info(f"[yellow]Прокси {upstream.proxy} исключён из ротации "
+                    f"(в работе {sum(1 for u in self.upstreams if not u.ejected)})")
+
+    def readmit(self, upstream):
+        upstream.ejected = False
+        upstream.failures = 0
+        self.stats["readmitted"] += 1
+        output.info(f"[green]Прокси {upstream.proxy} снова в ротации")
+
+    async def _open(self, upstream, host, port, tunnel):
+        """Соединение с прокси; при tunnel=True - туннель до host:port."""
+        protocol = upstream.protocol
+        if protocol == "http":
+            if not tunnel:
+                return await asyncio.wait_for(open_tunnel(upstream.proxy, "http", host, port), CONNECT_TIMEOUT)
+            # Туннель через HTTP-прокси - тот же CONNECT
+            protocol = "connect"
+        return await asyncio.wait_for(open_tunnel(upstream.proxy, protocol, host, port), CONNECT_TIMEOUT)
+
+    # --- Обработка браузера ---
+
+    async def _handle_client(self, reader, writer):
+        self._clients.add(writer)
+        try:
+            while True:
+                try:
+                    request_line, headers = await _read_head(reader, IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError,
+                        ConnectionError):
+                    return
+                parts = request_line.split()
+                if len(parts) != 3:
+                    writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    return
+                method, target, version = parts
+                if method.upper() == "CONNECT":
+                    await self._handle_connect(target, reader, writer)
+                    return
+                if not await self._handle_request(method.upper(), target, version, headers, reader, writer):
+                    return
+        except Exception as e:
+            output.detail(f"[red]Ошибка обработки запроса браузера: {type(e).__name__}: {str(e)[:50]}")
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _handle_connect(self, target, reader, writer):
+        host, port = _split_host_port(target, 443)
+        self.stats["tunnels"] += 1
+        for attempt, upstream in enumerate(self.candidates(tunnel=True)):
+            if attempt:
+                self.stats["failovers"] += 1
+            started = time.monotonic()
+            upstream.in_flight += 1
+            try:
+                try:
+                    up_reader, up_writer = await self._open(upstream, host, port, tunnel=True)
+                except Exception as e:
+                    if upstream.protocol == "http":
+                        self._tunnel_failed(upstream, e)
+                    else:
+                        self._failed(upstream, e)
+                    continue
+                if upstream.protocol == "http":
+                    self._tunnel_ok(upstream)
+                upstream.observe(time.monotonic() - started)
+                writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+                await writer.drain()
+                # Данные внутри туннеля (обычно TLS) передаются как есть
+                try:
+                    await asyncio.gather(_copy(reader, up_writer), _copy(up_reader, writer))
+                finally:
+                    up_writer.close()
+                return
+            finally:
+                upstream.in_flight -= 1
+        self.stats["failed"] += 1
+        writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+
+    async def _handle_request(self, method, target, version, headers, reader, writer):
+        """Обычный запрос с абсолютным URI; True - соединение с браузером можно продолжать."""
+        parts = urlsplit(target)
+        if parts.scheme != "http" or not parts.hostname:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            return False
+        if "chunked" in (_header(headers, "transfer-encoding") or "").lower():
+            writer.write(b"HTTP/1.1 411 Length Required\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            return False
+        body = b""
+        length = int(_header(headers, "content-length") or 0)
+        if length:
+            body = await asyncio.wait_for(reader.readexactly(length), READ_TIMEOUT)
+        client_keep = _keep_alive(version, headers)
+        host, port = parts.hostname, parts.port or 80
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        # Заголовок Expect не нужен: тело уже прочитано целиком
+        headers = [(name, value) for name, value in headers if name.lower() != "expect"]
+        self.stats["requests"] += 1
+
+        for attempt, upstream in enumerate(self.candidates()):
+            if attempt:
+                self.stats["failovers"] += 1
+            # HTTP-прокси получает абсолютный URI, туннель - путь на целевом сайте
+            key = None if upstream.protocol == "http" else (host, port)
+            request_target = target if key is None else path
+            message = _serialize(f"{method} {request_target} HTTP/1.1", headers, "keep-alive") + body
+            upstream.in_flight += 1
+            try:
+                result, sent = await self._exchange(upstream, key, host, port, method, message, writer, client_keep)
+            finally:
+                upstream.in_flight -= 1
+            if result is not None:
+                return result
+            if sent and method not in IDEMPOTENT:
+                break
+        self.stats["failed"] += 1
+        writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+        return False
+
+    async def _exchange(self, upstream, key, host, port, method, message, writer, client_keep):
+        """Запрос через один прокси: (продолжать ли соединение с браузером, отправлен ли запрос).
+
+        Вместо первого значения None - прокси не ответил и можно пробовать следующий.
+        """
+        sent = False
+        started = time.monotonic()
+        connection = upstream.take(key)
+        reused = connection is not None
+        while True:
+            try:
+                if connection is None:
+                    connection = await self._open(upstream, host, port, tunnel=key is not None)
+                up_reader, up_writer = connection
+                up_writer.write(message)
+                await up_writer.drain()
+                sent = True
+                status_line, response_headers = await _read_head(up_reader, READ_TIMEOUT)
+                while status_line.split(" ", 2)[1:2] == ["100"]:
+                    status_line, response_headers = await _read_head(up_reader, READ_TIMEOUT)
+                break
+            except Exception as e:
+                if connection is not None:
+                    connection[1].close()
+                connection = None
+                if reused:
+                    # Прокси закрыл простаивавшее соединение - это не сбой, пробуем новое
+                    reused = False
+                    sent = False
+                    continue
+                self._failed(upstream, e)
+                return None, sent
+        upstream.observe(time.monotonic() - started)
+
+        version, _, rest = status_line.partition(" ")
+        status = int(rest.split(" ", 1)[0]) if rest[:3].isdigit() else 0
+        length = _header(response_headers, "content-length")
+        chunked = "chunked" in (_header(response_headers, "transfer-encoding") or "").lower()
+        no_body = method == "HEAD" or 100 <= status < 200 or status in (204, 304)
+        # Без длины тело читается до закрытия соединения: ни прокси, ни браузеру его не переиспользовать
+        framed = no_body or chunked or length is not None
+        upstream_keep = framed and _keep_alive(version, response_headers)
+        keep = client_keep and framed
+        writer.write(_serialize(status_line, response_headers, "keep-alive" if keep else "close"))
+        try:
+            if no_body:
+                await writer.drain()
+            elif chunked:
+                await _relay_chunked(up_reader, writer)
+            elif length is not None:
+                await _relay_exactly(up_reader, writer, int(length))
+            else:
+                await _copy(up_reader, writer, READ_TIMEOUT)
+        except Exception as e:
+            # Часть ответа уже у браузера: повторить нельзя, только закрыть соединение
+            up_writer.close()
+            self._failed(upstream, e)
+            return False, sent
+        if upstream_keep:
+            upstream.put(key, up_reader, up_writer)
+        else:
+            up_writer.close()
+        return keep, sent
+
+    # --- Фоновая проверка ---
+
+    async def check_health(self, prober):
+        """Проверка всех прокси через VatsProber: исключение и возвращение в ротацию."""
+        semaphore = asyncio.Semaphore(HEALTH_CONCURRENCY)
+
+        async def check(upstream):
+            async with semaphore:
+                started = time.monotonic()
+                ok = await prober.probe(upstream.proxy, protocol=upstream.protocol) is not None
+                latency = time.monotonic() - started
+                tunnel = None
+                if ok and upstream.supports_connect is False:
+                    # Обычная проверка CONNECT не затрагивает - пробуем туннель отдельно
+                    tunnel = await prober.probe(upstream.proxy, protocol="connect") is not None
+                return upstream, ok, latency, tunnel
+
+        for upstream, ok, latency, tunnel in await asyncio.gather(*(check(u) for u in self.upstreams)):
+            if self.record:
+                self.record(upstream.info, ok, latency if ok else None)
+            if tunnel:
+                self._tunnel_ok(upstream)
+            if ok:
+                upstream.observe(latency)
+                if upstream.ejected:
+                    self.readmit(upstream)
+            elif not upstream.ejected:
+                self.eject(upstream)
+        if self.flush:
+            self.flush()
+
+    async def _health_loop(self):
+        kwargs = {"url": self.vats_url} if self.vats_url else {}
+        async with VatsProber(limit=HEALTH_CONCURRENCY, timeout=HEALTH_TIMEOUT, **kwargs) as prober:
+            while True:
+                await asyncio.sleep(self.health_interval)
+                await self.check_health(prober)
+
+    # --- Запуск ---
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self._health_task = asyncio.ensure_future(self._health_loop())
+        return self
+
+    async def close(self):
+        if self._health_task:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        if self.server:
+            self.server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self.server.wait_closed()
+            self.server = None
+        for upstream in self.upstreams:
+            upstream.close_idle()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self.server.serve_forever()
+        finally:
+            await self.close()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Программный доступ к сайтам через проверенные прокси с «подстраховкой».
+
+ProxyPool.fetch(url) отправляет запрос через лучший по оценке прокси.
+Если ответа нет дольше, чем hedge_quantile (по умолчанию p90) времени
+недавних ответов, тот же запрос дополнительно отправляется через
+следующий прокси, и берётся ответ, пришедший первым; остальные
+отменяются. Неудачная попытка сразу заменяется следующим прокси. Так
+медленный «хвост» бесплатных прокси почти не влияет на p99. Неидемпотентные
+запросы (POST и т.п.) не дублируются - только заменяются после неудачи.
+
+Пул строится по результату RussianProxyFinder.check_vats_access
+(from_finder) или по хранилищу (from_store). Каждый исход попытки
+обновляет оценку прокси в пуле и в ProxyStore; статистика вызова
+возвращается вместе с ответом (FetchResult.stats).
+
+Пример:
+    async with await ProxyPool.from_finder(finder, limit=10) as pool:
+        result = await pool.fetch("https://vats290368.megapbx.ru/")
+        print(result.status, result.proxy, result.stats.hedged)
+"""
+
+import asyncio
+import heapq
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from proxy_protocols import IDEMPOTENT, open_tunnel
+from proxy_store import LATENCY_ALPHA, compute_score
+from vats_prober import build_ssl_context
+
+# Квантиль времени ответа, после которого отправляется дублирующий запрос
+HEDGE_QUANTILE = 0.9
+# Задержка дублирующего запроса, пока ответов для квантиля мало, секунды
+DEFAULT_HEDGE_DELAY = 1.0
+MIN_HEDGE_DELAY = 0.05
+# Сколько последних ответов учитывается в квантиле и сколько нужно для его расчёта
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+# Попыток (основная, дублирующие и замены неудачных) на один вызов
+MAX_ATTEMPTS = 3
+# Одновременно выполняющихся попыток на один вызов
+MAX_PARALLEL = 2
+# Сколько байт тела читать не больше при запросе через туннель (CONNECT, SOCKS)
+MAX_TUNNEL_BODY = 16 * 1024 * 1024
+CHUNK = 64 * 1024
+# Ответы самого прокси, а не сайта
+PROXY_ERRORS = {407, 502, 503, 504}
+# Запросы, которые можно дублировать без последствий
+
+
+class ProxyPoolError(Exception):
+    """Ни одна попытка вызова не удалась."""
+
+    def __init__(self, message, stats):
+        super().__init__(message)
+        self.stats = stats
+
+
+@dataclass
+class Attempt:
+    proxy: str
+    # ok, error, http_<код>, cancelled
+    outcome: str = None
+    latency: float = None
+    hedge: bool = False
+
+
+@dataclass
+class FetchStats:
+    url: str
+    elapsed: float = None
+    # Задержка дублирующего запроса, действовавшая в этом вызове
+    hedge_delay: float = None
+    hedged: bool = False
+    # Ответ пришёл через дублирующий запрос
+    hedge_won: bool = False
+    attempts: list = field(default_factory=list)
+
+
+@dataclass
+class FetchResult:
+    status: int
+    headers: dict
+    body: bytes
+    proxy: str
+    stats: FetchStats
+
+    def text(self, encoding="utf-8"):
+        return self.body.decode(encoding, errors="replace")
+
+
+class _ProxyState:
+    def __init__(self, proxy, protocol="http", latency=None, checks=0, successes=0):
+        self.proxy = proxy
+        self.protocol = protocol or "http"
+        self.latency = latency
+        self.checks = checks
+        self.successes = successes
+        self.in_flight = 0
+
+    @property
+    def score(self):
+        return compute_score(self.successes, self.checks, self.latency)
+
+    def record(self, ok, latency=None):
+        self.checks += 1
+        if ok:
+            self.successes += 1
+            if latency is not None:
+                self.latency = latency if self.latency is None else (
+                    LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * self.latency)
+
+
+def _accept_default(status):
+    return status not in PROXY_ERRORS
+
+
+class ProxyPool:
+    def __init__(self, proxies, protocols=None, store=None, timeout=10, limit=100,
+                 hedge_quantile=HEDGE_QUANTILE, max_attempts=MAX_ATTEMPTS, accept=None):
+        protocols = protocols or {}
+        records = store.get_many(proxies) if store else {}
+        self.states = {}
+        for proxy in proxies:
+            record = records.get(proxy, {})
+            self.states[proxy] = _ProxyState(proxy, protocols.get(proxy) or record.get("protocol"),
+                                             record.get("latency_ewma"), record.get("checks", 0),
+                                             record.get("successes", 0))
+        self.store = store
+        self.timeout = timeout
+        self.limit = limit
+        self.hedge_quantile = hedge_quantile
+        self.max_attempts = max_attempts
+        # accept(status) - ответ считается успешным; по умолчанию - любой, кроме ошибок самого прокси
+        self.accept = accept or _accept_default
+        # Время успешных попыток (для задержки подстраховки) и время вызовов целиком (для сводки)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.elapsed = deque(maxlen=LATENCY_WINDOW)
+        self.totals = Counter()
+        self.ssl_context = build_ssl_context()
+        self.session = None
+
+    @classmethod
+    async def from_finder(cls, finder, limit=None, **kwargs):
+        """Пул из прокси, прошедших RussianProxyFinder.check_vats_access."""
+        working = await finder.check_vats_access(limit=limit)
+        return cls(working, finder.protocols, finder.store, **kwargs)
+
+    @classmethod
+    def from_store(cls, store, limit=None, **kwargs):
+        """Пул из прокси, открывавших VATS при последней проверке (ProxyStore.working)."""
+        records = store.working(limit)
+        return cls([record["proxy"] for record in records],
+                   {record["proxy"]: record["protocol"] for record in records}, store, **kwargs)
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=self.limit, ssl=self.ssl_context)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+        if self.store:
+            self.store.flush()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # --- Выбор прокси и задержка подстраховки ---
+
+    def best(self, count):
+        """count лучших прокси: оценка делится на число запросов, уже идущих через прокси."""
+        return heapq.nlargest(count, self.states.values(), key=lambda state: state.score / (1 + state.in_flight))
+
+    def hedge_delay(self):
+        """Через сколько секунд без ответа отправлять дублирующий запрос."""
+        if len(self.latencies) < MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        ordered = sorted(self.latencies)
+        return max(MIN_HEDGE_DELAY, ordered[int(self.hedge_quantile * (len(ordered) - 1))])
+
+    def summary(self):
+        """Сводка: число вызовов, подстраховок и ошибок, квантили времени недавних вызовов."""
+        ordered = sorted(self.elapsed)
+        quantiles = {f"p{int(q * 100)}": round(ordered[int(q * (len(ordered) - 1))], 4)
+                     for q in (0.5, 0.9, 0.99)} if ordered else {}
+        return {**self.totals, **quantiles, "hedge_delay": round(self.hedge_delay(), 4)}
+
+    def _record(self, state, attempt):
+        if attempt.outcome == "cancelled":
+            # Отменённая попытка ничего не говорит о прокси
+            return
+        ok = attempt.outcome == "ok"
+        state.record(ok, attempt.latency if ok else None)
+        if self.store:
+            self.store.record_probe(state.proxy, ok, attempt.latency if ok else None, state.protocol)
+
+    # --- Запросы ---
+
+    async def _request_tunnel(self, state, method, url, headers, data):
+        """Запрос через туннель CONNECT/SOCKS: (код, заголовки, тело)."""
+        parts = urlsplit(url)
+        host = parts.hostname
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        reader, writer = await open_tunnel(state.proxy, state.protocol, host, port)
+        try:
+            if parts.scheme == "https":
+                await writer.start_tls(self.ssl_context, server_hostname=host)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            lines = [f"{method} {path} HTTP/1.0", f"Host: {host}", "Connection: close"]
+            lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+            if data:
+                lines.append(f"Content-Length: {len(data)}")
+            # HTTP/1.0: сервер не использует chunked и закрывает соединение сам
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (data or b""))
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            status = int(lines[0].split()[1])
+            response_headers = {}
+            for line in lines[1:]:
+                name, sep, value = line.partition(":")
+                if sep:
+                    response_headers[name.strip()] = value.strip()
+            body = b""
+            if method != "HEAD" and status not in (204, 304):
+                body = await self._read_body(reader, response_headers)
+        finally:
+            writer.close()
+        return status, response_headers, body
+
+    async def _read_body(self, reader, headers):
+        """Тело ответа целиком: по Content-Length или до закрытия соединения."""
+        length = next((value for name, value in headers.items() if name.lower() == "content-length"), None)
+        length = int(length) if length is not None else None
+        if length is not None and length > MAX_TUNNEL_BODY:
+            raise ValueError(f"тело ответа больше {MAX_TUNNEL_BODY} байт")
+        chunks = []
+        received = 0
+        while length is None or received < length:
+            data = await reader.read(CHUNK if length is None else min(CHUNK, length - received))
+            if not data:
+                if length is not None:
+                    # Соединение закрылось раньше, чем пришло всё тело
+                    raise asyncio.IncompleteReadError(b"".join(chunks), length)
+                break
+            received += len(data)
+            if received > MAX_TUNNEL_BODY:
+                raise ValueError(f"тело ответа больше {MAX_TUNNEL_BODY} байт")
+            chunks.append(data)
+        return b"".join(chunks)
+
+    async def _request(self, state, method, url, headers, data):
+        if state.protocol == "http" or (state.protocol == "connect" and url.startswith("https:")):
+            # aiohttp сам отправляет CONNECT для https
+            async with self.session.request(method, url, proxy=f"http://{state.proxy}",
+                                            headers=headers, data=data) as response:
+                return response.status, dict(response.headers), await response.read()
+        return await asyncio.wait_for(self._request_tunnel(state, method, url, headers, data), self.timeout)
+
+    async def _attempt(self, state, attempt, method, url, headers, data):
+        started = time.monotonic()
+        state.in_flight += 1
+        try:
+            status, response_headers, body = await self._request(state, method, url, headers, data)
+        except asyncio.CancelledError:
+            attempt.outcome = "cancelled"
+            raise
+        except Exception:
+            attempt.outcome = "error"
+            return None
+        finally:
+            state.in_flight -= 1
+            attempt.latency = round(time.monotonic() - started, 4)
+        if not self.accept(status):
+            attempt.outcome = f"http_{status}"
+            return None
+        attempt.outcome = "ok"
+        return status, response_headers, body
+
+    async def fetch(self, url, method="GET", headers=None, data=None):
+        """Запрос через лучший прокси с подстраховкой; FetchResult или ProxyPoolError."""
+        if self.session is None:
+            await self.start()
+        method = method.upper()
+        stats = FetchStats(url=url, hedge_delay=self.hedge_delay() if method in IDEMPOTENT else None)
+        started = time.monotonic()
+        candidates = deque(self.best(self.max_attempts))
+        tasks = {}
+        last_launch = started
+
+        def launch(hedge=False):
+            nonlocal last_launch
+            if not candidates:
+                return
+            state = candidates.popleft()
+            stats.hedged = stats.hedged or hedge
+            last_launch = time.monotonic()
+            attempt = Attempt(state.proxy, hedge=hedge)
+            stats.attempts.append(attempt)
+            task = asyncio.ensure_future(self._attempt(state, attempt, method, url, headers, data))
+            tasks[task] = (state, attempt)
+
+        self.totals["calls"] += 1
+        launch()
+        try:
+            while tasks:
+                # Пока есть место для дублирующего запроса, ждём не дольше его задержки
+                timeout = None
+                if stats.hedge_delay is not None and candidates and len(tasks) < MAX_PARALLEL:
+                    timeout = max(0, last_launch + stats.hedge_delay - time.monotonic())
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch(hedge=True)
+                    continue
+                for task in done:
+                    state, attempt = tasks.pop(task)
+                    self._record(state, attempt)
+                    response = task.result()
+                    if response is not None:
+                        stats.elapsed = round(time.monotonic() - started, 4)
+                        stats.hedge_won = attempt.hedge
+                        self.latencies.append(attempt.latency)
+                        self.elapsed.append(stats.elapsed)
+                        self.totals["hedged"] += int(stats.hedged)
+                        self.totals["hedge_won"] += int(stats.hedge_won)
+                        status, response_headers, body = response
+                        return FetchResult(status, response_headers, body, state.proxy, stats)
+                    # Неудачная попытка сразу заменяется следующим прокси
+                    launch()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for state, attempt in tasks.values():
+                self._record(state, attempt)
+        stats.elapsed = round(time.monotonic() - started, 4)
+        self.totals["failed"] += 1
+        raise ProxyPoolError(f"Ни один из {len(stats.attempts)} прокси не вернул ответ для {url}", stats)
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Определение протокола прокси по рукопожатию: HTTP, CONNECT, SOCKS4, SOCKS5.
+
+Для каждого протокола открывается отдельное соединение и выполняется
+минимальный обмен с целевым сайтом. Ответ проверяется по первым байтам:
+HTTP-прокси на SOCKS-приветствие отвечает "HTTP/1.x 400", а SOCKS-сервер
+на HTTP-запрос - двоичным ответом, поэтому неподходящий протокол
+отбрасывается сразу, без ожидания таймаута. Протоколы пробуются
+одновременно (заявленные источником - с небольшой форой), выбирается
+лучший из сработавших в порядке PROTOCOLS.
+
+open_tunnel используется и для самой проверки VATS через CONNECT и SOCKS,
+а также шлюзом, пулом прокси и проверкой нескольких сайтов.
+"""
+
+import asyncio
+import ipaddress
+import socket
+import struct
+import time
+from urllib.parse import urlsplit
+
+# Порядок предпочтения: обычный HTTP-прокси проверяется aiohttp напрямую
+PROTOCOLS = ("http", "connect", "socks5", "socks4")
+# Запросы, которые безопасно повторить или продублировать через другой прокси
+IDEMPOTENT = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"}
+
+# IPv4-адреса целевых сайтов для SOCKS4: host -> адрес
+_ipv4_cache = {}
+
+
+class HandshakeError(Exception):
+    pass
+
+
+async def resolve_ipv4(host, port):
+    """IPv4-адрес сайта (SOCKS4 принимает только его); кэшируется на весь процесс."""
+    if host not in _ipv4_cache:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, family=socket.AF_INET,
+                                                             type=socket.SOCK_STREAM)
+        _ipv4_cache[host] = infos[0][4][0]
+    return _ipv4_cache[host]
+
+
+def url_scheme(protocol):
+    """Схема URL прокси для requests и браузера (CONNECT - тот же HTTP-прокси)."""
+    return "http" if protocol in (None, "connect") else protocol
+
+
+async def _socks5(reader, writer, host, port):
+    writer.write(b"\x05\x01\x00")
+    await writer.drain()
+    greeting = await reader.readexactly(2)
+    if greeting[0] != 5:
+        raise HandshakeError("не SOCKS5")
+    if greeting[1] != 0:
+        raise HandshakeError("SOCKS5 требует авторизацию")
+    encoded = host.encode("idna")
+    writer.write(b"\x05\x01\x00\x03" + bytes([len(encoded)]) + encoded + struct.pack("!H", port))
+    await writer.drain()
+    reply = await reader.readexactly(4)
+    if reply[0] != 5 or reply[1] != 0:
+        raise HandshakeError(f"SOCKS5 отказ {reply[1]}")
+    # Адрес, привязанный на стороне прокси, не нужен - только вычитываем его
+    if reply[3] == 1:
+        await reader.readexactly(4 + 2)
+    elif reply[3] == 4:
+        await reader.readexactly(16 + 2)
+    else:
+        length = (await reader.readexactly(1))[0]
+        await reader.readexactly(length + 2)
+
+
+async def _socks4(reader, writer, ip, port):
+    writer.write(b"\x04\x01" + struct.pack("!H", port) + ipaddress.IPv4Address(ip).packed + b"\x00")
+    await writer.drain()
+    reply = await reader.readexactly(8)
+    if reply[0] != 0:
+        raise HandshakeError("не SOCKS4")
+    if reply[1] != 0x5A:
+        raise HandshakeError(f"SOCKS4 отказ {reply[1]}")
+
+
+async def _read_status(reader):
+    """Код ответа HTTP; HandshakeError, если ответ не похож на HTTP."""
+    first = await reader.readexactly(5)
+    if first != b"HTTP/":
+        raise HandshakeError("не HTTP")
+    line = await reader.readline()
+    try:
+        return int(line.split()[1])
+    except (IndexError, ValueError):
+        raise HandshakeError("некорректная строка статуса")
+
+
+async def _connect(reader, writer, host, port):
+    writer.write(f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n".encode())
+    await writer.drain()
+    status = await _read_status(reader)
+    if status != 200:
+        raise HandshakeError(f"CONNECT отклонён: {status}")
+    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+        pass
+
+
+async def open_tunnel(proxy, protocol, host, port, ip=None):
+    """Соединение с прокси и, для connect/socks, туннель до host:port.
+
+    Для http возвращается просто соединение с прокси. Для socks4 нужен
+    IPv4-адрес цели: ip или, если он не задан, адрес host (resolve_ipv4).
+    """
+    if protocol == "socks4" and ip is None:
+        ip = await resolve_ipv4(host, port)
+    proxy_host, _, proxy_port = proxy.rpartition(":")
+    reader, writer = await asyncio.open_connection(proxy_host, int(proxy_port))
+    try:
+        if protocol == "socks5":
+            await _socks5(reader, writer, host, port)
+        elif protocol == "socks4":
+            await _socks4(reader, writer, ip or host, port)
+        elif protocol == "connect":
+            await _connect(reader, writer, host, port)
+    except BaseException:
+        writer.close()
+        raise
+    return reader, writer
+
+
+class ProtocolDetector:
+    def __init__(self, url, timeout=3, limit=500, hint_delay=0.25):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.url = url
+        self.timeout = timeout
+        # Фора заявленных протоколов перед остальными, секунды
+        self.hint_delay = hint_delay
+        # Каждое определение открывает до len(PROTOCOLS) соединений
+        self.semaphore = asyncio.Semaphore(max(1, limit // len(PROTOCOLS)))
+        self.stats = {protocol: 0 for protocol in PROTOCOLS}
+        self.stats["none"] = 0
+
+    async def _attempt(self, proxy, protocol):
+        reader, writer = await open_tunnel(proxy, protocol, self.host, self.port)
+        try:
+            if protocol == "http":
+                writer.write(f"HEAD {self.url} HTTP/1.0\r\nHost: {self.host}\r\n\r\n".encode())
+                await writer.drain()
+                status = await _read_status(reader)
+                if status >= 400:
+                    raise HandshakeError(f"HTTP {status}")
+        finally:
+            writer.close()
+
+    async def try_protocol(self, proxy, protocol, head_start=None):
+        """True, если прокси выполнил рукопожатие протокола.
+
+        head_start - событие и задержка для протоколов, не заявленных
+        источником: попытка начинается по событию или по истечении задержки.
+        """
+        if head_start:
+            event, delay = head_start
+            try:
+                await asyncio.wait_for(event.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        try:
+            await asyncio.wait_for(self._attempt(proxy, protocol), self.timeout)
+            return True
+        except (HandshakeError, OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            return False
+
+    async def detect(self, proxy, hints=None):
+        """Протокол прокси или None.
+
+        Все рукопожатия идут одновременно; протоколы из hints (заявленные
+        источником или определённые ранее) получают фору hint_delay секунд.
+        Сервер одного протокола на чужое рукопожатие часто не отвечает
+        вовсе (SOCKS4 ждёт 8 байт, HTTP - конец строки), поэтому ждать
+        отказа более предпочтительного протокола дольше, чем ответил
+        сработавший, не имеет смысла.
+        """
+        async with self.semaphore:
+            protocol = await self._race(proxy, hints)
+        self.stats[protocol or "none"] += 1
+        return protocol
+
+    async def _race(self, proxy, hints):
+        hinted = [protocol for protocol in PROTOCOLS if hints and protocol in hints]
+        fallback = asyncio.Event()
+        tasks = {}
+        for protocol in PROTOCOLS:
+            head_start = (fallback, self.hint_delay) if hinted and protocol not in hinted else None
+            tasks[asyncio.ensure_future(self.try_protocol(proxy, protocol, head_start))] = protocol
+        rank = PROTOCOLS.index
+        started = time.monotonic()
+        pending = set(tasks)
+        winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [tasks[task] for task in done if task.result()]
+                if succeeded:
+                    winner = min(succeeded, key=rank)
+                elif all(task.done() for task, protocol in tasks.items() if protocol in hinted):
+                    # Заявленные протоколы отклонены - остальные начинаются сразу
+                    fallback.set()
+            if winner is None:
+                return None
+            better = {task for task in pending if rank(tasks[task]) < rank(winner)}
+            if better:
+                done, _ = await asyncio.wait(better, timeout=time.monotonic() - started)
+                succeeded = [tasks[task] for task in done if task.result()]
+                winner = min(succeeded + [winner], key=rank)
+            return winner
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
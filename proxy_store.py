@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Постоянное хранилище состояния прокси на SQLite (режим WAL).
+
+Для каждого прокси хранятся источники, время первого и последнего
+обнаружения, результат геолокации, исход проверок VATS, скользящее
+среднее задержки (EWMA) и оценка надёжности. Хранилище используют
+RussianProxyFinder (запись результатов, порядок проверки) и ProxyBrowser
+(выбор прокси).
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+# Коэффициент сглаживания EWMA задержки
+LATENCY_ALPHA = 0.3
+# Сколько неудачных проверок подряд считаются признаком «мёртвого» прокси
+DEAD_AFTER_FAILURES = 3
+# Через сколько секунд «мёртвый» прокси снова можно проверить
+DEAD_RETRY_AFTER = 24 * 3600
+
+
+def compute_score(successes, checks, latency_ewma):
+    """Оценка прокси: сглаженная доля успешных проверок с поправкой на задержку."""
+    success_rate = (successes + 1) / (checks + 2)
+    return success_rate / (1 + (latency_ewma or 0))
+
+
+class ProxyStore:
+    def __init__(self, path, commit_every=100):
+        self.path = path
+        self.commit_every = commit_every
+        self._pending = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS proxies ("
+            " proxy TEXT PRIMARY KEY,"
+            " sources TEXT NOT NULL DEFAULT '',"
+            " first_seen REAL NOT NULL,"
+            " last_seen REAL NOT NULL,"
+            " country TEXT,"
+            " protocol TEXT NOT NULL DEFAULT 'http',"
+            " vats_access INTEGER NOT NULL DEFAULT 0,"
+            " last_checked REAL,"
+            " last_ok REAL,"
+            " latency_ewma REAL,"
+            " checks INTEGER NOT NULL DEFAULT 0,"
+            " successes INTEGER NOT NULL DEFAULT 0,"
+            " consecutive_failures INTEGER NOT NULL DEFAULT 0,"
+            " score REAL NOT NULL DEFAULT 0.5)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS proxies_score ON proxies (score DESC)")
+        self.conn.commit()
+
+    def _touch(self, count=1):
+        self._pending += count
+        if self._pending >= self.commit_every:
+            self.flush()
+
+    # --- Запись ---
+
+    def record_seen(self, proxies, source=None, country=None):
+        """Отметка о том, что источник source вернул эти прокси.
+
+        country - страна, заявленная самим источником (если он фильтрует по стране).
+        """
+        now = time.time()
+        source = source or ""
+        self.conn.executemany(
+            "INSERT INTO proxies (proxy, sources, first_seen, last_seen, country) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(proxy) DO UPDATE SET last_seen = excluded.last_seen, "
+            "country = COALESCE(country, excluded.country), "
+            "sources = CASE WHEN excluded.sources = '' OR instr(',' || sources || ',', ',' || excluded.sources || ',') "
+            "THEN sources WHEN sources = '' THEN excluded.sources ELSE sources || ',' || excluded.sources END",
+            [(proxy, source, now, now, country) for proxy in proxies],
+        )
+        self._touch(len(proxies))
+
+    def record_country(self, proxy, country):
+        now = time.time()
+        self.conn.execute(
+            "INSERT INTO proxies (proxy, first_seen, last_seen, country) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(proxy) DO UPDATE SET country = excluded.country",
+            (proxy, now, now, country),
+        )
+        self._touch()
+
+    def record_probe(self, proxy, ok, latency=None, protocol=None):
+        """Результат проверки VATS: обновление EWMA задержки и оценки."""
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT latency_ewma, checks, successes, consecutive_failures, protocol FROM proxies WHERE proxy = ?",
+            (proxy,),
+        ).fetchone()
+        latency_ewma, checks, successes, failures, old_protocol = row or (None, 0, 0, 0, "http")
+
+        checks += 1
+        if ok:
+            successes += 1
+            failures = 0
+            if latency is not None:
+                latency_ewma = latency if latency_ewma is None else (
+                    LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * latency_ewma)
+        else:
+            failures += 1
+
+        self.conn.execute(
+            "INSERT INTO proxies (proxy, first_seen, last_seen, protocol, vats_access, last_checked, last_ok,"
+            " latency_ewma, checks, successes, consecutive_failures, score)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(proxy) DO UPDATE SET protocol = excluded.protocol, vats_access = excluded.vats_access,"
+            " last_checked = excluded.last_checked, last_ok = COALESCE(excluded.last_ok, last_ok),"
+            " latency_ewma = excluded.latency_ewma, checks = excluded.checks, successes = excluded.successes,"
+            " consecutive_failures = excluded.consecutive_failures, score = excluded.score",
+            (proxy, now, now, protocol or old_protocol, int(bool(ok)), now, now if ok else None,
+             latency_ewma, checks, successes, failures, compute_score(successes, checks, latency_ewma)),
+        )
+        self._touch()
+
+    # --- Чтение ---
+
+    def get(self, proxy):
+        row = self.conn.execute("SELECT * FROM proxies WHERE proxy = ?", (proxy,)).fetchone()
+        return dict(row) if row else None
+
+    def get_many(self, proxies):
+        """Словарь proxy -> запись для известных прокси."""
+        found = {}
+        proxies = list(proxies)
+        for i in range(0, len(proxies), 500):
+            chunk = proxies[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self.conn.execute(f"SELECT * FROM proxies WHERE proxy IN ({placeholders})", chunk):
+                found[row["proxy"]] = dict(row)
+        return found
+
+    def is_dead(self, record, dead_after=DEAD_AFTER_FAILURES, retry_after=DEAD_RETRY_AFTER):
+        """Прокси «мёртв», если подряд провалил dead_after проверок и проверялся недавно."""
+        return (
+            record["consecutive_failures"] >= dead_after
+            and record["last_checked"] is not None
+            and time.time() - record["last_checked"] < retry_after
+        )
+
+    def rank(self, proxies, dead_after=DEAD_AFTER_FAILURES, retry_after=DEAD_RETRY_AFTER):
+        """Порядок проверки кандидатов: без «мёртвых», лучшие по оценке и задержке первыми.
+
+        Ещё не проверявшиеся прокси идут после проверенных с успехом,
+        но перед теми, кто проваливал проверки.
+        """
+        records = self.get_many(proxies)
+        ranked = []
+        for position, proxy in enumerate(dict.fromkeys(proxies)):
+            record = records.get(proxy)
+            if record is None or record["checks"] == 0:
+                key = (1, 0.0, position)
+            elif self.is_dead(record, dead_after, retry_after):
+                continue
+            elif record["vats_access"]:
+                key = (0, -record["score"], record["latency_ewma"] or 0)
+            else:
+                key = (2, -record["score"], position)
+            ranked.append((key, proxy))
+        ranked.sort()
+        return [proxy for _, proxy in ranked]
+
+    def working(self, limit=None):
+        """Прокси, открывавшие VATS при последней проверке, лучшие первыми."""
+        sql = "SELECT * FROM proxies WHERE vats_access = 1 ORDER BY score DESC, latency_ewma ASC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self.conn.execute(sql)]
+
+    def export_json(self, path):
+        """Выгрузка рабочих прокси в формате, который читает ProxyBrowser."""
+        proxies = [
+            {
+                "proxy": record["proxy"],
+                "protocol": record["protocol"],
+                "latency": round(record["latency_ewma"] or 0, 3),
+                "vats_access": bool(record["vats_access"]),
+                "score": round(record["score"], 4),
+                "country": record["country"],
+                "last_ok": record["last_ok"],
+            }
+            for record in self.working()
+        ]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"updated": time.time(), "proxies": proxies}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return len(proxies)
+
+    def flush(self):
+        self.conn.commit()
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Кэш ответов источников прокси на SQLite.
+
+Для каждого источника хранятся ETag и Last-Modified последнего ответа
+(для условных запросов), хэш и сжатое тело ответа, время загрузки и уже
+разобранный список прокси. Если источник ответил 304 или прислал то же
+содержимое, повторный разбор не нужен.
+"""
+
+import os
+import sqlite3
+import time
+import zlib
+
+
+class SourceCache:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sources ("
+            " name TEXT PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            # Отпечаток описания источника: при его изменении тело разбирается заново
+            " spec TEXT NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " content_hash TEXT NOT NULL,"
+            " fetched_at REAL NOT NULL,"
+            " body BLOB,"
+            " proxies TEXT NOT NULL DEFAULT '')"
+        )
+        self.conn.commit()
+
+    def get(self, name):
+        row = self.conn.execute("SELECT * FROM sources WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        record = dict(row)
+        record["proxies"] = record["proxies"].split("\n") if record["proxies"] else []
+        return record
+
+    def body(self, record):
+        """Распакованное тело ответа из записи кэша."""
+        return zlib.decompress(record["body"]) if record["body"] else b""
+
+    def put(self, name, url, spec, etag, last_modified, content_hash, body, proxies):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sources"
+            " (name, url, spec, etag, last_modified, content_hash, fetched_at, body, proxies)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (name, url, spec, etag, last_modified, content_hash, time.time(),
+             zlib.compress(body), "\n".join(proxies)),
+        )
+        self.conn.commit()
+
+    def touch(self, name, etag=None, last_modified=None):
+        """Источник проверен, содержимое не изменилось."""
+        self.conn.execute(
+            "UPDATE sources SET fetched_at = ?, etag = COALESCE(?, etag),"
+            " last_modified = COALESCE(?, last_modified) WHERE name = ?",
+            (time.time(), etag, last_modified, name),
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
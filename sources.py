@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Реестр источников прокси и общий загрузчик.
+
+Каждый источник описывается декларативно: адрес, формат ответа (text,
+json, html или ip_ports), соответствие колонок или ключей, фильтр по
+стране и интервал обновления. SourceFetcher загружает любой источник
+одинаково: отправляет условный запрос (If-None-Match / If-Modified-Since),
+хранит ответ в SourceCache и не разбирает заново содержимое, хэш которого
+не изменился. Постраничные JSON-источники загружаются параллельно (не больше
+per_host запросов к одному сайту) и разбираются потоком, по мере получения
+ответа. Чтобы добавить источник, достаточно дописать его в SOURCES.
+"""
+
+import asyncio
+import codecs
+import hashlib
+import json
+import math
+import time
+from dataclasses import dataclass, field
+
+from yarl import URL
+
+from html_tables import extract_proxies, find_ip_ports
+from json_stream import JsonArrayStream
+
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'
+}
+
+
+@dataclass
+class Source:
+    name: str
+    url: str
+    # text - по прокси на строку, json - список объектов, html - таблица,
+    # ip_ports - все пары ip:port внутри элемента selector
+    format: str
+    # Название для сообщений (по умолчанию - name)
+    label: str = None
+    # Источник сам отбирает российские прокси
+    russian: bool = False
+    headers: dict = field(default_factory=dict)
+    # Как часто имеет смысл загружать источник заново, секунды
+    refresh: int = 1800
+    # Протоколы, которые заявляет источник: при определении протокола
+    # они пробуются первыми (None - все протоколы одновременно)
+    protocols: tuple = None
+
+    # json: ключ со списком прокси (None - ответ сам является списком) и ключи адреса
+    items: str = None
+    ip_key: str = "ip"
+    port_key: str = "port"
+
+    # Постраничная выдача (json): параметр номера страницы, размер страницы
+    # и поле с общим числом прокси. Без total_key страницы загружаются
+    # группами, пока не встретится пустая.
+    page_param: str = None
+    page_size: int = None
+    total_key: str = None
+    max_pages: int = 20
+
+    # html: селектор таблицы, номера колонок, фильтр по стране, способ разбора
+    selector: str = None
+    ip_col: int = 0
+    port_col: int = 1
+    country_col: int = None
+    countries: tuple = None
+    min_columns: int = 2
+    parser: str = "fast"
+
+    @property
+    def title(self):
+        return self.label or self.name
+
+    def spec(self):
+        """Отпечаток описания: изменение разбора делает кэш разобранных прокси недействительным."""
+        return hashlib.sha1(repr(self).encode()).hexdigest()
+
+
+SOURCES = [
+    Source("proxylist_download", "https://www.proxy-list.download/api/v1/get?type=http", "text",
+           label="proxy-list.download", refresh=900, protocols=("http", "connect")),
+    Source("freeproxy_world", "https://www.freeproxy.world/", "html", label="freeproxy.world",
+           selector=".table-striped", country_col=6, countries=("Russia", "RU")),
+    Source("proxy_list_ru", "https://proxy-list.ru/russian-proxy-list", "html", label="proxy-list.ru",
+           selector=".proxy-list-table"),
+    Source("hidemy_name", "https://hidemy.name/ru/proxy-list/?country=RU", "html", label="hidemy.name",
+           headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'},
+           selector=".table_block"),
+    Source("geonode", "https://proxylist.geonode.com/api/proxy-list?limit=500&page=1&country=RU&speed=fast&protocols=http,https,socks4,socks5",
+           "json", label="geonode.com", russian=True, refresh=900, items="data",
+           page_param="page", page_size=500, total_key="total"),
+    Source("free_proxy_list", "https://free-proxy-list.net/", "html", label="free-proxy-list.net", russian=True,
+           refresh=900, selector="#list", country_col=2, countries=("RU",), min_columns=8),
+    Source("proxy_list_download", "https://www.proxy-list.download/api/v2/get?l=en&t=http&c=Russian+Federation",
+           "json", label="proxy-list.download v2", russian=True, refresh=900, items="LISTA", ip_key="IP", port_key="PORT",
+           protocols=("http", "connect")),
+    Source("proxy_list_org", "https://proxy-list.org/russian/index.php", "ip_ports", label="proxy-list.org",
+           selector=".table"),
+    # Специализированные российские источники
+    Source("proxyscrape_ru", "https://api.proxyscrape.com/v2/?request=displayproxies&protocol=http&timeout=10000&country=RU&ssl=all&anonymity=all",
+           "text", label="proxyscrape.com (RU)", russian=True, refresh=900, protocols=("http", "connect")),
+    Source("proxyservers_ru", "https://ru.proxyservers.pro/proxy/list?country=RU&type=http", "html",
+           label="proxyservers.pro (RU)", headers=BROWSER_HEADERS, selector="table.proxy-list", ip_col=1, port_col=2,
+           protocols=("http", "connect")),
+    Source("2ip_ru", "https://2ip.ru/proxy/?filter_country=RU&filter_port=&filter_type=any&filter_anon=any", "html",
+           label="2ip.ru (RU)", headers=BROWSER_HEADERS, selector=".proxy__table"),
+    Source("proxy24_net_ru", "https://proxy24.net/ru-proxy", "html", label="proxy24.net (RU)", headers=BROWSER_HEADERS,
+           selector="table.table-striped", country_col=3, countries=("RU",)),
+    # Новые источники прокси
+    Source("htmlweb_api", "https://htmlweb.ru/analiz/api_proxy.php?country=ru&format=json", "json",
+           label="htmlweb.ru API", items="list", page_param="p", max_pages=10),
+    Source("proxy5_net", "https://proxy5.net/ru/free-proxy/russia", "html", label="proxy5.net",
+           headers=BROWSER_HEADERS, selector="table.proxy-table"),
+    Source("fineproxy_org", "https://fineproxy.org/ru/free-proxies/europe/russia/", "html", label="fineproxy.org",
+           headers=BROWSER_HEADERS, selector="table.proxy__list"),
+    Source("proxyfreeonly", "https://proxyfreeonly.com/ru/free-proxy-list/russia", "html", label="proxyfreeonly.com",
+           headers=BROWSER_HEADERS, selector="table.proxy-table"),
+    Source("good_proxies_ru", "https://www.good-proxies.ru/free-proxy", "html", label="good-proxies.ru",
+           headers=BROWSER_HEADERS, selector="table.proxy-list", country_col=2, countries=("RU", "Россия")),
+    Source("iproyal_ru", "https://iproyal.com/ru/free-proxies/russia-ru/", "html", label="iproyal.com",
+           headers=BROWSER_HEADERS, selector="table.proxies-table"),
+]
+
+
+def _json_proxy(source, item):
+    if isinstance(item, dict):
+        ip = item.get(source.ip_key)
+        port = item.get(source.port_key)
+        if ip and port:
+            return f"{ip}:{port}"
+    return None
+
+
+def parse_source(source, text):
+    """Список "ip:port" из ответа источника (выполняется вне цикла событий)."""
+    if source.format == "text":
+        return text.split()
+    if source.format == "json":
+        data = json.loads(text)
+        items = data.get(source.items, []) if source.items and isinstance(data, dict) else data
+        proxies = (_json_proxy(source, item) for item in (items if isinstance(items, list) else []))
+        return [proxy for proxy in proxies if proxy]
+    if source.format == "html":
+        return extract_proxies(text, source.selector, ip_col=source.ip_col, port_col=source.port_col,
+                               country_col=source.country_col, countries=source.countries,
+                               min_columns=source.min_columns, parser=source.parser)
+    if source.format == "ip_ports":
+        return find_ip_ports(text, source.selector)
+    raise ValueError(f"Неизвестный формат источника {source.name}: {source.format}")
+
+
+@dataclass
+class FetchResult:
+    proxies: list
+    # fresh - взято из кэша без запроса, not_modified - ответ 304,
+    # unchanged - тот же хэш содержимого, updated - новое содержимое
+    status: str
+
+
+class SourceFetcher:
+    def __init__(self, session, cache=None, timeout=None, parse=None, per_host=4, on_parse=None):
+        self.session = session
+        self.cache = cache
+        self.timeout = timeout
+        # Корутина parse(func, *args) для разбора вне цикла событий
+        self.parse = parse
+        # on_parse(имя источника, секунды) - время разбора для метрик
+        self.on_parse = on_parse
+        # Не больше per_host одновременных запросов к одному сайту
+        self.per_host = per_host
+        self._host_limits = {}
+        self.stats = {"fresh": 0, "not_modified": 0, "unchanged": 0, "updated": 0, "failed": 0, "pages": 0,
+                      "page_errors": 0, "partial": 0}
+
+    def _host_limit(self, url):
+        host = URL(url).host
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host)
+        return self._host_limits[host]
+
+    async def _parse(self, source, text):
+        started = time.perf_counter()
+        try:
+            if self.parse:
+                return await self.parse(parse_source, source, text)
+            return parse_source(source, text)
+        finally:
+            self._parsed(source, time.perf_counter() - started)
+
+    def _parsed(self, source, elapsed):
+        if self.on_parse:
+            self.on_parse(source.name, elapsed)
+
+    async def fetch(self, source, max_age=None):
+        """Прокси источника. None, если источник ответил ошибкой.
+
+        max_age - возраст кэша, при котором запрос не отправляется
+        (None - интервал обновления источника, 0 - всегда запрашивать).
+        """
+        max_age = source.refresh if max_age is None else max_age
+        spec = source.spec()
+        cached = self.cache.get(source.name) if self.cache else None
+        if cached and cached["url"] != source.url:
+            cached = None
+
+        if cached and cached["spec"] == spec and time.time() - cached["fetched_at"] < max_age:
+            self.stats["fresh"] += 1
+            return FetchResult(cached["proxies"], "fresh")
+
+        if source.page_param:
+            return await self._fetch_pages(source, cached, spec)
+
+        headers = dict(source.headers)
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        async with self._host_limit(source.url), \
+                self.session.get(source.url, headers=headers, timeout=self.timeout) as response:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if response.status == 304 and cached:
+                body = None
+            elif response.status == 200:
+                body = await response.read()
+                encoding = response.get_encoding()
+            else:
+                self.stats["failed"] += 1
+                return None
+
+        if body is None or (cached and hashlib.sha1(body).hexdigest() == cached["content_hash"]):
+            if cached["spec"] == spec:
+                self.cache.touch(source.name, etag, last_modified)
+                status = "not_modified" if body is None else "unchanged"
+                self.stats[status] += 1
+                return FetchResult(cached["proxies"], status)
+            # Содержимое то же, но изменилось описание источника - разбираем сохранённое тело
+            body = self.cache.body(cached)
+            encoding = "utf-8"
+
+        proxies = await self._parse(source, body.decode(encoding, errors="replace"))
+        if self.cache:
+            self.cache.put(source.name, source.url, spec, etag or (cached or {}).get("etag"),
+                           last_modified or (cached or {}).get("last_modified"),
+                           hashlib.sha1(body).hexdigest(), body, proxies)
+        self.stats["updated"] += 1
+        return FetchResult(proxies, "updated")
+
+    # --- Постраничные источники ---
+
+    async def _fetch_page(self, source, page):
+        """Одна страница JSON-ответа с потоковым разбором.
+
+        Возвращает прокси, хэш содержимого страницы и разборщик (для служебных
+        полей) или None, если сервер ответил ошибкой.
+        """
+        url = URL(source.url).update_query({source.page_param: page})
+        async with self._host_limit(source.url), \
+                self.session.get(url, headers=source.headers, timeout=self.timeout) as response:
+            if response.status != 200:
+                return None
+            stream = JsonArrayStream(source.items)
+            decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(errors="replace")
+            digest = hashlib.sha1()
+            proxies = []
+            # Разбор идёт по мере загрузки: учитывается только время самого разбора
+            parse_time = 0.0
+            async for chunk in response.content.iter_any():
+                started = time.perf_counter()
+                digest.update(chunk)
+                for item in stream.feed(decoder.decode(chunk)):
+                    proxy = _json_proxy(source, item)
+                    if proxy:
+                        proxies.append(proxy)
+                parse_time += time.perf_counter() - started
+            started = time.perf_counter()
+            stream.feed(decoder.decode(b"", final=True))
+            parse_time += time.perf_counter() - started
+        self._parsed(source, parse_time)
+        self.stats["pages"] += 1
+        return proxies, digest.hexdigest(), stream
+
+    async def _gather_pages(self, source, numbers):
+        """Страницы numbers одновременно; None вместо страницы, загрузка которой не удалась."""
+        results = await asyncio.gather(*(self._fetch_page(source, number) for number in numbers),
+                                       return_exceptions=True)
+        pages = []
+        for result in results:
+            if isinstance(result, Exception):
+                result = None
+            if result is None:
+                self.stats["page_errors"] += 1
+            pages.append(result)
+        return pages
+
+    async def _fetch_pages(self, source, cached, spec):
+        """Все страницы источника: число страниц по total_key или до первой пустой (повторной)."""
+        first = await self._fetch_page(source, 1)
+        if first is None:
+            self.stats["failed"] += 1
+            return None
+        proxies, digest, stream = first
+        pages = [(proxies, digest)]
+
+        failed = 0
+        total = stream.field(source.total_key) if source.total_key else None
+        if isinstance(total, (int, float)) and source.page_size:
+            count = min(source.max_pages, math.ceil(total / source.page_size))
+            results = await self._gather_pages(source, range(2, count + 1))
+            failed += results.count(None)
+            pages += [result[:2] for result in results if result]
+        else:
+            # Число страниц неизвестно: загружаем группами по per_host, пока страницы не кончатся
+            page = 2
+            seen = {digest}
+            while proxies and page <= source.max_pages:
+                group = range(page, min(page + self.per_host, source.max_pages + 1))
+                results = await self._gather_pages(source, group)
+                for result in results:
+                    if result is None:
+                        # Ошибка загрузки страницы: пропускаем её, остальные страницы остаются
+                        failed += 1
+                        continue
+                    if not result[0] or result[1] in seen:
+                        # Пустая страница или повтор уже полученной (сайт не знает
+                        # параметра страницы) - страницы кончились
+                        proxies = None
+                        break
+                    seen.add(result[1])
+                    pages.append(result[:2])
+                page = group.stop
+
+        combined = hashlib.sha1("".join(digest for _, digest in pages).encode()).hexdigest()
+        proxies = [proxy for page_proxies, _ in pages for proxy in page_proxies]
+        if failed:
+            # Неполный результат не кэшируется: в следующий раз страницы загрузятся заново
+            self.stats["partial"] += 1
+            return FetchResult(proxies, "updated")
+        if cached and cached["content_hash"] == combined and cached["spec"] == spec:
+            self.cache.touch(source.name)
+            self.stats["unchanged"] += 1
+            return FetchResult(proxies, "unchanged")
+        if self.cache:
+            # Тело постраничного ответа не сохраняется: он разбирается потоком
+            self.cache.put(source.name, source.url, spec, None, None, combined, b"", proxies)
+        self.stats["updated"] += 1
+        return FetchResult(proxies, "updated")
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Проверка прокси сразу на нескольких сайтах через минимум соединений.
+
+Для каждого прокси цели (Target) делятся на каналы:
+- HTTP-прокси: все http://-цели идут через одно соединение с прокси, даже
+  если сайты разные (запрос с абсолютным адресом), https://-цели - через
+  туннель CONNECT к своему сайту;
+- CONNECT, SOCKS4 и SOCKS5: туннель ведёт к одному сайту (host:port), поэтому
+  канал нужен на каждый сайт. Цели на одном сайте делят туннель, а туннели
+  к разным сайтам открываются одновременно.
+
+Внутри канала запросы отправляются конвейером (HTTP/1.1 pipelining): все
+сразу, а ответы читаются по порядку. Цели без проверки тела запрашиваются
+методом HEAD и идут первыми; тело цели с формой входа VATS разбирает
+FormDetector. Если прокси или сайт закрыл соединение после ответа, оставшиеся
+цели повторяются через новое соединение. Результат - матрица «цель: прошла
+ли проверка, код ответа и задержка» для каждого прокси (ProxyCheck).
+"""
+
+import asyncio
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+from rich.table import Table
+
+from form_detector import OK, FormDetector
+from output import output
+from proxy_protocols import open_tunnel
+from vats_prober import VATS_URL, build_ssl_context
+
+# Таймаут соединения с прокси (вместе с туннелем и TLS) и общий таймаут проверки, секунды
+CONNECT_TIMEOUT = 5
+TIMEOUT = 10
+# Сколько байт тела дочитывать, чтобы переиспользовать соединение
+MAX_DRAIN = 1024 * 1024
+CHUNK = 16 * 1024
+# Имя цели с формой входа VATS в default_targets
+VATS_TARGET = "vats"
+
+
+@dataclass
+class Target:
+    name: str
+    url: str
+    # Нужна форма входа VATS в теле ответа; иначе достаточно кода ответа < 400
+    form: bool = False
+
+    @classmethod
+    def from_url(cls, url):
+        """Цель по адресу: имя - сайт без www и путь, если он не корневой."""
+        if "://" not in url:
+            url = "http://" + url
+        parts = urlsplit(url)
+        name = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+        if parts.path not in ("", "/"):
+            name += parts.path
+        return cls(name, url)
+
+    @property
+    def method(self):
+        return "GET" if self.form else "HEAD"
+
+
+def default_targets(vats_url=VATS_URL):
+    """Форма входа VATS и популярные российские сайты.
+
+    Сайты проверяются по http://: ответ (обычно перенаправление на https) уже
+    показывает, что сайт доступен через прокси, а все такие цели HTTP-прокси
+    проверяет через одно соединение.
+    """
+    return [
+        Target(VATS_TARGET, vats_url, form=True),
+        Target("yandex", "http://ya.ru/"),
+        Target("mail", "http://mail.ru/"),
+        Target("vk", "http://vk.com/"),
+        Target("gosuslugi", "http://www.gosuslugi.ru/"),
+    ]
+
+
+@dataclass
+class TargetResult:
+    ok: bool
+    status: int = None
+    # От отправки запроса до заголовков ответа; при конвейере включает
+    # ожидание ответов на предыдущие запросы того же соединения
+    latency: float = None
+    error: str = None
+
+
+@dataclass
+class ProxyCheck:
+    proxy: str
+    protocol: str
+    results: dict = field(default_factory=dict)
+    # Сколько соединений (рукопожатий) потребовала проверка
+    connections: int = 0
+    elapsed: float = None
+
+    def passed(self, name=None):
+        """Прошла ли проверку цель name (без name - все цели)."""
+        if name is not None:
+            result = self.results.get(name)
+            return bool(result and result.ok)
+        return all(result.ok for result in self.results.values())
+
+    def to_dict(self):
+        return {
+            "proxy": self.proxy,
+            "protocol": self.protocol,
+            "connections": self.connections,
+            "elapsed": self.elapsed,
+            "targets": {name: vars(result) for name, result in self.results.items()},
+        }
+
+
+def _parse_head(data):
+    lines = data.decode("latin-1").split("\r\n")
+    status_line = lines[0].split(" ", 2)
+    if len(status_line) < 2 or not status_line[0].startswith("HTTP/") or not status_line[1].isdigit():
+        raise ValueError("ответ не похож на HTTP")
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return status_line[0], int(status_line[1]), headers
+
+
+async def _read_head(reader):
+    """Версия, код и заголовки ответа (промежуточные ответы 1xx пропускаются)."""
+    while True:
+        version, status, headers = _parse_head(await reader.readuntil(b"\r\n\r\n"))
+        if not 100 <= status < 200:
+            return version, status, headers
+
+
+async def _body_chunks(reader, chunked, length):
+    """Тело ответа фрагментами: chunked, по Content-Length или до закрытия соединения."""
+    if chunked:
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0].strip(), 16)
+            if size == 0:
+                # Необязательные трейлеры до пустой строки
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return
+            while size:
+                data = await reader.read(min(CHUNK, size))
+                if not data:
+                    raise asyncio.IncompleteReadError(b"", size)
+                size -= len(data)
+                yield data
+            await reader.readexactly(2)
+    elif length is not None:
+        while length:
+            data = await reader.read(min(CHUNK, length))
+            if not data:
+                raise asyncio.IncompleteReadError(b"", length)
+            length -= len(data)
+            yield data
+    else:
+        while True:
+            data = await reader.read(CHUNK)
+            if not data:
+                return
+            yield data
+
+
+class TargetChecker:
+    def __init__(self, targets=None, timeout=TIMEOUT, connect_timeout=CONNECT_TIMEOUT, pipeline=True):
+        self.targets = list(targets or default_targets())
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        # False - запросы по очереди через одно соединение (только keep-alive)
+        self.pipeline = pipeline
+        self.ssl_context = build_ssl_context()
+        self.stats = Counter()
+
+    def channels(self, protocol):
+        """Цели по каналам: None - соединение с HTTP-прокси, (схема, сайт, порт) - туннель."""
+        groups = {}
+        for target in self.targets:
+            parts = urlsplit(target.url)
+            if protocol == "http" and parts.scheme == "http":
+                key = None
+            else:
+                key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+            groups.setdefault(key, []).append(target)
+        # HEAD-цели первыми: тело последней цели можно не дочитывать
+        for targets in groups.values():
+            targets.sort(key=lambda target: target.form)
+        return groups
+
+    async def check(self, proxy, protocol="http"):
+        """Проверка всех целей через прокси; ProxyCheck с результатом по каждой цели."""
+        started = time.perf_counter()
+        check = ProxyCheck(proxy, protocol or "http")
+        channels = self.channels(check.protocol)
+        tasks = [asyncio.ensure_future(self._run_channel(check, key, targets)) for key, targets in channels.items()]
+        try:
+            await asyncio.wait(tasks, timeout=self.timeout)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        # Порядок целей как в self.targets; не успевшие за timeout - неудача
+        check.results = {target.name: check.results.get(target.name) or TargetResult(False, error="timeout")
+                         for target in self.targets}
+        check.elapsed = round(time.perf_counter() - started, 3)
+        self.stats["proxies"] += 1
+        self.stats["targets"] += len(self.targets)
+        self.stats["connections"] += check.connections
+        output.event("targets", proxy=proxy, protocol=check.protocol, connections=check.connections,
+                     passed=[name for name, result in check.results.items() if result.ok],
+                     failed=[name for name, result in check.results.items() if not result.ok])
+        return check
+
+    async def check_many(self, proxies, concurrency=50):
+        """Проверка списка (прокси, протокол); ProxyCheck в том же порядке."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(proxy, protocol):
+            async with semaphore:
+                return await self.check(proxy, protocol)
+
+        return await asyncio.gather(*(one(proxy, protocol) for proxy, protocol in proxies))
+
+    async def _open(self, check, key):
+        if key is None:
+            return await open_tunnel(check.proxy, "http", None, None)
+        scheme, host, port = key
+        # HTTP-прокси доходит до https://-сайтов через CONNECT
+        protocol = "connect" if check.protocol == "http" else check.protocol
+        reader, writer = await open_tunnel(check.proxy, protocol, host, port)
+        if scheme == "https":
+            try:
+                await writer.start_tls(self.ssl_context, server_hostname=host)
+            except BaseException:
+                writer.close()
+                raise
+        return reader, writer
+
+    @staticmethod
+    def _request(target, absolute):
+        parts = urlsplit(target.url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        lines = [f"{target.method} {target.url if absolute else path} HTTP/1.1", f"Host: {parts.netloc}",
+                 "User-Agent: Mozilla/5.0", "Accept: */*", "Connection: keep-alive"]
+        if absolute:
+            lines.append("Proxy-Connection: keep-alive")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _run_channel(self, check, key, targets):
+        """Все цели канала; при раннем закрытии соединения оставшиеся - через новое."""
+        pending = list(targets)
+        for _ in range(len(targets)):
+            try:
+                reader, writer = await asyncio.wait_for(self._open(check, key), self.connect_timeout)
+            except Exception as e:
+                for target in pending:
+                    check.results[target.name] = TargetResult(False, error=type(e).__name__)
+                return
+            check.connections += 1
+            try:
+                pending = await self._exchange(check, key is None, reader, writer, pending)
+            finally:
+                writer.close()
+            if not pending:
+                return
+            self.stats["reconnects"] += 1
+
+    async def _exchange(self, check, absolute, reader, writer, targets):
+        """Запросы целей через одно соединение; цели, на которые ответа не было."""
+        if self.pipeline:
+            writer.write(b"".join(self._request(target, absolute) for target in targets))
+            await writer.drain()
+            sent = time.perf_counter()
+        for index, target in enumerate(targets):
+            if not self.pipeline:
+                writer.write(self._request(target, absolute))
+                await writer.drain()
+                sent = time.perf_counter()
+            try:
+                version, status, headers = await _read_head(reader)
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                if index:
+                    # Соединение без keep-alive: остальные цели - через новое
+                    return targets[index:]
+                check.results[target.name] = TargetResult(False, error=type(e).__name__)
+                return targets[1:]
+            except (asyncio.LimitOverrunError, ValueError) as e:
+                check.results[target.name] = TargetResult(False, error=type(e).__name__)
+                return targets[index + 1:]
+            latency = round(time.perf_counter() - sent, 3)
+            last = index == len(targets) - 1
+            try:
+                ok, keep = await self._read_body(reader, target, version, status, headers, last)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError) as e:
+                check.results[target.name] = TargetResult(False, status, latency, type(e).__name__)
+                return targets[index + 1:]
+            # Страница открылась, но формы входа на ней нет
+            error = "no_form" if target.form and status == 200 and not ok else None
+            check.results[target.name] = TargetResult(ok, status, latency, error)
+            if not keep:
+                return targets[index + 1:]
+        return []
+
+    async def _read_body(self, reader, target, version, status, headers, last):
+        """Тело ответа: (цель прошла проверку, соединение можно использовать дальше)."""
+        connection = headers.get("connection", "").lower()
+        keep = "keep-alive" in connection if version == "HTTP/1.0" else "close" not in connection
+        if target.method == "HEAD" or status in (204, 304):
+            return status < 400, keep
+        detector = FormDetector() if target.form and status == 200 else None
+        chunked = "chunked" in headers.get("transfer-encoding", "").lower()
+        length = headers.get("content-length")
+        length = int(length) if length is not None and not chunked else None
+        if not chunked and length is None:
+            # Тело до закрытия соединения
+            keep = False
+        received = 0
+        async for chunk in _body_chunks(reader, chunked, length):
+            received += len(chunk)
+            if detector and detector.verdict is None and detector.feed(chunk) and (last or not keep):
+                # Ответ ясен, а соединение дальше не нужно - тело можно не дочитывать
+                return detector.verdict == OK, False
+            if received > MAX_DRAIN:
+                keep = False
+                break
+        if target.form:
+            return detector is not None and detector.finish() == OK, keep
+        return status < 400, keep
+
+
+def matrix_table(checks, title="Проверка прокси на сайтах"):
+    """Таблица rich «прокси × цель»: задержка прошедших целей, код или ошибка остальных."""
+    table = Table(title=title)
+    table.add_column("Прокси", style="green")
+    table.add_column("Протокол")
+    names = list(checks[0].results) if checks else []
+    for name in names:
+        table.add_column(name, justify="right")
+    table.add_column("Соединений", justify="right")
+    for check in checks:
+        cells = []
+        for name in names:
+            result = check.results[name]
+            if result.ok:
+                cells.append(f"[green]✅ {result.latency}с")
+            else:
+                cells.append(f"[red]❌ {result.error or result.status}")
+        table.add_row(check.proxy, check.protocol, *cells, str(check.connections))
+    return table
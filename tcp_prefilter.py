@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Быстрая предварительная проверка: принимает ли прокси TCP-соединения.
+
+Большинство бесплатных прокси из списков просто не слушают порт, и полная
+HTTP-проверка тратит на каждый такой адрес целый таймаут и слот семафора.
+ConnectChecker открывает только TCP-соединение (asyncio.open_connection)
+с коротким таймаутом и сразу закрывает его. Таких проверок одновременно
+может быть тысячи: их число ограничено запасом файловых дескрипторов
+процесса (RLIMIT_NOFILE), а не числом слотов HTTP-проверки.
+
+Нехватка дескрипторов или локальных портов у нас самих (RESOURCE_ERRNOS)
+ничего не говорит о прокси: соединение повторяется после паузы, а если
+ресурсов так и не хватило, прокси пропускается дальше без предварительной
+проверки - решит полная.
+"""
+
+import asyncio
+import os
+import time
+
+from probe_controller import RESOURCE_ERRNOS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Ограничение по умолчанию, если лимит дескрипторов узнать нельзя
+DEFAULT_LIMIT = 500
+# Верхняя граница одновременных соединений, даже при большом лимите дескрипторов
+MAX_LIMIT = 4096
+# Повторы соединения при нехватке дескрипторов и пауза перед первым, секунды
+RESOURCE_RETRIES = 3
+RESOURCE_DELAY = 0.1
+
+
+def _open_fds():
+    """Число открытых дескрипторов процесса (0, если узнать нельзя)."""
+    for path in ("/proc/self/fd", "/dev/fd"):
+        try:
+            return len(os.listdir(path))
+        except OSError:
+            continue
+    return 0
+
+
+def fd_budget(reserve=128):
+    """Сколько сокетов можно открыть одновременно, не исчерпав дескрипторы.
+
+    Мягкий лимит RLIMIT_NOFILE при возможности поднимается до жёсткого.
+    reserve дескрипторов остаётся для HTTP-проверок, файлов и баз данных.
+    """
+    if resource is None:
+        return DEFAULT_LIMIT
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = MAX_LIMIT + reserve + _open_fds()
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        target = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return MAX_LIMIT
+    return max(16, min(MAX_LIMIT, soft - _open_fds() - reserve))
+
+
+class ConnectChecker:
+    def __init__(self, timeout=1.5, limit=None, reserve=128):
+        self.timeout = timeout
+        # Число одновременных соединений: явно заданное или по запасу дескрипторов
+        self.limit = limit or fd_budget(reserve)
+        self.semaphore = asyncio.Semaphore(self.limit)
+        self.stats = {"checked": 0, "reachable": 0, "refused": 0, "timeout": 0, "skipped": 0}
+
+    async def check(self, proxy):
+        """Время установки соединения в секундах или None, если порт недоступен.
+
+        Если соединение не удалось открыть из-за нехватки ресурсов у нас,
+        возвращается 0.0: прокси не отсеивается.
+        """
+        host, _, port = proxy.rpartition(":")
+        async with self.semaphore:
+            self.stats["checked"] += 1
+            for attempt in range(RESOURCE_RETRIES + 1):
+                started = time.monotonic()
+                try:
+                    _, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), self.timeout)
+                    break
+                except asyncio.TimeoutError:
+                    self.stats["timeout"] += 1
+                    return None
+                except OSError as e:
+                    if e.errno not in RESOURCE_ERRNOS:
+                        self.stats["refused"] += 1
+                        return None
+                    if attempt < RESOURCE_RETRIES:
+                        # Ждём, пока другие проверки освободят дескрипторы
+                        await asyncio.sleep(RESOURCE_DELAY * 2 ** attempt)
+                except ValueError:
+                    self.stats["refused"] += 1
+                    return None
+            else:
+                self.stats["skipped"] += 1
+                return 0.0
+            elapsed = time.monotonic() - started
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+        self.stats["reachable"] += 1
+        return elapsed
+
+    async def filter(self, proxies):
+        """Доступные прокси в исходном порядке."""
+        proxies = list(proxies)
+        results = await asyncio.gather(*(self.check(proxy) for proxy in proxies))
+        return [proxy for proxy, elapsed in zip(proxies, results) if elapsed is not None]
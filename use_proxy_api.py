@@ -1,351 +1,360 @@
 import aiohttp
+import argparse
 import asyncio
-import json
+import functools
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-import re
 import sys
-from rich.console import Console
+import time
 from rich.table import Table
-from bs4 import BeautifulSoup
 import random
 import requests
-
-console = Console()
+from geo_cache import GeoCache, MISS
+from geo_ranges import CountryRangeIndex
+from geo_scheduler import GeoScheduler
+from vats_prober import VatsProber
+from probe_controller import MAX_CONCURRENCY, PriorityGate, ProbeController
+from target_checks import Target, TargetChecker, default_targets
+from tcp_prefilter import ConnectChecker, fd_budget
+from proxy_protocols import PROTOCOLS, ProtocolDetector
+from probe_shards import check_sharded, shard_count
+from finder_config import FinderConfig
+from proxy_store import ProxyStore
+from metrics import RunMetrics
+from candidate_pool import CandidatePool
+from output import LEVELS, PROGRESS, QUIET, output
+from sources import SOURCES, SourceFetcher
+from source_cache import SourceCache
 
 # Конфигурация
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
+GEO_CACHE_FILE = os.path.join(DATA_DIR, "geo_cache.sqlite3")
+STORE_FILE = os.path.join(DATA_DIR, "proxies.sqlite3")
+PROXY_JSON_FILE = os.path.join(DATA_DIR, "async_ru_proxies.json")
+SOURCE_CACHE_FILE = os.path.join(DATA_DIR, "source_cache.sqlite3")
+
+# Маркер завершения для очередей потокового режима
+_DONE = object()
 
 class RussianProxyFinder:
-    def __init__(self):
-        self.proxies = []
+    def __init__(self, config=None):
+        # Параллельность и таймауты всех фаз (сбор, геолокация, проверка VATS)
+        self.config = config or FinderConfig()
+        # Уникальные кандидаты со списком источников и результатом геолокации
+        self.pool = CandidatePool()
         self.session = None
-        self.russian_proxies = []
+        # Очередь кандидатов потокового режима (None - обычный режим)
+        self._candidates = None
+        self.geo_cache = None
+        # Офлайн-набор диапазонов IP стран (config.geo_db)
+        self.geo_index = None
+        self.geo_scheduler = None
+        self.vats_prober = None
+        # Предварительная проверка TCP-соединения перед проверкой VATS
+        self.connect_checker = None
+        # Определение протокола прокси и его результаты (прокси -> протокол)
+        self.protocol_detector = None
+        self.probe_controller = None
+        self.protocols = {}
+        # Хранилище истории проверок (data/proxies.sqlite3)
+        self.store = None
+        # Время фаз, статистика источников и проверок
+        self.metrics = RunMetrics()
+        # Пул процессов для разбора HTML (None - пул потоков цикла событий)
+        self.parse_executor = None
+        # Описания источников (sources.SOURCES) и их общий загрузчик
+        self.source_registry = list(SOURCES)
+        self.source_fetcher = None
     
     async def initialize(self):
-        self.session = aiohttp.ClientSession()
+        self.session = aiohttp.ClientSession(trace_configs=[self.metrics.scrape_trace_config()])
+        self.geo_scheduler = GeoScheduler(self.session, concurrency=self.config.geo_concurrency,
+                                          timeout=self.config.geo_timeout.client_timeout())
+        await self.start_probing()
+        if self.config.parse_processes:
+            self.parse_executor = ProcessPoolExecutor(self.config.parse_processes)
+        self.source_fetcher = SourceFetcher(
+            self.session,
+            cache=SourceCache(SOURCE_CACHE_FILE) if self.config.use_source_cache else None,
+            timeout=self.config.scrape_timeout.client_timeout(),
+            parse=self.parse,
+            on_parse=self.metrics.record_parse,
+        )
+        if self.config.use_geo_cache:
+            self.geo_cache = GeoCache(GEO_CACHE_FILE)
+        if self.config.use_store:
+            self.store = ProxyStore(STORE_FILE)
+        if self.config.geo_db:
+            # Загрузка большого набора данных не должна блокировать цикл событий
+            loop = asyncio.get_running_loop()
+            self.geo_index = await loop.run_in_executor(None, CountryRangeIndex.from_file, self.config.geo_db)
+            output.info(f"[dim]Загружено {len(self.geo_index)} диапазонов IP из {self.config.geo_db}")
     
+    async def start_probing(self):
+        """Проверка VATS: общая сессия, проверка TCP-соединения и протокола.
+
+        Вызывается из initialize и в каждом процессе probe_shards.
+        """
+        # Предварительная проверка, определение протокола и проверка VATS в потоковом
+        # режиме работают одновременно, поэтому делят один запас дескрипторов:
+        # половина - предварительной проверке, по четверти - остальным
+        budget = fd_budget()
+        limit = self.config.probe_concurrency
+        if self.config.adaptive_probe:
+            # Число проверок и таймауты подбираются по ходу проверки (probe_controller)
+            timeout = self.config.probe_timeout
+            limit = self.config.probe_max_concurrency or max(limit, min(MAX_CONCURRENCY, budget // 4))
+            self.probe_controller = ProbeController(initial=self.config.probe_concurrency, maximum=limit,
+                                                    timeout=timeout.total, connect_timeout=timeout.connect)
+        # Общая сессия с пулом соединений для всех проверок VATS
+        self.vats_prober = await VatsProber(url=self.config.vats_url, limit=limit,
+                                            timeout=self.config.probe_timeout.client_timeout(),
+                                            metrics=self.metrics, controller=self.probe_controller).start()
+        if self.config.prefilter:
+            self.connect_checker = ConnectChecker(timeout=self.config.prefilter_timeout,
+                                                  limit=self.config.prefilter_limit or max(1, budget // 2))
+        if self.config.detect_protocol:
+            self.protocol_detector = ProtocolDetector(self.vats_prober.url, timeout=self.config.detect_timeout,
+                                                      limit=max(len(PROTOCOLS), budget // 4))
+
+    def write_metrics(self):
+        """Отчёт о запуске в JSON и, если задано, в формате Prometheus."""
+        if self.geo_scheduler:
+            self.metrics.extra["geo_scheduler"] = dict(self.geo_scheduler.stats)
+        if self.geo_cache:
+            self.metrics.extra["geo_cache"] = self.geo_cache.stats()
+        if self.source_fetcher:
+            self.metrics.extra["source_cache"] = dict(self.source_fetcher.stats)
+        if self.connect_checker:
+            self.metrics.extra["prefilter"] = dict(self.connect_checker.stats)
+        if self.protocol_detector:
+            self.metrics.extra["protocols"] = dict(self.protocol_detector.stats)
+        if self.probe_controller:
+            self.metrics.extra["probe_control"] = self.probe_controller.report()
+        if self.config.metrics_json:
+            self.metrics.write_json(self.config.metrics_json)
+            output.info(f"[dim]Метрики запуска сохранены в {self.config.metrics_json}")
+        if self.config.metrics_prometheus:
+            self.metrics.write_prometheus(self.config.metrics_prometheus)
+
     async def close(self):
+        self.write_metrics()
+        if self.geo_scheduler:
+            await self.geo_scheduler.close()
+            self.geo_scheduler = None
+        if self.vats_prober:
+            await self.vats_prober.close()
+            self.vats_prober = None
+        if self.probe_controller:
+            await self.probe_controller.close()
         if self.session:
             await self.session.close()
-    
-    async def get_proxies_from_api(self):
-        # Собираем прокси из разных API источников
-        tasks = [
-            self.get_proxies_from_proxylist_download(),
-            self.get_proxies_from_freeproxy_world(),
-            self.get_proxies_from_proxy_list_ru(),
-            self.get_proxies_from_hidemy_name(),
-            self.get_proxies_from_geonode(),
-            self.get_proxies_from_free_proxy_list(),
-            self.get_proxies_from_proxy_list_download(),
-            self.get_proxies_from_proxy_list_org(),
-            # Специализированные российские источники
-            self.get_proxies_from_proxyscrape_ru(),
-            self.get_proxies_from_proxyservers_ru(),
-            self.get_proxies_from_2ip_ru(),
-            self.get_proxies_from_proxy24_net_ru(),
-            # Новые источники прокси
-            self.get_proxies_from_htmlweb_api(),
-            self.get_proxies_from_proxy5_net(),
-            self.get_proxies_from_fineproxy_org(),
-            self.get_proxies_from_proxyfreeonly(),
-            self.get_proxies_from_good_proxies_ru(),
-            self.get_proxies_from_iproyal_ru(),
-        ]
-        
-        await asyncio.gather(*tasks)
-        console.print(f"[bold green]Найдено {len(self.proxies)} прокси из API источников")
+        if self.source_fetcher:
+            if self.source_fetcher.cache:
+                self.source_fetcher.cache.close()
+            self.source_fetcher = None
+        if self.parse_executor:
+            self.parse_executor.shutdown(wait=False, cancel_futures=True)
+            self.parse_executor = None
+        if self.geo_cache:
+            stats = self.geo_cache.stats()
+            output.info(f"[dim]Кэш геолокации: попаданий {stats['hits']}, промахов {stats['misses']}")
+            self.geo_cache.close()
+            self.geo_cache = None
+        if self.store:
+            self.store.close()
+            self.store = None
 
-    async def get_proxies_from_proxylist_download(self):
-        try:
-            url = "https://www.proxy-list.download/api/v1/get?type=http"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    proxy_list = text.strip().split('\r\n')
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от proxy-list.download")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от proxy-list.download: {e}")
-    
-    async def get_proxies_from_freeproxy_world(self):
-        try:
-            url = "https://www.freeproxy.world/"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    rows = soup.select('.table-striped tbody tr')
-                    proxy_list = []
-                    for row in rows:
-                        columns = row.select('td')
-                        if len(columns) >= 2:
-                            ip = columns[0].text.strip()
-                            port = columns[1].text.strip()
-                            country = columns[6].text.strip() if len(columns) > 6 else ""
-                            if country and "Russia" in country or "RU" in country:
-                                proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от freeproxy.world")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от freeproxy.world: {e}")
+    @property
+    def proxies(self):
+        """Все уникальные кандидаты в порядке обнаружения."""
+        return self.pool.all()
 
-    async def get_proxies_from_proxy_list_ru(self):
-        try:
-            url = "https://proxy-list.ru/russian-proxy-list"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    rows = soup.select('.proxy-list-table tr')
-                    proxy_list = []
-                    for row in rows[1:]:  # Пропускаем заголовок
-                        columns = row.select('td')
-                        if len(columns) >= 2:
-                            ip = columns[0].text.strip()
-                            port = columns[1].text.strip()
-                            proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от proxy-list.ru")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от proxy-list.ru: {e}")
-    
-    async def get_proxies_from_hidemy_name(self):
-        try:
-            url = "https://hidemy.name/ru/proxy-list/?country=RU"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-            }
-            async with self.session.get(url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    rows = soup.select('.table_block tbody tr')
-                    proxy_list = []
-                    for row in rows:
-                        columns = row.select('td')
-                        if len(columns) >= 2:
-                            ip = columns[0].text.strip()
-                            port = columns[1].text.strip()
-                            proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от hidemy.name")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от hidemy.name: {e}")
-    
-    async def get_proxies_from_geonode(self):
-        try:
-            url = "https://proxylist.geonode.com/api/proxy-list?limit=500&page=1&country=RU&speed=fast&protocols=http,https,socks4,socks5"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    proxy_list = []
-                    for proxy in data.get('data', []):
-                        ip = proxy.get('ip')
-                        port = proxy.get('port')
-                        if ip and port:
-                            proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    self.russian_proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} российских прокси от geonode.com")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от geonode.com: {e}")
-    
-    async def get_proxies_from_free_proxy_list(self):
-        try:
-            url = "https://free-proxy-list.net/"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    rows = soup.select('#list tbody tr')
-                    proxy_list = []
-                    for row in rows:
-                        columns = row.select('td')
-                        if len(columns) >= 8:
-                            ip = columns[0].text.strip()
-                            port = columns[1].text.strip()
-                            country_code = columns[2].text.strip()
-                            if country_code == "RU":
-                                proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    self.russian_proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} российских прокси от free-proxy-list.net")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от free-proxy-list.net: {e}")
+    @proxies.setter
+    def proxies(self, proxy_list):
+        self.pool.clear()
+        self.pool.add_many(proxy_list)
 
-    async def get_proxies_from_proxy_list_download(self):
-        try:
-            url = "https://www.proxy-list.download/api/v2/get?l=en&t=http&c=Russian+Federation"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    try:
-                        data = json.loads(text)
-                        proxy_list = []
-                        for proxy in data.get('LISTA', []):
-                            ip = proxy.get('IP')
-                            port = proxy.get('PORT')
-                            if ip and port:
-                                proxy_list.append(f"{ip}:{port}")
-                        self.proxies.extend(proxy_list)
-                        self.russian_proxies.extend(proxy_list)
-                        console.print(f"Получено {len(proxy_list)} российских прокси от proxy-list.download v2")
-                    except json.JSONDecodeError:
-                        pass
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от proxy-list.download v2: {e}")
+    @property
+    def russian_proxies(self):
+        """Кандидаты, заявленные источником или подтверждённые как российские."""
+        return self.pool.russian()
+
+    @russian_proxies.setter
+    def russian_proxies(self, proxy_list):
+        self.pool.reset_countries()
+        self.pool.add_many(proxy_list, russian=True)
+
+    def _add_proxies(self, proxy_list, russian=False, source=None):
+        """Регистрация прокси, полученных от источника.
+
+        Строки нормализуются, некорректные отбрасываются, а повторно
+        найденные прокси не становятся новыми кандидатами. В потоковом
+        режиме новые кандидаты сразу передаются в очередь проверки,
+        не дожидаясь завершения остальных источников.
+        """
+        valid, fresh = self.pool.add_many(proxy_list, source, russian)
+        self.metrics.record_yield(source, valid)
+        if self.store:
+            self.store.record_seen(valid, source, "RU" if russian else None)
+        if self._candidates is not None:
+            for proxy in fresh:
+                self._candidates.put_nowait((proxy, russian))
     
-    async def get_proxies_from_proxy_list_org(self):
-        try:
-            url = "https://proxy-list.org/russian/index.php"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    proxy_blocks = soup.select('.table ul li')
-                    proxy_list = []
-                    for block in proxy_blocks:
-                        proxy_text = block.text.strip()
-                        match = re.search(r'(\d+\.\d+\.\d+\.\d+):(\d+)', proxy_text)
-                        if match:
-                            ip, port = match.groups()
-                            proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от proxy-list.org")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от proxy-list.org: {e}")
+    def sources(self, max_age=None):
+        """Источники прокси: имя источника -> корутина его опроса.
 
-    # Новые специализированные источники российских прокси
-    async def get_proxies_from_proxyscrape_ru(self):
-        try:
-            url = "https://api.proxyscrape.com/v2/?request=displayproxies&protocol=http&timeout=10000&country=RU&ssl=all&anonymity=all"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    proxy_list = text.strip().split('\n')
-                    self.proxies.extend(proxy_list)
-                    self.russian_proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от proxyscrape.com (RU)")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от proxyscrape.com: {e}")
+        max_age - возраст кэша ответа, при котором источник не запрашивается
+        (None - интервал обновления источника, 0 - запрашивать всегда).
+        """
+        return {source.name: functools.partial(self.fetch_source, source, max_age) for source in self.source_registry}
 
-    async def get_proxies_from_proxyservers_ru(self):
+    async def fetch_source(self, source, max_age=None):
+        """Загрузка и разбор одного источника из реестра."""
         try:
-            url = "https://ru.proxyservers.pro/proxy/list?country=RU&type=http"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'
-            }
-            async with self.session.get(url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    rows = soup.select('table.proxy-list tbody tr')
-                    proxy_list = []
-                    for row in rows:
-                        columns = row.select('td')
-                        if len(columns) >= 2:
-                            ip = columns[1].text.strip()
-                            port = columns[2].text.strip()
-                            proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от proxyservers.pro (RU)")
+            result = await self.source_fetcher.fetch(source, max_age)
+            if result is None:
+                output.advance("scrape")
+                return
+            self._add_proxies(result.proxies, russian=source.russian, source=source.name)
+            kind = "российских прокси" if source.russian else "прокси"
+            note = "" if result.status == "updated" else " [dim](без изменений)"
+            output.detail(f"Получено {len(result.proxies)} {kind} от {source.title}{note}")
+            output.event("source", name=source.name, proxies=len(result.proxies), status=result.status)
+            output.advance("scrape", proxies=len(result.proxies))
         except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от proxyservers.pro: {e}")
+            output.info(f"[red]Ошибка при получении прокси от {source.title}: {e}")
+            output.event("source", name=source.name, error=str(e))
+            output.advance("scrape", errors=1)
 
-    async def get_proxies_from_2ip_ru(self):
-        try:
-            url = "https://2ip.ru/proxy/?filter_country=RU&filter_port=&filter_type=any&filter_anon=any"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'
-            }
-            async with self.session.get(url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    proxy_table = soup.select_one('.proxy__table')
-                    if proxy_table:
-                        rows = proxy_table.select('tbody tr')
-                        proxy_list = []
-                        for row in rows:
-                            columns = row.select('td')
-                            if len(columns) >= 2:
-                                ip = columns[0].text.strip()
-                                port = columns[1].text.strip()
-                                proxy_list.append(f"{ip}:{port}")
-                        self.proxies.extend(proxy_list)
-                        console.print(f"Получено {len(proxy_list)} прокси от 2ip.ru (RU)")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от 2ip.ru: {e}")
+    async def run_source(self, name, fetch):
+        """Опрос одного источника с учётом его времени и объёма в метриках."""
+        with self.metrics.source(name):
+            await fetch()
+
+    async def parse(self, func, *args, **kwargs):
+        """Разбор ответа источника вне цикла событий, чтобы не задерживать проверки."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.parse_executor, functools.partial(func, *args, **kwargs))
+
+    async def get_proxies_from_api(self):
+        # Собираем прокси из разных API источников
+        # Ограничиваем число одновременно опрашиваемых источников
+        semaphore = asyncio.Semaphore(self.config.scrape_concurrency)
+
+        async def limited(name, fetch):
+            async with semaphore:
+                await self.run_source(name, fetch)
 
-    async def get_proxies_from_proxy24_net_ru(self):
+        sources = self.sources()
+        output.start("scrape", total=len(sources), label="Источники", unit=" ист.")
         try:
-            url = "https://proxy24.net/ru-proxy"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'
-            }
-            async with self.session.get(url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    rows = soup.select('table.table-striped tbody tr')
-                    proxy_list = []
-                    for row in rows:
-                        columns = row.select('td')
-                        if len(columns) >= 2:
-                            ip = columns[0].text.strip()
-                            port = columns[1].text.strip()
-                            country = columns[3].text.strip() if len(columns) > 3 else ""
-                            if "RU" in country:
-                                proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от proxy24.net (RU)")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от proxy24.net: {e}")
+            with self.metrics.phase("scrape"):
+                await asyncio.gather(*(limited(name, fetch) for name, fetch in sources.items()))
+        finally:
+            output.finish("scrape")
+        output.info(f"[bold green]Найдено {len(self.pool)} прокси из API источников")
+        stats = self.pool.stats
+        output.info(f"[dim]Повторов: {stats['duplicates']}, некорректных строк: {stats['invalid']}")
 
-    async def verify_russian_proxies(self):
-        """Проверка, что прокси действительно из России"""
-        proxies_to_check = set(self.proxies) - set(self.russian_proxies)
-        console.print(f"[yellow]Проверка еще {len(proxies_to_check)} прокси на принадлежность к России...")
-        
-        tasks = []
-        for proxy in proxies_to_check:  # Проверяем только те прокси, которые еще не были добавлены в russian_proxies
-            tasks.append(self.check_proxy_country(proxy))
-        
+    async def verify_russian_proxies(self, offline_mode=True):
+        """Проверка, что прокси действительно из России.
+
+        При загруженном наборе диапазонов (geo_db) и offline_mode=True страна
+        определяется локально, а HTTP-сервисы используются только для адресов,
+        которых нет в наборе данных.
+        """
+        with self.metrics.phase("geolocate"):
+            proxies_to_check = self.pool.unverified()
+            output.info(f"[yellow]Проверка еще {len(proxies_to_check)} прокси на принадлежность к России...")
+
+            # Группируем прокси по IP: на одном адресе может быть несколько портов
+            by_ip = {}
+            for proxy in proxies_to_check:
+                by_ip.setdefault(proxy.split(':')[0], []).append(proxy)
+            output.start("geolocate", total=len(by_ip), label="Геолокация", unit=" IP")
+            try:
+                await self._geolocate(by_ip, offline_mode)
+            finally:
+                output.finish("geolocate")
+            output.info(f"[bold green]Найдено {len(self.russian_proxies)} российских прокси")
+
+    def _accept_ip(self, by_ip, ip, country):
+        """Страна всех прокси на адресе ip; продвигает индикатор геолокации."""
+        for proxy in by_ip[ip]:
+            self._accept_country(proxy, country)
+        output.advance("geolocate", ru=int(country == "RU"))
+
+    async def _geolocate(self, by_ip, offline_mode):
+        """Страна каждого IP: офлайн-набор, затем кэш, затем сетевые сервисы."""
+        # Офлайн-режим: классифицируем все IP одним проходом по набору диапазонов
+        offline = {}
+        if offline_mode and self.geo_index:
+            ips = list(by_ip)
+            for ip, country in zip(ips, self.geo_index.lookup_many(ips)):
+                if country:
+                    offline[ip] = country
+                    self._accept_ip(by_ip, ip, country)
+            output.info(f"[dim]Офлайн-геолокация: определено {len(offline)} из {len(ips)} IP")
+
+        # Затем отвечаем из кэша, в сеть идём только за неизвестными IP
+        unresolved = [ip for ip in by_ip if ip not in offline]
+        cached = self.geo_cache.get_many(unresolved) if self.geo_cache else {}
+        for ip, country in cached.items():
+            self._accept_ip(by_ip, ip, country)
+
+        async def resolve(ip):
+            country = await self.lookup_country(ip)
+            if self.geo_cache:
+                self.geo_cache.put(ip, country)
+            self._accept_ip(by_ip, ip, country)
+
+        tasks = [resolve(ip) for ip in unresolved if ip not in cached]
         if tasks:  # Проверяем только если есть прокси для проверки
             await asyncio.gather(*tasks)
-            
-        console.print(f"[bold green]Найдено {len(self.russian_proxies)} российских прокси")
+
+        if self.geo_cache:
+            self.geo_cache.flush()
+            output.info(f"[dim]Кэш геолокации: {len(cached)} IP из кэша, {len(tasks)} запросов в сеть")
+
+    def _accept_country(self, proxy, country):
+        """Запись страны прокси; российские попадают в число кандидатов на проверку VATS."""
+        self.pool.set_country(proxy, country)
+        if self.store and country:
+            self.store.record_country(proxy, country)
+        output.event("geo", proxy=proxy, country=country)
+        if country == "RU":
+            output.detail(f"[green]Прокси {proxy} подтверждён как российский")
+            return True
+        return False
+
+    async def lookup_country(self, ip):
+        """Определение страны IP через планировщик геолокации.
+
+        Запросы объединяются в пакеты ip-api.com/batch, неопределённые адреса
+        проверяются через ipinfo.io. Возвращает код страны или None.
+        """
+        return await self.geo_scheduler.resolve(ip)
 
     async def check_proxy_country(self, proxy):
-        """Проверка страны прокси через ipinfo.io и другие сервисы"""
+        """Проверка страны прокси с использованием кэша геолокации.
+
+        Возвращает True, если прокси подтверждён как российский.
+        """
         ip = proxy.split(':')[0]
-        try:
-            # Проверяем страну через ipinfo.io (без токена - лимит 1000 запросов/день)
-            url = f"https://ipinfo.io/{ip}/json"
-            async with self.session.get(url, timeout=5) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    country = data.get('country')
-                    if country == "RU":
-                        self.russian_proxies.append(proxy)
-                        console.print(f"[green]Прокси {proxy} подтверждён как российский")
-        except Exception:
-            # Запасной вариант - проверка через ip-api.com
-            try:
-                url = f"http://ip-api.com/json/{ip}"
-                async with self.session.get(url, timeout=5) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        country_code = data.get('countryCode')
-                        if country_code == "RU":
-                            self.russian_proxies.append(proxy)
-                            console.print(f"[green]Прокси {proxy} подтверждён как российский (резервный метод)")
-            except Exception as e:
-                pass  # Игнорируем ошибки
+        if self.geo_index:
+            country = self.geo_index.lookup(ip)
+            if country:
+                return self._accept_country(proxy, country)
+        country = self.geo_cache.get(ip) if self.geo_cache else MISS
+        if country is MISS:
+            country = await self.lookup_country(ip)
+            if self.geo_cache:
+                self.geo_cache.put(ip, country)
+        return self._accept_country(proxy, country)
 
     async def save_proxies(self):
         """
@@ -355,243 +364,289 @@ class RussianProxyFinder:
         with open(output_file, "w") as f:
             for proxy in self.russian_proxies:
                 f.write(f"{proxy}\n")
-        console.print(f"[bold]Сохранено {len(self.russian_proxies)} российских прокси в {output_file}")
+        output.info(f"[bold]Сохранено {len(self.russian_proxies)} российских прокси в {output_file}")
 
-    async def check_vats_access(self):
-        """Проверка доступа к VATS через найденные российские прокси"""
-        console.print("[bold]Проверка доступа к VATS через российские прокси...")
-        
-        working_proxies = []
-        vats_url = "http://vats290368.megapbx.ru/"
-        
-        # Будем использовать семафор для ограничения количества одновременных запросов
-        max_concurrent = 20  # Максимальное количество одновременных запросов
-        semaphore = asyncio.Semaphore(max_concurrent)
-        
-        # Характерные признаки формы входа
-        login_indicators = [
-            'input[name="login"]', 'input[name="username"]', 
-            'input[type="password"]', 'form', '<form',
-            'Логин', 'Пароль', 'Вход', 'Авторизация',
-            'Личный кабинет', 'Виртуальной АТС'
-        ]
-        
-        async def check_single_proxy(proxy):
-            """Асинхронная проверка одного прокси"""
-            try:
-                async with semaphore:
-                    # Используем aiohttp вместо requests для асинхронных запросов
-                    proxy_url = f"http://{proxy}"
-                    timeout = aiohttp.ClientTimeout(total=5)  # Снижаем таймаут для ускорения проверки
-                    
-                    async with aiohttp.ClientSession(timeout=timeout) as session:
-                        try:
-                            async with session.get(vats_url, proxy=proxy_url, ssl=False) as response:
-                                if response.status == 200:
-                                    text = await response.text()
-                                    html_content = text.lower()
-                                    
-                                    # Проверяем наличие диагностических данных (информация о запросе), значит это не настоящий интерфейс
-                                    if "remote_addr" in html_content or "request_method" in html_content:
-                                        console.print(f"[yellow]⚠️ Прокси {proxy} возвращает только диагностические данные")
-                                        return None
-                                    
-                                    # Проверяем наличие признаков формы входа
-                                    for indicator in login_indicators:
-                                        if indicator.lower() in html_content:
-                                            console.print(f"[bold green]✅ Прокси {proxy} успешно открывает форму входа VATS!")
-                                            return proxy
-                                    
-                                    console.print(f"[yellow]⚠️ Прокси {proxy} открывает страницу, но форма входа не найдена")
-                                else:
-                                    console.print(f"[red]❌ Прокси {proxy} вернул код {response.status}")
-                        except aiohttp.ClientError as e:
-                            console.print(f"[red]❌ Ошибка при проверке {proxy}: {str(e)[:50]}...")
-            except Exception as e:
-                console.print(f"[red]❌ Ошибка при проверке {proxy}: {str(e)[:50]}...")
+    async def check_single_proxy(self, proxy, semaphore, protocol=None):
+        """Асинхронная проверка одного прокси на доступ к форме входа VATS.
+
+        Возвращает прокси, если форма входа найдена, иначе None.
+        """
+        protocol = protocol or self.protocols.get(proxy, "http")
+        async with semaphore:
+            started = time.monotonic()
+            result = await self.vats_prober.probe(proxy, protocol=protocol)
+            if self.store:
+                self.store.record_probe(proxy, result is not None, time.monotonic() - started, protocol)
+            return result
+
+    def probe_limiter(self):
+        """Ограничение одновременных проверок VATS: ProbeController или фиксированный семафор."""
+        return self.probe_controller or asyncio.Semaphore(self.config.probe_concurrency)
+
+    def protocol_hints(self, proxy):
+        """Протоколы для первой попытки: определённый ранее и заявленные источниками."""
+        hints = [self.protocols[proxy]] if proxy in self.protocols else []
+        registry = {source.name: source for source in self.source_registry}
+        for name in self.pool.sources_of(proxy):
+            source = registry.get(name)
+            for protocol in (source.protocols or ()) if source else ():
+                if protocol not in hints:
+                    hints.append(protocol)
+        return hints
+
+    async def check_candidate(self, proxy, semaphore, hints=None):
+        """Проверка VATS с предварительной проверкой TCP-соединения и протокола.
+
+        Прокси, не принимающий соединения, отсеивается за prefilter_timeout
+        и не занимает слот семафора полной HTTP-проверки. Прокси, не
+        ответивший ни на одно рукопожатие, отсеивается так же. hints -
+        протоколы для первой попытки (по умолчанию - protocol_hints).
+        """
+        if self.connect_checker and await self.connect_checker.check(proxy) is None:
+            self.metrics.record_probe("unreachable")
+            output.event("probe", proxy=proxy, outcome="unreachable")
+            if self.store:
+                self.store.record_probe(proxy, False)
             return None
-        
-        # Запускаем проверку всех прокси
-        console.print(f"[blue]Параллельная проверка {len(self.russian_proxies)} прокси (максимально {max_concurrent} одновременно)...")
-        tasks = [check_single_proxy(proxy) for proxy in self.russian_proxies]
-        results = await asyncio.gather(*tasks)
-        
-        # Фильтруем результаты, удаляя None значения (неработающие прокси)
-        working_proxies = [proxy for proxy in results if proxy is not None]
-        
-        # Сохраняем рабочие прокси в отдельный файл
+        protocol = None
+        if self.protocol_detector:
+            if hints is None:
+                hints = self.protocol_hints(proxy)
+            protocol = await self.protocol_detector.detect(proxy, hints)
+            if protocol is None:
+                self.metrics.record_probe("no_protocol")
+                output.event("probe", proxy=proxy, outcome="no_protocol")
+                if self.store:
+                    self.store.record_probe(proxy, False)
+                return None
+            self.protocols[proxy] = protocol
+        return await self.check_single_proxy(proxy, semaphore, protocol)
+
+    def save_working_proxies(self, working_proxies):
+        """Сохранение рабочих прокси для VATS в отдельный файл"""
+        if self.store:
+            # JSON со статистикой для proxy_browser.py
+            self.store.flush()
+            self.store.export_json(PROXY_JSON_FILE)
         if working_proxies:
             output_file = os.path.join(DATA_DIR, "vats_working_proxies.txt")
             with open(output_file, "w") as f:
                 for proxy in working_proxies:
                     f.write(f"{proxy}\n")
-            console.print(f"[bold green]Сохранено {len(working_proxies)} рабочих прокси для VATS в {output_file}")
+            output.info(f"[bold green]Сохранено {len(working_proxies)} рабочих прокси для VATS в {output_file}")
         else:
-            console.print("[bold red]Не найдено ни одного прокси, который может открыть VATS с формой входа")
+            output.info("[bold red]Не найдено ни одного прокси, который может открыть VATS с формой входа")
 
-        return working_proxies
+    def load_known_good(self):
+        """Прокси, открывавшие VATS при прошлом запуске."""
+        path = os.path.join(DATA_DIR, "vats_working_proxies.txt")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as f:
+            return [line.strip() for line in f if line.strip()]
 
-    # Новые методы для получения прокси
-    async def get_proxies_from_htmlweb_api(self):
-        try:
-            url = "https://htmlweb.ru/analiz/api_proxy.php?country=ru&format=json"
-            async with self.session.get(url, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    proxy_list = []
-                    if isinstance(data, dict) and 'list' in data:
-                        for proxy_data in data['list']:
-                            ip = proxy_data.get('ip')
-                            port = proxy_data.get('port')
-                            if ip and port:
-                                proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от htmlweb.ru API")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от htmlweb.ru API: {e}")
+    def prioritize(self, proxies):
+        """Порядок проверки: сначала рабочие при прошлом запуске, затем остальные.
 
-    async def get_proxies_from_proxy5_net(self):
-        try:
-            url = "https://proxy5.net/ru/free-proxy/russia"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'
-            }
-            async with self.session.get(url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    proxy_list = []
-                    
-                    # Поиск таблицы с прокси
-                    proxy_table = soup.select_one('table.proxy-table')
-                    if proxy_table:
-                        rows = proxy_table.select('tbody tr')
-                        for row in rows:
-                            columns = row.select('td')
-                            if len(columns) >= 2:
-                                ip = columns[0].text.strip()
-                                port = columns[1].text.strip()
-                                proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от proxy5.net")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от proxy5.net: {e}")
+        Дубликаты удаляются. При включённом хранилище известные «мёртвые»
+        прокси пропускаются, а рабочие упорядочиваются по оценке и задержке.
+        """
+        if self.store:
+            return self.store.rank(proxies, dead_after=self.config.dead_after)
+        known_good = {proxy: rank for rank, proxy in enumerate(self.load_known_good())}
+        unique = list(dict.fromkeys(proxies))
+        return sorted(unique, key=lambda proxy: known_good.get(proxy, len(known_good)))
 
-    async def get_proxies_from_fineproxy_org(self):
-        try:
-            url = "https://fineproxy.org/ru/free-proxies/europe/russia/"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'
-            }
-            async with self.session.get(url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    proxy_list = []
-                    
-                    # Поиск таблицы с прокси
-                    proxy_table = soup.select_one('table.proxy__list')
-                    if proxy_table:
-                        rows = proxy_table.select('tbody tr')
-                        for row in rows:
-                            columns = row.select('td')
-                            if len(columns) >= 2:
-                                ip = columns[0].text.strip()
-                                port = columns[1].text.strip()
-                                proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от fineproxy.org")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от fineproxy.org: {e}")
+    async def check_vats_access(self, limit=None):
+        """Проверка доступа к VATS через найденные российские прокси.
 
-    async def get_proxies_from_proxyfreeonly(self):
-        try:
-            url = "https://proxyfreeonly.com/ru/free-proxy-list/russia"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'
-            }
-            async with self.session.get(url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    proxy_list = []
-                    
-                    # Поиск таблицы с прокси
-                    proxy_table = soup.select_one('table.proxy-table')
-                    if proxy_table:
-                        rows = proxy_table.select('tbody tr')
-                        for row in rows:
-                            columns = row.select('td')
-                            if len(columns) >= 2:
-                                ip = columns[0].text.strip()
-                                port = columns[1].text.strip()
-                                proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от proxyfreeonly.com")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от proxyfreeonly.com: {e}")
+        При заданном limit проверка завершается, как только найдено limit
+        рабочих прокси: оставшиеся проверки отменяются, не дожидаясь таймаутов.
+        При config.probe_processes > 1 кандидаты делятся между процессами
+        (probe_shards).
+        """
+        output.info("[bold]Проверка доступа к VATS через российские прокси...")
+        
+        # Ограничение количества одновременных запросов
+        semaphore = self.probe_limiter()
+        candidates = self.prioritize(self.russian_proxies)
+        
+        processes = shard_count(len(candidates), self.config.probe_processes)
+        if processes > 1:
+            with self.metrics.phase("probe"):
+                working_proxies = await check_sharded(self, candidates, processes, limit)
+            self.save_working_proxies(working_proxies)
+            return working_proxies
 
-    async def get_proxies_from_good_proxies_ru(self):
+        # Запускаем проверку всех прокси. До слота проверки VATS каждая задача проходит
+        # проверку TCP и протокола, поэтому слоты выдаются по месту в prioritize(),
+        # а не по порядку завершения этих проверок
+        if self.probe_controller:
+            output.info(f"[blue]Параллельная проверка {len(candidates)} прокси (сначала {self.probe_controller.limit} "
+                        f"одновременно, далее число подбирается по нагрузке)...")
+        else:
+            output.info(f"[blue]Параллельная проверка {len(candidates)} прокси "
+                        f"(максимально {self.config.probe_concurrency} одновременно)...")
+        gate = PriorityGate(semaphore)
+        tasks = [asyncio.ensure_future(self.check_candidate(proxy, gate.slot(rank)))
+                 for rank, proxy in enumerate(candidates)]
+        working_proxies = []
+        output.start("probe", total=len(candidates), label="Проверка VATS")
         try:
-            url = "https://www.good-proxies.ru/free-proxy"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'
-            }
-            async with self.session.get(url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    proxy_list = []
-                    
-                    # Поиск таблицы с прокси
-                    proxy_table = soup.select('table.proxy-list')
-                    for table in proxy_table:
-                        rows = table.select('tbody tr')
-                        for row in rows:
-                            columns = row.select('td')
-                            if len(columns) >= 2:
-                                ip = columns[0].text.strip()
-                                port = columns[1].text.strip()
-                                country = columns[2].text.strip() if len(columns) > 2 else ""
-                                if "RU" in country or "Россия" in country:
-                                    proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от good-proxies.ru")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от good-proxies.ru: {e}")
+            with self.metrics.phase("probe"):
+                for next_done in asyncio.as_completed(tasks):
+                    proxy = await next_done
+                    output.advance("probe", ok=int(proxy is not None))
+                    if proxy is None:
+                        continue
+                    self.metrics.mark_result()
+                    working_proxies.append(proxy)
+                    output.event("working", proxy=proxy, protocol=self.protocols.get(proxy, "http"))
+                    if limit and len(working_proxies) >= limit:
+                        output.info(f"[bold green]Найдено {limit} рабочих прокси, остальные проверки отменены")
+                        break
+        finally:
+            output.finish("probe")
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await gate.close()
+        
+        # Сохраняем рабочие прокси в отдельный файл
+        self.save_working_proxies(working_proxies)
+
+        return working_proxies
+
+    async def check_targets(self, proxies):
+        """Проверка прокси на сайтах config.targets (target_checks): ProxyCheck для каждого прокси.
 
-    async def get_proxies_from_iproyal_ru(self):
+        Все цели проверяются через одно соединение с прокси (или по туннелю
+        на сайт), а не отдельным соединением на каждую цель.
+        """
+        urls = dict.fromkeys(self.config.targets or ())
+        targets = [Target.from_url(url) for url in urls] or default_targets(self.config.vats_url)
+        checker = TargetChecker(targets, timeout=self.config.targets_timeout,
+                                connect_timeout=self.config.probe_timeout.connect or self.config.targets_timeout)
+        output.info(f"[bold]Проверка {len(proxies)} прокси на {len(targets)} сайтах...")
+        checks = await checker.check_many([(proxy, self.protocols.get(proxy, "http")) for proxy in proxies],
+                                          concurrency=self.config.probe_concurrency)
+        self.metrics.extra["targets"] = {
+            **checker.stats,
+            "passed": {target.name: sum(check.passed(target.name) for check in checks) for target in targets},
+        }
+        return checks
+
+    async def stream_working_proxies(self, geo_workers=None, vats_workers=None, limit=None):
+        """Потоковый конвейер: сбор, проверка страны и проверка VATS одновременно.
+
+        Каждый источник передаёт кандидатов в очередь сразу после разбора,
+        обработчики геолокации забирают их немедленно, а подтверждённые
+        российские прокси сразу уходят на проверку VATS. Рабочие прокси
+        выдаются по мере нахождения, не дожидаясь самого медленного источника.
+        При заданном limit конвейер останавливается после limit рабочих прокси.
+        """
+        output.info("[bold]Потоковый поиск: сбор, геолокация и проверка VATS выполняются одновременно...")
+
+        started = time.perf_counter()
+        geo_workers = geo_workers or self.config.geo_workers
+        self._candidates = asyncio.Queue()
+        russian_queue = asyncio.Queue()
+        results = asyncio.Queue()
+        semaphore = asyncio.Semaphore(vats_workers) if vats_workers else self.probe_limiter()
+        seen = set()
+        working_proxies = []
+
+        async def scrape():
+            try:
+                await self.get_proxies_from_api()
+            finally:
+                for _ in range(geo_workers):
+                    self._candidates.put_nowait(_DONE)
+
+        async def geolocate():
+            while True:
+                item = await self._candidates.get()
+                if item is _DONE:
+                    return
+                proxy, russian = item
+                # seen - только уже подтверждённые прокси: прокси, сначала найденный
+                # источником без фильтра страны, пула передаёт в очередь ещё раз, когда
+                # его заявит российский источник (как pool.russian() в обычном режиме)
+                if proxy in seen:
+                    continue
+                if not russian and not await self.check_proxy_country(proxy):
+                    continue
+                if proxy in seen:
+                    # Пока шла геолокация, прокси заявил российский источник
+                    continue
+                seen.add(proxy)
+                russian_queue.put_nowait(proxy)
+
+        async def probe(proxy):
+            ok = await self.check_candidate(proxy, semaphore)
+            output.advance("stream", ok=int(ok is not None))
+            if ok:
+                results.put_nowait(proxy)
+
+        async def geolocate_stage():
+            try:
+                await asyncio.gather(*(geolocate() for _ in range(geo_workers)))
+            finally:
+                russian_queue.put_nowait(_DONE)
+
+        async def probe_stage():
+            # Проверка каждого кандидата - отдельная задача: проверки соединения
+            # идут массово, а полные проверки VATS ограничены семафором
+            pending = set()
+            try:
+                while True:
+                    proxy = await russian_queue.get()
+                    if proxy is _DONE:
+                        break
+                    task = asyncio.ensure_future(probe(proxy))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                await asyncio.gather(*pending)
+            finally:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                results.put_nowait(_DONE)
+
+        # Число кандидатов заранее неизвестно - индикатор без общего числа
+        output.start("stream", label="Проверка VATS")
+        tasks = [
+            asyncio.create_task(scrape()),
+            asyncio.create_task(geolocate_stage()),
+            asyncio.create_task(probe_stage()),
+        ]
         try:
-            url = "https://iproyal.com/ru/free-proxies/russia-ru/"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36'
-            }
-            async with self.session.get(url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    text = await response.text()
-                    soup = BeautifulSoup(text, 'html.parser')
-                    proxy_list = []
-                    
-                    # Поиск таблицы с прокси
-                    proxy_table = soup.select_one('table.proxies-table')
-                    if proxy_table:
-                        rows = proxy_table.select('tbody tr')
-                        for row in rows:
-                            columns = row.select('td')
-                            if len(columns) >= 2:
-                                ip = columns[0].text.strip()
-                                port = columns[1].text.strip()
-                                proxy_list.append(f"{ip}:{port}")
-                    self.proxies.extend(proxy_list)
-                    console.print(f"Получено {len(proxy_list)} прокси от iproyal.com")
-        except Exception as e:
-            console.print(f"[red]Ошибка при получении прокси от iproyal.com: {e}")
+            while True:
+                proxy = await results.get()
+                if proxy is _DONE:
+                    break
+                self.metrics.mark_result()
+                working_proxies.append(proxy)
+                output.event("working", proxy=proxy, protocol=self.protocols.get(proxy, "http"))
+                yield proxy
+                if limit and len(working_proxies) >= limit:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._candidates = None
+            output.finish("stream")
+            self.metrics.phases["stream"] = time.perf_counter() - started
+            self.save_working_proxies(working_proxies)
+
 
-async def main():
+async def main(level=PROGRESS, events=None):
+    output.configure(level, events)
     finder = RussianProxyFinder()
     try:
         await finder.initialize()
-        console.print("[bold]Поиск российских прокси...")
+        output.info("[bold]Поиск российских прокси...")
         await finder.get_proxies_from_api()
         await finder.verify_russian_proxies()
         await finder.save_proxies()
@@ -599,7 +654,7 @@ async def main():
         if finder.russian_proxies:
             working_proxies = await finder.check_vats_access()
             if working_proxies:
-                console.print("\n[bold]Рабочие прокси для доступа к VATS:")
+                output.result("\n[bold]Рабочие прокси для доступа к VATS:")
                 table = Table(show_header=True, header_style="bold")
                 table.add_column("№", style="dim")
                 table.add_column("Прокси")
@@ -607,20 +662,27 @@ async def main():
                 for i, proxy in enumerate(working_proxies, 1):
                     table.add_row(str(i), proxy)
                 
-                console.print(table)
-                console.print("\n[bold]Используйте эти прокси для доступа к VATS через браузер.")
+                output.result(table)
+                output.info("\n[bold]Используйте эти прокси для доступа к VATS через браузер.")
             else:
-                console.print("\n[bold yellow]Российские прокси найдены, но ни один не может открыть VATS с полным интерфейсом")
+                output.result("\n[bold yellow]Российские прокси найдены, но ни один не может открыть VATS с полным интерфейсом")
         else:
-            console.print("[bold red]Не найдено ни одного российского прокси")
+            output.result("[bold red]Не найдено ни одного российского прокси")
             
     except Exception as e:
-        console.print(f"[bold red]Ошибка: {e}")
+        output.result(f"[bold red]Ошибка: {e}")
     finally:
         await finder.close()
+        output.close()
 
 # Запуск программы
 if __name__ == "__main__":
-    print("\n🔍 Поиск российских прокси для доступа к VATS...\n")
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Поиск российских прокси для доступа к VATS")
+    parser.add_argument("--output", choices=LEVELS, default=PROGRESS,
+                        help="Подробность вывода: quiet - только итог, progress - индикаторы, verbose - каждый прокси")
+    parser.add_argument("--events", metavar="PATH",
+                        help="Записывать события (источники, геолокация, проверки) в файл JSON Lines")
+    args = parser.parse_args()
+    if args.output != QUIET:
+        print("\n🔍 Поиск российских прокси для доступа к VATS...\n")
+    asyncio.run(main(args.output, args.events))
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Проверка доступа к форме входа VATS через прокси.
+
+Все проверки выполняются через одну общую сессию aiohttp с настроенным
+TCPConnector: пул соединений, кэш DNS и SSL-контекст создаются один раз,
+а адрес прокси и таймаут передаются в каждый отдельный запрос.
+Прокси CONNECT и SOCKS проверяются запросом через туннель (proxy_protocols).
+Тело ответа читается фрагментами и разбирается FormDetector: чтение
+прекращается, как только понятно, есть ли на странице форма входа.
+Если задан ProbeController, таймауты проверок берутся из него, а исход
+каждой проверки передаётся ему.
+"""
+
+import asyncio
+import ssl
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from form_detector import DIAGNOSTIC, OK, FormDetector
+from output import output
+from proxy_protocols import HandshakeError, open_tunnel, resolve_ipv4
+
+VATS_URL = "http://vats290368.megapbx.ru/"
+
+# Сколько байт читать из туннеля за один вызов
+TUNNEL_CHUNK = 16 * 1024
+
+
+def build_ssl_context():
+    """SSL-контекст без проверки сертификата (как ssl=False), создаётся один раз."""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class VatsProber:
+    def __init__(self, url=VATS_URL, limit=20, limit_per_host=0, timeout=5, dns_ttl=300, metrics=None,
+                 controller=None):
+        self.url = url
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        # Число секунд (общий таймаут) или готовый aiohttp.ClientTimeout
+        self.timeout = timeout if isinstance(timeout, aiohttp.ClientTimeout) else aiohttp.ClientTimeout(total=timeout)
+        self.dns_ttl = dns_ttl
+        # RunMetrics: время соединения, до первого байта и исходы проверок
+        self.metrics = metrics
+        # ProbeController: получает исходы проверок и задаёт текущие таймауты
+        self.controller = controller
+        self.ssl_context = build_ssl_context()
+        self.session = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            ssl=self.ssl_context,
+            # Каждый прокси проверяется один раз: держать простаивающие
+            # соединения открытыми значит напрасно расходовать дескрипторы
+            force_close=True,
+        )
+        trace_configs = [self.metrics.probe_trace_config()] if self.metrics else []
+        if self.controller:
+            trace_configs.append(self.controller.trace_config())
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout,
+                                             trace_configs=trace_configs or None)
+        return self
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _record(self, proxy, protocol, outcome, started, error=None):
+        elapsed = time.perf_counter() - started
+        if self.metrics:
+            self.metrics.record_probe(outcome, elapsed, error)
+        if self.controller:
+            self.controller.observe(outcome, elapsed, error)
+        output.event("probe", proxy=proxy, protocol=protocol or "http", outcome=outcome, elapsed=round(elapsed, 3),
+                     error=type(error).__name__ if error is not None else None)
+
+    async def probe(self, proxy, timeout=None, protocol="http"):
+        """Проверка одного прокси. Возвращает прокси при найденной форме входа, иначе None.
+
+        protocol - протокол прокси (см. proxy_protocols): http проверяется
+        через сессию aiohttp, connect/socks4/socks5 - запросом через туннель.
+        """
+        timeout = timeout or self.current_timeout()
+        if protocol not in (None, "http"):
+            return await self._probe_tunnel(proxy, protocol, timeout)
+        if self.session is None:
+            await self.start()
+        started = time.perf_counter()
+        try:
+            async with self.session.get(self.url, proxy=f"http://{proxy}",
+                                        timeout=timeout) as response:
+                if response.status != 200:
+                    output.detail(f"[red]❌ Прокси {proxy} вернул код {response.status}")
+                    self._record(proxy, protocol, f"http_{response.status}", started)
+                    return None
+                detector = FormDetector()
+                # iter_any отдаёт данные по мере поступления, не дожидаясь полного фрагмента
+                async for chunk in response.content.iter_any():
+                    if detector.feed(chunk):
+                        break
+                # Выход из async with до конца тела закрывает соединение (force_close)
+                early = detector.verdict is not None and not response.content.at_eof()
+        except Exception as e:
+            output.detail(f"[red]❌ Ошибка при проверке {proxy}: {type(e).__name__}: {str(e)[:50]}...")
+            self._record(proxy, protocol, "error", started, e)
+            return None
+        return self._evaluate(proxy, protocol, detector, early, started)
+
+    def current_timeout(self):
+        """Таймаут очередной проверки: подобранный ProbeController или заданный."""
+        return self.controller.timeout if self.controller else self.timeout
+
+    async def _tunnel_get(self, proxy, protocol, connect_timeout=None):
+        """GET целевой страницы через туннель; (код ответа, FormDetector, чтение прервано досрочно)."""
+        parts = urlsplit(self.url)
+        host = parts.hostname
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        if protocol == "socks4":
+            # Адрес сайта определяется до замера времени соединения
+            await resolve_ipv4(host, port)
+        started = time.perf_counter()
+        reader, writer = await asyncio.wait_for(open_tunnel(proxy, protocol, host, port), connect_timeout)
+        if self.controller:
+            self.controller.observe_connect(time.perf_counter() - started)
+        try:
+            if parts.scheme == "https":
+                await writer.start_tls(self.ssl_context, server_hostname=host)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            # HTTP/1.0: сервер не использует chunked и закрывает соединение сам
+            writer.write(f"GET {path} HTTP/1.0\r\nHost: {host}\r\n"
+                         f"User-Agent: Mozilla/5.0\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            head = await reader.readuntil(b"\r\n\r\n")
+            status_line = head.split(b"\r\n", 1)[0].split()
+            if len(status_line) < 2 or not status_line[0].startswith(b"HTTP/"):
+                raise HandshakeError("ответ не похож на HTTP")
+            status = int(status_line[1])
+            if status != 200:
+                return status, None, False
+            detector = FormDetector()
+            while True:
+                chunk = await reader.read(TUNNEL_CHUNK)
+                if not chunk:
+                    return status, detector, False
+                if detector.feed(chunk):
+                    return status, detector, not reader.at_eof()
+        finally:
+            writer.close()
+
+    async def _probe_tunnel(self, proxy, protocol, timeout=None):
+        started = time.perf_counter()
+        if not isinstance(timeout, aiohttp.ClientTimeout):
+            timeout = aiohttp.ClientTimeout(total=timeout or self.timeout.total)
+        try:
+            status, detector, early = await asyncio.wait_for(
+                self._tunnel_get(proxy, protocol, timeout.sock_connect), timeout.total)
+        except Exception as e:
+            output.detail(f"[red]❌ Ошибка при проверке {proxy} ({protocol}): {type(e).__name__}: {str(e)[:50]}...")
+            self._record(proxy, protocol, "error", started, e)
+            return None
+        if status != 200:
+            output.detail(f"[red]❌ Прокси {proxy} ({protocol}) вернул код {status}")
+            self._record(proxy, protocol, f"http_{status}", started)
+            return None
+        return self._evaluate(proxy, protocol, detector, early, started)
+
+    def _evaluate(self, proxy, protocol, detector, early, started):
+        """Ответ FormDetector по странице, полученной через прокси: форма входа или нет."""
+        verdict = detector.finish()
+        if self.metrics:
+            self.metrics.record_body(detector.received, early)
+        # Диагностические данные (информация о запросе) - значит это не настоящий интерфейс
+        if verdict == DIAGNOSTIC:
+            output.detail(f"[yellow]⚠️ Прокси {proxy} возвращает только диагностические данные")
+            self._record(proxy, protocol, "diagnostic", started)
+            return None
+
+        if verdict == OK:
+            output.detail(f"[bold green]✅ Прокси {proxy} успешно открывает форму входа VATS!")
+            self._record(proxy, protocol, "ok", started)
+            return proxy
+
+        output.detail(f"[yellow]⚠️ Прокси {proxy} открывает страницу, но форма входа не найдена")
+        self._record(proxy, protocol, "no_form", started)
+        return None